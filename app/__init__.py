@@ -0,0 +1,4 @@
+import time
+
+# When the app package started importing, to measure how long importing the app takes
+import_started = time.perf_counter()
@@ -1,16 +1,30 @@
-from fastapi import HTTPException, Security, status
+from math import ceil
+
+from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 from app.config import settings
+from app.ddgs import RateLimitedError, get_ddgs
+from app.ddgs.tenants import ANONYMOUS, current_tenant
+from app.ddgs.tracing import span
+from app.keystore import ApiKey, KeyStore
 
 security = HTTPBearer(auto_error=False)
 
+key_store = KeyStore(settings.api_keys or [], path=settings.api_keys_file, limits=settings.tenant_limits, reload_interval=settings.api_keys_reload_interval)
+
 
-async def verify_token(credentials: HTTPAuthorizationCredentials | None = Security(security)) -> str | None:
+async def verify_token(credentials: HTTPAuthorizationCredentials | None = Security(security)) -> ApiKey | None:
     """Verify Bearer token against configured API keys"""
-    if not settings.api_keys:  # If no API keys configured, allow all requests
+    if not key_store.enabled:  # If no API keys configured, allow all requests
         return None
 
+    with span("auth"):
+        return authenticate(credentials)
+
+
+def authenticate(credentials: HTTPAuthorizationCredentials | None) -> ApiKey:
+    """Look up the API key of a Bearer token, 401 when it is missing or unknown"""
     if credentials is None or not credentials.credentials:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -18,12 +32,53 @@ async def verify_token(credentials: HTTPAuthorizationCredentials | None = Securi
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    token = credentials.credentials
-    if token not in settings.api_keys:
+    api_key = key_store.lookup(credentials.credentials)
+    if api_key is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    return token
+    return api_key
+
+
+async def identify_tenant(api_key: ApiKey | None = Depends(verify_token)) -> str:
+    """Attribute the request to its API key's tenant without counting it against the tenant's rate limit and quota"""
+    tenant = api_key.tenant if api_key is not None else ANONYMOUS
+    current_tenant.set(tenant)
+    return tenant
+
+
+async def limit_tenant(api_key: ApiKey | None = Depends(verify_token)) -> str:
+    """Attribute the request to its API key's tenant and apply the tenant's rate limit and quota"""
+    tenant = await identify_tenant(api_key)
+    try:
+        get_ddgs().tenants.check(tenant, api_key.limits if api_key is not None else None)
+    except RateLimitedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(ceil(e.retry_after))}) from e
+    return tenant
+
+
+def require_api_key(feature: str):
+    """Dependency admitting any valid API key, and no one when authentication is disabled, for routes keeping state per tenant"""
+
+    async def check_api_key(api_key: ApiKey | None = Depends(verify_token)) -> ApiKey:
+        if api_key is None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"{feature} need API keys to be configured")
+        return api_key
+
+    return check_api_key
+
+
+def require_scope(scope: str):
+    """Dependency admitting only API keys holding `scope`, and no one when authentication is disabled"""
+
+    async def check_scope(api_key: ApiKey | None = Depends(verify_token)) -> ApiKey:
+        if api_key is None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"The {scope} scope needs API keys to be configured")
+        if scope not in api_key.scopes:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"API key lacks the {scope} scope")
+        return api_key
+
+    return check_scope
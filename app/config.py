@@ -8,7 +8,12 @@ class Settings(BaseSettings):
 
     # DDGS initialization parameters
     ddgs_proxy: str | None = None
+    ddgs_proxies: list[str] = []
     ddgs_timeout: int | None = None
+    ddgs_verify: bool = True
+
+    # Consecutive failures after which a pooled DDGS client is replaced
+    ddgs_max_failures: int = 5
 
     # Default search parameters
     default_region: str | None = None
@@ -22,16 +27,185 @@ class Settings(BaseSettings):
 
     # API keys
     api_keys: list[str] | str = ""
+    # JSON file of further API keys with optional tenant, scopes and limits, re-read when it changes
+    api_keys_file: str | None = None
+    api_keys_reload_interval: float = 5
 
     # API base
     api_prefix: str = ""
 
     # MCP
     mcp_enable_tools: list[str] = ["text"]
+    # Approximate token budget of MCP search tool results when a call sets none, snippets are shortened to fit, 0 disables
+    mcp_max_tokens: int = 0
+
+    # Characters per token assumed when a compact output budget is given in tokens
+    compact_chars_per_token: float = 4
+
+    # Serialize search responses straight to JSON bytes instead of revalidating them against the response model
+    fast_response: bool = True
+
+    # Compress response bodies of at least compression_min_size bytes with the first of these encodings the client accepts,
+    # br and zstd need the compression extra
+    compression_enabled: bool = True
+    compression_min_size: int = 1024
+    compression_encodings: list[str] = ["zstd", "br", "gzip"]
+
+    # Warm-up after startup, /healthz/ready reports ready once it finished or warmup_timeout seconds passed. It loads the MCP server,
+    # opens warmup_connections connections to each engine of warmup_categories (async engine only) and runs the warmup_queries text searches upstream.
+    # Without warm-up, the MCP server is loaded by its first request
+    warmup_enabled: bool = True
+    warmup_categories: list[str] = ["text"]
+    warmup_connections: int = 2
+    warmup_queries: list[str] = []
+    warmup_timeout: float = 30
+
+    # Expose Prometheus metrics at /metrics
+    metrics_enabled: bool = True
+
+    # Per-request span tracing, reported in a Server-Timing response header unless tracing_server_timing is off.
+    # tracing_exporter is none, otlp (OTLP/JSON posted to tracing_otlp_endpoint) or file (OTLP/JSON lines appended to tracing_file),
+    # exporting tracing_sample_rate of the traces, or those a traceparent header marks sampled.
+    # Both are off by default, as Server-Timing shows every caller how long each upstream engine took
+    tracing_enabled: bool = False
+    tracing_server_timing: bool = False
+    tracing_exporter: str = "none"
+    tracing_otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    tracing_file: str = "ddgs-traces.jsonl"
+    tracing_sample_rate: float = 1.0
+    tracing_service_name: str = "ddgs-api"
+    tracing_export_interval: float = 5
+    tracing_max_queue: int = 2048
+
+    # Sampling profiler of all threads at /admin/profile, for at most profiler_max_duration seconds per run
+    profiler_enabled: bool = False
+    profiler_max_duration: float = 60
+
+    # Worker processes serving the app, WEB_CONCURRENCY is also the default worker count of uvicorn and gunicorn
+    web_concurrency: int = 1
 
     # Thread pool configuration for blocking I/O operations
     executor_max_workers: int = 100
 
+    # Search engine: "thread" runs DDGS in the thread pool, the experimental "async" issues the requests of engines that only
+    # make one on the event loop, at most http_max_connections at once. It drives ddgs internals, so it needs the pinned ddgs version
+    search_engine: str = "thread"
+    http_max_connections: int = 1000
+    # HTTP/2 for page fetches when the http2 extra is installed
+    http2: bool = True
+
+    # Per-engine admission control: AIMD concurrency limit with a bounded wait queue, and a circuit breaker
+    admission_enabled: bool = True
+    admission_initial_limit: int = 20
+    admission_min_limit: int = 2
+    admission_max_limit: int = 200
+    admission_latency_tolerance: float = 2.0
+    admission_max_queue: int = 100
+    admission_queue_timeout: float = 2.0
+    breaker_failure_rate: float = 0.5
+    breaker_window: int = 20
+    breaker_min_requests: int = 10
+    breaker_reset_timeout: float = 30
+
+    # Per-API-key request rate limit (token bucket, requests per second, 0 disables) and quota (requests per period, 0 disables)
+    tenant_rate: float = 0
+    tenant_burst: int = 20
+    tenant_quota: int = 0
+    tenant_quota_period: int = 86400
+    # Per-API-key overrides of rate, burst, quota, quota_period and fair scheduling weight, keyed by API key from api_keys
+    tenant_limits: dict[str, dict[str, float]] = {}
+
+    # Fair scheduling of upstream searches across API keys (deficit round robin), 0 concurrency sizes it to the search engine
+    fair_scheduling: bool = True
+    fair_max_concurrency: int = 0
+    fair_max_queue: int = 1000
+    fair_queue_timeout: float = 10
+
+    # Result deduplication by normalized URL and by SimHash of title and snippet, within this many differing bits,
+    # optionally merging missing fields and longer snippets from duplicates into the kept result
+    dedup_enabled: bool = True
+    dedup_max_distance: int = 3
+    dedup_merge: bool = True
+
+    # Cursor pagination: results fetched per upstream window, most results reachable, buffer lifetime and count.
+    # Cursors are signed with pagination_secret, which is required with several workers so they accept each other's cursors.
+    # A single worker without it uses a random secret, so its cursors stop working after a restart
+    pagination_secret: str = ""
+    pagination_window: int = 50
+    pagination_max_results: int = 200
+    pagination_ttl: int = 600
+    pagination_max_buffers: int = 1000
+
+    # Multi-backend fan-out: hedge a backend's request once it is slower than this latency percentile,
+    # or than fanout_hedge_delay seconds until enough latencies are recorded
+    fanout_max_backends: int = 4
+    fanout_hedge_percentile: float = 90
+    fanout_hedge_delay: float = 1.0
+    fanout_max_hedges: int = 1
+
+    # Deadline of a search request in seconds, unless set by an X-Request-Timeout header capped at request_max_timeout, 0 disables.
+    # Upstream attempts still running at the deadline end by ddgs_timeout (at the deadline with the async engine), and work for requests whose client disconnected is cancelled
+    request_timeout: float = 30
+    request_max_timeout: float = 120
+
+    # Batch search limits
+    batch_max_requests: int = 100
+    batch_max_concurrency: int = 10
+    batch_timeout: float = 30
+
+    # Search and fetch: the top text results' pages are fetched concurrently, at most fetch_max_bytes each, and their readable text
+    # of up to fetch_max_chars returned. Pages are cached for fetch_cache_ttl seconds, then revalidated with their ETag or Last-Modified date.
+    # Pages on private, loopback or link-local addresses are only fetched with fetch_allow_private.
+    # Off by default, as it makes the server request any URL a search returns
+    fetch_enabled: bool = False
+    fetch_max_pages: int = 10
+    fetch_timeout: float = 10
+    fetch_max_connections: int = 100
+    fetch_max_per_host: int = 4
+    fetch_max_bytes: int = 2 * 1024 * 1024
+    fetch_max_chars: int = 20000
+    fetch_cache_ttl: float = 600
+    fetch_cache_max_entries: int = 1000
+    fetch_cache_max_bytes: int = 64 * 1024 * 1024
+    fetch_allow_private: bool = False
+
+    # Bulk search jobs, queued in a SQLite file and run in the background by jobs_concurrency workers, resuming after a restart.
+    # Failed searches are tried up to jobs_max_attempts times, finished jobs are removed after jobs_retention seconds
+    jobs_enabled: bool = False
+    jobs_path: str = "ddgs-jobs.sqlite3"
+    jobs_concurrency: int = 10
+    jobs_max_queries: int = 100000
+    jobs_max_attempts: int = 3
+    jobs_retention: float = 7 * 86400
+
+    # Search result cache, backend is one of: memory, sqlite, redis
+    cache_enabled: bool = True
+    cache_backend: str = "memory"
+    cache_sqlite_path: str = "ddgs-cache.sqlite3"
+    cache_redis_url: str = "redis://localhost:6379/0"
+    cache_redis_prefix: str = "ddgs-api:"
+    cache_max_entries: int = 10000
+    cache_max_bytes: int = 64 * 1024 * 1024
+    cache_ttl: dict[str, int] = {"text": 600, "images": 3600, "videos": 3600, "news": 120, "books": 86400}
+
+    # Seconds past the TTL an expired entry is still served while it is refreshed in the background, 0 disables
+    cache_stale_ttl: int = 3600
+
+    # Refresh the most popular searches in the background before they expire
+    cache_refresh_enabled: bool = False
+    cache_refresh_top_k: int = 100
+    cache_refresh_interval: float = 30
+
+    # Local full-text index of text and news results harvested from upstream, answering searches when upstream fails.
+    # Searches are also answered locally without asking upstream when enough results are younger than local_index_fresh_age seconds, 0 disables.
+    # Fallback results are at most local_index_fallback_age seconds old, 0 for any age
+    local_index_enabled: bool = False
+    local_index_path: str = "ddgs-index.sqlite3"
+    local_index_fresh_age: dict[str, float] = {"text": 0, "news": 0}
+    local_index_fallback_age: dict[str, float] = {"text": 30 * 86400, "news": 2 * 86400}
+    local_index_max_docs: int = 100000
+    local_index_max_bytes: int = 256 * 1024 * 1024
+
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
     def __init__(self, **kwargs):
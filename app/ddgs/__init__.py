@@ -1,15 +1,60 @@
+from .batch import *
+from .compact import *
 from .ddgs import *
+from .deadline import *
+from .fetcher import *
+from .jobs import *
+from .limiter import *
+from .local_index import *
 from .models import *
+from .pagination import *
+from .tenants import *
 
 __all__ = [
     # ddgs
     "get_ddgs",
     "initialize_ddgs",
     "cleanup_ddgs",
+    "ITEM_ADAPTERS",
+    "PAGE_ADAPTERS",
+    # batch
+    "run_batch",
+    "batch_results_adapter",
+    # compact
+    "Compactor",
+    "CompactFormat",
+    "InvalidFieldsError",
+    "Layout",
+    "compact_format",
+    "check_fields",
+    # deadline
+    "DeadlineExceededError",
+    # fetcher
+    "PageFetcher",
+    "FetchError",
+    # jobs
+    "JobRunner",
+    "JobStore",
+    # limiter
+    "OverloadedError",
+    # local index
+    "LocalIndex",
+    "LocalIndexError",
+    # tenants
+    "RateLimitedError",
+    # pagination
+    "InvalidCursorError",
     # models
     "TextSearchItem",
     "ImagesSearchItem",
     "VideosSearchItem",
     "NewsSearchItem",
     "BooksSearchItem",
+    "BatchSearchResult",
+    "SearchPage",
+    "PageContent",
+    "FetchedTextItem",
+    "JobStatus",
+    "JobResult",
+    "JobResultsPage",
 ]
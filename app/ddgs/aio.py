@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+from collections import Counter
+from concurrent.futures import Executor
+from contextlib import aclosing
+from typing import Any
+from urllib.parse import urlsplit
+
+import primp
+from ddgs.engines import ENGINES
+from ddgs.exceptions import DDGSException, TimeoutException
+from ddgs.similarity import SimpleFilterRanker
+
+from . import metrics, tracing
+from .deadline import DeadlineExceededError, time_left
+from .dedup import result_key
+from .limiter import AdmissionController
+from .pool import DDGSClientPool
+from .tenants import FairScheduler
+from .upstream import ThreadSearchClient, raise_no_results
+
+# Engines that only make their one search request in ddgs 9.16, so it can be issued on the event loop.
+# The others (tokens, cookies, follow-up requests) run on the thread engine's `DDGS` clients.
+NATIVE_ENGINES: dict[str, set[str]] = {
+    "text": {"duckduckgo", "grokipedia", "yahoo"},
+    "images": {"bing"},
+    "news": {"bing", "yahoo"},
+    "videos": set(),
+    "books": {"annasarchive"},
+}
+
+
+def origin(url: str) -> str:
+    """Scheme and host of a URL"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/"
+
+
+class AsyncSearchClient(ThreadSearchClient):
+    """Experimental: engines of `NATIVE_ENGINES` searched from the event loop with async clients impersonating browsers like `DDGS`'s own
+
+    It drives the `ddgs` engine classes directly instead of through `DDGS`, relying on their payload building and parsing,
+    so it is tied to the pinned `ddgs` version. Results of all engines are merged and ranked like `DDGS` does.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        pool: DDGSClientPool,
+        admission: AdmissionController | None = None,
+        scheduler: FairScheduler | None = None,
+        dedup: bool = True,
+        dedup_max_distance: int = 3,
+        dedup_merge: bool = True,
+        max_connections: int = 1000,
+    ):
+        super().__init__(executor, pool, admission=admission, scheduler=scheduler, dedup=dedup, dedup_max_distance=dedup_max_distance, dedup_merge=dedup_merge)
+        # One client per configured proxy, used round-robin
+        self.clients = [
+            primp.AsyncClient(
+                proxy=proxy,
+                timeout=pool.timeout,
+                impersonate="random",
+                impersonate_os="random",
+                verify=pool.verify if isinstance(pool.verify, bool) else True,
+                ca_cert_file=pool.verify if isinstance(pool.verify, str) else None,
+            )
+            for proxy in pool.proxies
+        ]
+        self._client_cycle = itertools.cycle(self.clients)
+        # Upstream requests in flight at once
+        self._connections = asyncio.Semaphore(max_connections)
+
+    async def _run_backend(self, category: str, query: str, backend: str, **kwargs: Any) -> list[dict[str, Any]]:
+        """Search one engine on the event loop, or in the executor when it is not a native engine"""
+        engine_class = ENGINES[category].get(backend)
+        if engine_class is None or backend not in NATIVE_ENGINES.get(category, ()):
+            return await super()._run_backend(category, query, backend, **kwargs)
+
+        kwargs.pop("max_results", None)
+        params = {"region": "us-en", "safesearch": "moderate", "timelimit": None, "page": 1, **kwargs}
+        # Payload building and parsing keep per-search state on the instance, so use a fresh one without its sync HTTP client
+        engine = engine_class.__new__(engine_class)
+        engine.results = []
+        payload = engine.build_payload(query=query, **params)
+        headers = dict(engine_class.headers_update) or None
+        client = next(self._client_cycle)
+        # The attempt gets the configured timeout or what is left of the request deadline, whichever is shorter
+        left = time_left()
+        cut = left is not None and (self.pool.timeout is None or left < self.pool.timeout)
+        timeout = max(left, 0.001) if cut else self.pool.timeout
+        with (
+            metrics.upstream_seconds.time(category=category, backend=backend),
+            tracing.span("upstream", backend=backend),
+        ):
+            try:
+                async with self._connections:
+                    if engine.search_method == "GET":
+                        resp = await client.request(engine.search_method, engine.search_url, params=payload, headers=headers, timeout=timeout)
+                    else:
+                        resp = await client.request(engine.search_method, engine.search_url, data=payload, headers=headers, timeout=timeout)
+            except primp.TimeoutError as e:
+                if cut:
+                    raise DeadlineExceededError() from e
+                raise TimeoutException(e) from e
+            except primp.PrimpError as e:
+                raise DDGSException(f"{type(e).__name__}: {e!r}") from e
+
+            # Surface rate limiting and server errors so admission control can back off
+            if resp.status_code == 429 or resp.status_code >= 500:
+                raise DDGSException(f"HTTP {resp.status_code} from {backend}")
+            if resp.status_code != 200 or not resp.text:
+                return []
+            return [result.__dict__ for result in engine.post_extract_results(engine.extract_results(resp.text))]
+
+    async def search(self, category: str, query: str, **kwargs: Any) -> list[dict[str, Any]]:
+        """Search the engines of a backend concurrently, stopping once enough results are collected
+
+        Results found by several engines rank first and keep the longest body, as in `DDGS`.
+        """
+        max_results = kwargs.get("max_results", 10)
+        merged: dict[str, dict[str, Any]] = {}
+        counts: Counter[str] = Counter()
+        err: Exception | None = None
+
+        async with aclosing(self.iter_backends(category, query, **kwargs)) as backends:
+            async for _, results in backends:
+                if isinstance(results, Exception):
+                    err = results
+                    continue
+                for result in results:
+                    if (key := result_key(result)) is None:
+                        continue
+                    if key not in merged or len(result.get("body", "")) > len(merged[key].get("body", "")):
+                        merged[key] = result
+                    counts[key] += 1
+                if max_results and len(merged) >= max_results:
+                    break
+
+        ranked = SimpleFilterRanker().rank([merged[key] for key, _ in counts.most_common()], query)
+        results = self.deduplicate(category, ranked)
+        if results:
+            return results[:max_results] if max_results else results
+        raise_no_results(err)
+
+    async def warm_up(self, categories: list[str], connections: int) -> int:
+        """Open up to `connections` connections from every client to each native engine of the categories, returning how many opened"""
+        origins = {
+            origin(engine_class.search_url)
+            for category in categories
+            for name, engine_class in ENGINES.get(category, {}).items()
+            if name in NATIVE_ENGINES.get(category, ()) and "{" not in engine_class.search_url
+        }
+        results = await asyncio.gather(*(client.head(url) for client in self.clients for url in origins for _ in range(connections)), return_exceptions=True)
+        return sum(not isinstance(result, BaseException) for result in results)
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any
+
+from pydantic import TypeAdapter
+
+from .ddgs import AsyncDDGS
+from .deadline import deadline_scope
+from .models import BatchSearchResult
+
+logger = logging.getLogger(__name__)
+
+batch_results_adapter = TypeAdapter(list[BatchSearchResult])
+
+
+async def run_batch(ddgs: AsyncDDGS, searches: list[tuple[str, dict[str, Any]]], concurrency: int, timeout: float) -> list[BatchSearchResult]:
+    """Run (category, params) searches concurrently, at most `concurrency` at a time and all within `timeout` seconds
+
+    Results are returned in input order, a failed or unfinished search gets an error instead of results.
+    The batch timeout is also the searches' deadline, so upstream work still running when it passes is dropped.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(category: str, params: dict[str, Any]) -> list[Any]:
+        async with semaphore:
+            return await getattr(ddgs, category)(**params)
+
+    with deadline_scope(timeout):
+        tasks = [asyncio.ensure_future(run(category, params)) for category, params in searches]
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+    batch_results = []
+    for task, (category, params) in zip(tasks, searches, strict=True):
+        if task.cancelled():
+            batch_results.append(BatchSearchResult(category=category, error=f"Batch deadline of {timeout}s exceeded"))
+        elif (e := task.exception()) is not None:
+            logger.error(f"Error searching {category}: {e}, params: {params}")
+            batch_results.append(BatchSearchResult(category=category, error=str(e) or type(e).__name__))
+        else:
+            batch_results.append(BatchSearchResult(category=category, results=task.result()))
+    return batch_results
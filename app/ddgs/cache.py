@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import struct
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from pydantic import BaseModel
+
+from . import metrics
+from .cache_backends import CacheBackend, CacheBackendError
+from .codec import CodecError, decode_items, encode_items
+from .deadline import Deadline, current_deadline, enforce_deadline, expires_at
+from .popularity import PopularityTracker
+
+logger = logging.getLogger(__name__)
+
+# Stored values are the wall-clock time results stay fresh until, followed by the encoded items
+ENVELOPE_MAGIC = b"SW"
+ENVELOPE = struct.Struct(">2sd")
+
+Fetch = Callable[[], Awaitable[list[BaseModel]]]
+
+
+class ResultCache:
+    """Search result cache with per-category TTLs, coalescing of identical in-flight searches and stale-while-revalidate
+
+    Entries are kept `stale_ttl` seconds past their TTL. An expired entry is served as is while one background search
+    refreshes it. With a popularity tracker, the most popular searches are also refreshed shortly before they expire.
+    A search shared by callers runs until the last of their deadlines, and is cancelled once no caller waits for it.
+    """
+
+    def __init__(self, backend: CacheBackend, ttls: dict[str, float], stale_ttl: float = 0, tracker: PopularityTracker | None = None):
+        self.backend = backend
+        self.ttls = ttls
+        self.stale_ttl = stale_ttl
+        self.tracker = tracker
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.refreshes = 0
+        self.errors = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+        # Deadline and waiting callers of in-flight searches started by requests, background refreshes have neither
+        self._deadlines: dict[asyncio.Task, Deadline] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+        self._refresher: asyncio.Task | None = None
+
+    async def get(self, key: str) -> list[BaseModel] | None:
+        """Return cached results for `key`, fresh or stale, or None on a miss"""
+        entry = await self._load(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        metrics.cache_events.inc(outcome="hits")
+        return entry[1]
+
+    async def get_or_fetch(self, category: str, key: str, fetch: Fetch) -> list[BaseModel]:
+        """Return cached results for `key`, or run `fetch` once for all concurrent callers and cache its results
+
+        Stale results are returned immediately, refreshing them in the background.
+        """
+        if self.tracker is not None:
+            self.tracker.record(key, (category, fetch))
+
+        entry = await self._load(key)
+        if entry is not None:
+            fresh_until, items = entry
+            if time.time() < fresh_until:
+                self.hits += 1
+                metrics.cache_events.inc(outcome="hits")
+            else:
+                self.stale += 1
+                metrics.cache_events.inc(outcome="stale")
+                self._start_fetch(category, key, fetch)
+            return items
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            metrics.cache_events.inc(outcome="coalesced")
+        else:
+            self.misses += 1
+            metrics.cache_events.inc(outcome="misses")
+            task = self._start_fetch(category, key, fetch, Deadline(expires_at()))
+        return await self._wait(key, task)
+
+    async def _wait(self, key: str, task: asyncio.Task) -> list[BaseModel]:
+        """Wait for a shared search within the caller's deadline, cancelling it when its last caller gives up"""
+        deadline = self._deadlines.get(task)
+        if deadline is not None:
+            deadline.extend(expires_at())
+            self._waiters[task] += 1
+        try:
+            # Shield the shared search so one cancelled caller does not cancel it for the others
+            async with enforce_deadline():
+                return list(await asyncio.shield(task))
+        finally:
+            if deadline is not None and not task.done():
+                self._waiters[task] -= 1
+                if not self._waiters[task]:
+                    # Nobody waits for the results any more, stop the search and let the next caller start afresh
+                    deadline.expire()
+                    if self._inflight.get(key) is task:
+                        del self._inflight[key]
+
+    def _start_fetch(self, category: str, key: str, fetch: Fetch, deadline: Deadline | None = None) -> asyncio.Task:
+        """Start the search for `key` unless one is already in flight, under `deadline` or detached from the caller's"""
+        task = self._inflight.get(key)
+        if task is None:
+            context = contextvars.copy_context()
+            context.run(current_deadline.set, deadline)
+            task = asyncio.get_running_loop().create_task(self._fetch_and_store(category, key, fetch), context=context)
+            self._inflight[key] = task
+            if deadline is not None:
+                self._deadlines[task] = deadline
+                self._waiters[task] = 0
+            task.add_done_callback(lambda t: self._release(key, t))
+        return task
+
+    async def _load(self, key: str) -> tuple[float, list[BaseModel]] | None:
+        """Read and decode a cached entry, treating backend failures as a miss"""
+        try:
+            data = await self.backend.get(key)
+            if data is None:
+                return None
+            magic, fresh_until = ENVELOPE.unpack_from(data)
+            if magic != ENVELOPE_MAGIC:
+                raise CodecError("Not a cache entry")
+            return fresh_until, decode_items(data[ENVELOPE.size :])
+        except (CacheBackendError, CodecError, struct.error) as e:
+            self.errors += 1
+            metrics.cache_events.inc(outcome="errors")
+            logger.warning(f"Error reading search cache: {e}, key: {key}")
+            return None
+
+    async def _fetch_and_store(self, category: str, key: str, fetch: Fetch) -> list[BaseModel]:
+        """Run a search and write its results to the backend"""
+        results = await fetch()
+        ttl = self.ttls.get(category, 0)
+        if ttl <= 0:
+            return results
+        try:
+            data = ENVELOPE.pack(ENVELOPE_MAGIC, time.time() + ttl) + encode_items(category, results)
+            await self.backend.set(key, data, ttl + self.stale_ttl)
+        except CacheBackendError as e:
+            self.errors += 1
+            metrics.cache_events.inc(outcome="errors")
+            logger.warning(f"Error writing search cache: {e}, key: {key}")
+        return results
+
+    def _release(self, key: str, task: asyncio.Task):
+        """Release the in-flight slot of a finished search"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        self._deadlines.pop(task, None)
+        self._waiters.pop(task, None)
+        if not task.cancelled() and (e := task.exception()) is not None:
+            # Retrieving the exception also keeps it from being reported when no caller awaited the search
+            logger.debug(f"Search for cache key {key} failed: {e!r}")
+
+    async def refresh_popular(self, lead: float):
+        """Refresh popular entries that expire within `lead` seconds or are already stale"""
+        if self.tracker is None:
+            return
+        now = time.time()
+        for key, (category, fetch) in self.tracker.popular():
+            if key in self._inflight:
+                continue
+            entry = await self._load(key)
+            if entry is not None and entry[0] - now > lead:
+                continue
+            self.refreshes += 1
+            metrics.cache_events.inc(outcome="refreshes")
+            self._start_fetch(category, key, fetch)
+
+    async def _run_refresher(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_popular(lead=2 * interval)
+            except Exception as e:
+                logger.warning(f"Error refreshing popular searches: {e!r}")
+            self.tracker.decay()
+
+    def start_refresher(self, interval: float):
+        """Refresh popular searches every `interval` seconds, before they expire"""
+        if self.tracker is not None and self._refresher is None:
+            self._refresher = asyncio.get_running_loop().create_task(self._run_refresher(interval))
+
+    async def clear(self):
+        """Remove all cached results"""
+        await self.backend.clear()
+
+    async def close(self):
+        """Stop refreshing and release backend resources"""
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        await self.backend.close()
+
+    def stats(self) -> dict[str, Any]:
+        """Get cache counters"""
+        lookups = self.hits + self.misses + self.coalesced + self.stale
+        return {
+            **self.backend.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "stale": self.stale,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "inflight": len(self._inflight),
+            "hit_ratio": (self.hits + self.coalesced + self.stale) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from urllib.parse import unquote, urlparse
+
+from app.config import Settings
+
+
+class LRUCache:
+    """Bounded LRU mapping with per-entry expiry, limited by entry count and total size"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evictions = 0
+        self._data: OrderedDict[str, tuple[float, int, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any | None:
+        """Get a value, or None if missing or expired"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self.delete(key)
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, size: int, ttl: float):
+        """Store a value for `ttl` seconds, evicting least recently used entries as needed"""
+        if size > self.max_bytes or ttl <= 0:
+            return
+
+        self.delete(key)
+        self._data[key] = (time.monotonic() + ttl, size, value)
+        self.total_bytes += size
+
+        while len(self._data) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._data.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def delete(self, key: str):
+        """Remove a value if present"""
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def clear(self):
+        """Remove all values"""
+        self._data.clear()
+        self.total_bytes = 0
+
+
+class CacheBackendError(Exception):
+    """Raised when a cache backend cannot serve a request"""
+
+
+class RedisReplyError(CacheBackendError):
+    """Raised when a Redis server answers a command with an error"""
+
+
+class CacheBackend(ABC):
+    """Storage for encoded search results shared by the result cache"""
+
+    name: str
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        """Get a value, or None if missing or expired"""
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float):
+        """Store a value for `ttl` seconds"""
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Remove a value if present"""
+
+    @abstractmethod
+    async def clear(self):
+        """Remove all values"""
+
+    async def close(self):  # noqa: B027
+        """Release backend resources"""
+
+    def stats(self) -> dict[str, Any]:
+        """Get backend counters"""
+        return {"backend": self.name}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU backend, private to one worker"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.store = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+
+    async def get(self, key: str) -> bytes | None:
+        return self.store.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self.store.set(key, value, len(value), ttl)
+
+    async def delete(self, key: str):
+        self.store.delete(key)
+
+    async def clear(self):
+        self.store.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": self.name, "entries": len(self.store), "bytes": self.store.total_bytes, "evictions": self.store.evictions}
+
+
+class SqliteCacheBackend(CacheBackend):
+    """On-disk SQLite backend, shared by all workers on one host"""
+
+    name = "sqlite"
+
+    # Run a size-bounded eviction pass every N writes instead of on every write
+    evict_interval = 100
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._writes = 0
+        self._conn: sqlite3.Connection | None = None
+        # A single thread owns the connection, keeping disk I/O off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-sqlite")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            self._conn = conn
+        return self._conn
+
+    async def _call(self, func, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        except sqlite3.Error as e:
+            raise CacheBackendError(f"SQLite cache error: {e}") from e
+
+    def _get(self, key: str) -> bytes | None:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def _set(self, key: str, value: bytes, ttl: float):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now + ttl, now))
+
+        self._writes += 1
+        if self._writes % self.evict_interval == 0:
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired entries, then least recently used ones until within the entry and size limits"""
+        self.evictions += conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,)).rowcount
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            batch = max(count - self.max_entries, 1, count // 10)
+            rows = conn.execute("SELECT key, size FROM cache ORDER BY accessed_at LIMIT ?", (batch,)).fetchall()
+            if not rows:
+                break
+            conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key, _ in rows])
+            self.evictions += len(rows)
+            count -= len(rows)
+            total -= sum(size for _, size in rows)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._call(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        if ttl > 0 and len(value) <= self.max_bytes:
+            await self._call(self._set, key, value, ttl)
+
+    async def delete(self, key: str):
+        await self._call(lambda: self._connect().execute("DELETE FROM cache WHERE key = ?", (key,)))
+
+    async def clear(self):
+        await self._call(lambda: self._connect().execute("DELETE FROM cache"))
+
+    async def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        await self._call(_close)
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": self.name, "path": self.path, "evictions": self.evictions}
+
+
+class RedisCacheBackend(CacheBackend):
+    """Minimal asyncio client for Redis-protocol (RESP) servers, shared by all workers and replicas"""
+
+    name = "redis"
+
+    def __init__(self, url: str, key_prefix: str = "ddgs-api:", pool_size: int = 10, timeout: float = 1.0):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("redis", "rediss"):
+            raise ValueError(f"Unsupported Redis URL scheme: {parsed.scheme}")
+
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.ssl = parsed.scheme == "rediss"
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots = asyncio.Semaphore(pool_size)
+
+    async def _open(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        if self.password:
+            auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+            await self._roundtrip(reader, writer, auth)
+        if self.db:
+            await self._roundtrip(reader, writer, ("SELECT", str(self.db)))
+        return reader, writer
+
+    @staticmethod
+    def _pack(args: tuple[str | bytes, ...]) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            raw = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(raw), raw))
+        return b"".join(parts)
+
+    async def _read_reply(self, reader: asyncio.StreamReader) -> Any:
+        line = await reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionResetError("Connection closed by Redis server")
+
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RedisReplyError(f"Redis error: {payload.decode(errors='replace')}")
+        if kind == b":":
+            return int(payload)
+        if kind == b"_":
+            return None
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply(reader) for _ in range(length)]
+        raise ValueError(f"Unexpected Redis reply: {line!r}")
+
+    async def _roundtrip(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, args: tuple[str | bytes, ...]) -> Any:
+        writer.write(self._pack(args))
+        await writer.drain()
+        return await self._read_reply(reader)
+
+    async def execute(self, *args: str | bytes) -> Any:
+        """Run one command on a pooled connection"""
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else None
+            try:
+                if conn is None:
+                    conn = await asyncio.wait_for(self._open(), self.timeout)
+                reply = await asyncio.wait_for(self._roundtrip(*conn, args), self.timeout)
+            except RedisReplyError:
+                # Error replies leave the connection usable, anything else may have desynchronized it
+                self._idle.append(conn)
+                raise
+            except (TimeoutError, OSError, asyncio.IncompleteReadError, ValueError) as e:
+                if conn is not None:
+                    conn[1].close()
+                raise CacheBackendError(f"Redis connection error: {e!r}") from e
+            except BaseException:
+                if conn is not None:
+                    conn[1].close()
+                raise
+
+            self._idle.append(conn)
+            return reply
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.execute("GET", self.key_prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        ttl_ms = int(ttl * 1000)
+        if ttl_ms > 0:
+            await self.execute("SET", self.key_prefix + key, value, "PX", str(ttl_ms))
+
+    async def delete(self, key: str):
+        await self.execute("DEL", self.key_prefix + key)
+
+    async def clear(self):
+        cursor = "0"
+        while True:
+            cursor, keys = await self.execute("SCAN", cursor, "MATCH", f"{self.key_prefix}*", "COUNT", "500")
+            if keys:
+                await self.execute("DEL", *keys)
+            cursor = cursor.decode() if isinstance(cursor, bytes) else str(cursor)
+            if cursor == "0":
+                break
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": self.name, "host": self.host, "port": self.port, "db": self.db, "idle_connections": len(self._idle)}
+
+
+def create_cache_backend(settings: Settings) -> CacheBackend:
+    """Create the cache backend selected by `settings.cache_backend`"""
+    if settings.cache_backend == "memory":
+        return MemoryCacheBackend(max_entries=settings.cache_max_entries, max_bytes=settings.cache_max_bytes)
+    if settings.cache_backend == "sqlite":
+        return SqliteCacheBackend(path=settings.cache_sqlite_path, max_entries=settings.cache_max_entries, max_bytes=settings.cache_max_bytes)
+    if settings.cache_backend == "redis":
+        return RedisCacheBackend(url=settings.cache_redis_url, key_prefix=settings.cache_redis_prefix)
+    raise ValueError(f"Unknown cache backend: {settings.cache_backend}")
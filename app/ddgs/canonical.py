@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import hashlib
+import unicodedata
+from typing import Any
+
+from app.config import settings
+
+# Parameter values the search engines use when a parameter is omitted
+ENGINE_DEFAULTS: dict[str, Any] = {"region": "us-en", "safesearch": "moderate", "max_results": 10, "page": 1, "backend": "auto", "fanout": False}
+
+# Search operators whose meaning depends on case, kept as is in cache keys
+CASE_SENSITIVE_OPERATORS = {"OR", "AND", "NOT"}
+
+
+def normalize_query(query: str) -> str:
+    """Apply NFKC and collapse runs of whitespace"""
+    return " ".join(unicodedata.normalize("NFKC", query).split())
+
+
+def normalize_backend(backend: str) -> str:
+    """Lower-case, deduplicate and sort a comma-delimited backend list, folding `all` into `auto`"""
+    names = sorted({name.strip().lower() for name in backend.split(",")} - {""})
+    if not names or "auto" in names or "all" in names:
+        return "auto"
+    return ",".join(names)
+
+
+def canonicalize(query: str, params: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+    """Normalize a search so equivalent requests become identical
+
+    Settings defaults fill omitted parameters, and parameters equal to what the engines use anyway are dropped,
+    so a search spelling out a default matches one omitting it.
+    """
+    merged = {**settings.default_search_params, **{name: value for name, value in params.items() if value is not None}}
+    canonical: dict[str, Any] = {}
+    for name, value in merged.items():
+        if name in ("region", "safesearch") and isinstance(value, str):
+            value = value.strip().lower()
+        elif name == "timelimit" and isinstance(value, str):
+            value = value.strip()
+            value = value.lower() if len(value) == 1 else value
+        elif name == "backend" and isinstance(value, str):
+            value = normalize_backend(value)
+        if value is None or value == "" or ENGINE_DEFAULTS.get(name) == value:
+            continue
+        canonical[name] = value
+    return normalize_query(query), canonical
+
+
+def query_key(query: str) -> str:
+    """Case-fold a normalized query for keying, the engines match queries case-insensitively apart from operators"""
+    return " ".join(word if word in CASE_SENSITIVE_OPERATORS else word.casefold() for word in query.split(" "))
+
+
+def make_cache_key(category: str, query: str, params: dict[str, Any]) -> str:
+    """Build a stable key from a canonicalized search, for caching and coalescing"""
+    parts = [category, query_key(query)]
+    parts.extend(f"{name}={params[name]}" for name in sorted(params) if params[name] is not None)
+    digest = hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+    return f"{category}:{digest}"
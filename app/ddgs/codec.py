@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from typing import Any
+
+from pydantic import BaseModel
+
+from .models import *
+
+# Binary layout of an encoded item list:
+#   magic (2 bytes) | version (1 byte) | category (1 byte) | item count (varint) | items
+# Each item is its model's field values in declaration order, each value a tag byte followed by its payload.
+# Decoding skips pydantic validation, the values were validated when the items were first built.
+
+MAGIC = b"DI"
+VERSION = 1
+
+CATEGORIES: list[tuple[str, type[BaseModel]]] = [
+    ("text", TextSearchItem),
+    ("images", ImagesSearchItem),
+    ("videos", VideosSearchItem),
+    ("news", NewsSearchItem),
+    ("books", BooksSearchItem),
+]
+CATEGORY_IDS = {category: index for index, (category, _) in enumerate(CATEGORIES)}
+FIELDS = {category: tuple(model.model_fields) for category, model in CATEGORIES}
+
+TAG_NONE = 0
+TAG_STR = 1
+TAG_INT = 2
+TAG_DICT = 3
+TAG_FALSE = 4
+TAG_TRUE = 5
+
+
+class CodecError(ValueError):
+    """Raised when encoded search items cannot be decoded"""
+
+
+def _write_varint(buffer: bytearray, value: int):
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_value(buffer: bytearray, value: Any):
+    if value is None:
+        buffer.append(TAG_NONE)
+    elif isinstance(value, bool):
+        buffer.append(TAG_TRUE if value else TAG_FALSE)
+    elif isinstance(value, str):
+        raw = value.encode("utf-8")
+        buffer.append(TAG_STR)
+        _write_varint(buffer, len(raw))
+        buffer += raw
+    elif isinstance(value, int):
+        buffer.append(TAG_INT)
+        _write_varint(buffer, value << 1 if value >= 0 else ((-value) << 1) - 1)
+    elif isinstance(value, dict):
+        buffer.append(TAG_DICT)
+        _write_varint(buffer, len(value))
+        for key, item in value.items():
+            _write_value(buffer, str(key))
+            _write_value(buffer, item)
+    else:
+        _write_value(buffer, str(value))
+
+
+def _read_value(data: bytes, pos: int) -> tuple[Any, int]:
+    tag = data[pos]
+    pos += 1
+    if tag == TAG_NONE:
+        return None, pos
+    if tag == TAG_STR:
+        length, pos = _read_varint(data, pos)
+        return data[pos : pos + length].decode("utf-8"), pos + length
+    if tag == TAG_INT:
+        raw, pos = _read_varint(data, pos)
+        return (raw >> 1) ^ -(raw & 1), pos
+    if tag == TAG_DICT:
+        length, pos = _read_varint(data, pos)
+        value = {}
+        for _ in range(length):
+            key, pos = _read_value(data, pos)
+            value[key], pos = _read_value(data, pos)
+        return value, pos
+    if tag in (TAG_FALSE, TAG_TRUE):
+        return tag == TAG_TRUE, pos
+    raise CodecError(f"Unknown value tag: {tag}")
+
+
+def encode_items(category: str, items: list[BaseModel]) -> bytes:
+    """Encode a list of search items of `category` to compact binary"""
+    fields = FIELDS[category]
+    buffer = bytearray(MAGIC)
+    buffer.append(VERSION)
+    buffer.append(CATEGORY_IDS[category])
+    _write_varint(buffer, len(items))
+    for item in items:
+        for name in fields:
+            _write_value(buffer, getattr(item, name, None))
+    return bytes(buffer)
+
+
+def decode_items(data: bytes) -> list[BaseModel]:
+    """Decode search items produced by `encode_items`"""
+    if len(data) < 5 or data[:2] != MAGIC:
+        raise CodecError("Not an encoded search item list")
+    if data[2] != VERSION:
+        raise CodecError(f"Unsupported encoding version: {data[2]}")
+
+    try:
+        category, model = CATEGORIES[data[3]]
+        fields = FIELDS[category]
+        count, pos = _read_varint(data, 4)
+        items = []
+        for _ in range(count):
+            values = {}
+            for name in fields:
+                values[name], pos = _read_value(data, pos)
+            items.append(model.model_construct(**values))
+    except (IndexError, UnicodeDecodeError) as e:
+        raise CodecError(f"Corrupted search item list: {e}") from e
+
+    return items
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import Any, Literal
+
+from pydantic import BaseModel
+
+from .models import BooksSearchItem, ImagesSearchItem, NewsSearchItem, TextSearchItem, VideosSearchItem
+
+# Compact layouts: a JSON list of projected results, or a tab-separated table with a header row
+Layout = Literal["json", "table"]
+
+# Fields kept when a compact request does not pick its own, per search category
+COMPACT_FIELDS: dict[str, tuple[str, ...]] = {
+    "text": ("title", "href", "body"),
+    "images": ("title", "image", "url"),
+    "videos": ("title", "content", "duration", "description"),
+    "news": ("title", "url", "date", "source", "body"),
+    "books": ("title", "author", "url", "info"),
+}
+
+# Long free-text fields, cut down to share the budget, per search category
+SNIPPET_FIELDS: dict[str, tuple[str, ...]] = {
+    "text": ("body",),
+    "images": (),
+    "videos": ("description",),
+    "news": ("body",),
+    "books": ("info",),
+}
+
+ITEM_MODELS: dict[str, type[BaseModel]] = {"text": TextSearchItem, "images": ImagesSearchItem, "videos": VideosSearchItem, "news": NewsSearchItem, "books": BooksSearchItem}
+
+ELLIPSIS = "…"
+# Snippets shorter than this say too little to be worth their separators and are dropped
+MIN_SNIPPET = 16
+
+
+class InvalidFieldsError(ValueError):
+    """Raised when a compact format asks for fields the search category's results do not have"""
+
+
+def check_fields(category: str, fields: tuple[str, ...] | list[str]):
+    """Raise `InvalidFieldsError` unless the category's results have all the fields"""
+    model_fields = ITEM_MODELS[category].model_fields
+    if unknown := [name for name in fields if name not in model_fields]:
+        raise InvalidFieldsError(f"Unknown {category} result fields: {', '.join(unknown)}, available: {', '.join(model_fields)}")
+
+
+@dataclass(frozen=True, slots=True)
+class CompactFormat:
+    """How to shrink search results: which fields to keep, how many characters in total, and in what layout"""
+
+    fields: tuple[str, ...] | None = None
+    max_chars: int | None = None
+    layout: Layout = "json"
+
+
+def compact_format(fields: list[str] | None, max_chars: int | None, max_tokens: int | None, layout: Layout | None, chars_per_token: float = 4) -> CompactFormat | None:
+    """Build the compact format a request asks for, None when it asks for full results
+
+    A token budget is turned into characters at `chars_per_token`, the tighter of both budgets applies.
+    """
+    if not (fields or max_chars or max_tokens or layout):
+        return None
+    budgets = [budget for budget in (max_chars, int(max_tokens * chars_per_token) if max_tokens else None) if budget]
+    return CompactFormat(fields=tuple(fields) if fields else None, max_chars=min(budgets) if budgets else None, layout=layout or "json")
+
+
+def fair_shares(wanted: list[int], total: int) -> list[int]:
+    """Split `total` across items wanting `wanted` each, those wanting less than an equal share leave the rest to the others"""
+    shares = [0] * len(wanted)
+    left = total
+    order = sorted(range(len(wanted)), key=wanted.__getitem__)
+    for n, i in enumerate(order):
+        shares[i] = min(wanted[i], max(left, 0) // (len(order) - n))
+        left -= shares[i]
+    return shares
+
+
+def truncate(text: str, limit: int) -> str:
+    """Cut text to at most `limit` characters, at a word boundary when one is near, marking the cut with an ellipsis"""
+    if len(text) <= limit:
+        return text
+    if limit < MIN_SNIPPET:
+        return ""
+    cut = text[: limit - len(ELLIPSIS)]
+    space = cut.rfind(" ")
+    if space >= len(cut) * 4 // 5:
+        cut = cut[:space]
+    return cut.rstrip(" ,.;:-") + ELLIPSIS
+
+
+def cell(value: Any) -> str:
+    """Render a value as one table cell, without the tabs and newlines that separate cells and rows"""
+    if value is None:
+        return ""
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return " ".join(text.split())
+
+
+class Compactor:
+    """Render results in a `CompactFormat`, splitting the character budget fairly across the results' snippets"""
+
+    def __init__(self, category: str, fmt: CompactFormat):
+        self.fmt = fmt
+        self.fields = tuple(dict.fromkeys(fmt.fields)) if fmt.fields else COMPACT_FIELDS[category]
+        check_fields(category, self.fields)
+        self.snippets = [name for name in self.fields if name in SNIPPET_FIELDS[category]]
+
+    def _rows(self, items: list[BaseModel]) -> list[dict[str, Any]]:
+        rows = []
+        for item in items:
+            data = item.__dict__
+            row = {name: data.get(name) for name in self.fields}
+            if self.fmt.layout == "table":
+                row = {name: cell(value) for name, value in row.items()}
+            rows.append(row)
+        return rows
+
+    def _size(self, row: dict[str, Any]) -> int:
+        """Characters a row takes in the output, with its separator"""
+        if self.fmt.layout == "table":
+            return sum(len(value) for value in row.values()) + len(row)
+        return len(json.dumps(row, ensure_ascii=False, separators=(",", ":"))) + 1
+
+    def _fit(self, rows: list[dict[str, Any]], budget: int) -> list[dict[str, Any]]:
+        """Drop trailing rows whose fixed fields overflow the budget, then share what is left across the snippets"""
+        empty = dict.fromkeys(self.snippets, "")
+        fitted, used = [], 0
+        for row in rows:
+            size = self._size({**row, **empty})
+            if fitted and used + size > budget:
+                break
+            fitted.append(row)
+            used += size
+
+        keys = [(i, name) for i, row in enumerate(fitted) for name in self.snippets if row.get(name)]
+        shares = fair_shares([self._length(fitted[i][name]) for i, name in keys], budget - used)
+        for (i, name), share in zip(keys, shares, strict=True):
+            fitted[i][name] = self._shorten(fitted[i][name], share)
+        return fitted
+
+    def _length(self, text: str) -> int:
+        """Characters a snippet takes in the output, with JSON escapes"""
+        return len(json.dumps(text, ensure_ascii=False)) - 2 if self.fmt.layout == "json" else len(text)
+
+    def _shorten(self, text: str, share: int) -> str:
+        """Truncate a snippet to take at most `share` characters in the output"""
+        limit = share
+        while (over := self._length(cut := truncate(text, limit)) - share) > 0:
+            limit -= over
+        return cut
+
+    def render(self, items: list[BaseModel]) -> list[dict[str, Any]] | str:
+        """Project and shrink the results to the budget, as a list of dicts or a table"""
+        rows = self._rows(items)
+        if self.fmt.max_chars is not None:
+            # The header row and the enclosing brackets come out of the budget first
+            overhead = len("\t".join(self.fields)) + 1 if self.fmt.layout == "table" else 1
+            rows = self._fit(rows, self.fmt.max_chars - overhead)
+        if self.fmt.layout == "table":
+            return "\n".join(["\t".join(self.fields), *("\t".join(row.values()) for row in rows)])
+        return rows
+
+
+def compact(category: str, items: list[BaseModel], fmt: CompactFormat) -> list[dict[str, Any]] | str:
+    """Project and shrink search results to a compact format"""
+    return Compactor(category, fmt).render(items)
@@ -1,67 +1,429 @@
 from __future__ import annotations
 
 import asyncio
+import logging
+import os
+from collections.abc import AsyncIterator
+from contextlib import aclosing
 from typing import Any
 
-from ddgs import DDGS
+from pydantic import BaseModel, TypeAdapter
 
+from app.config import settings
+
+from . import metrics, tracing
+from .aio import AsyncSearchClient
+from .cache import ResultCache
+from .cache_backends import create_cache_backend
+from .canonical import canonicalize, make_cache_key
+from .deadline import deadline_scope, enforce_deadline
+from .dedup import TEXT_FIELDS
 from .executor import cleanup_executor, get_executor, initialize_executor
+from .fanout import FanoutSearcher
+from .fetcher import PageFetcher, fetch_error
+from .jobs import JobRunner, JobStore
+from .limiter import AdmissionController
+from .local_index import LocalIndex
 from .models import *
+from .pagination import Paginator
+from .pool import DDGSClientPool
+from .popularity import PopularityTracker
+from .tenants import FairScheduler, TenantLimiter
+from .tracing import SpanExporter, Tracer
+from .upstream import ThreadSearchClient
+
+logger = logging.getLogger(__name__)
 
 # Global DDGS instance
 ddgs_instance: AsyncDDGS | None = None
 
+# Item model and the field a result must have to be kept, per search category
+SEARCH_ITEMS: dict[str, tuple[type[BaseModel], str]] = {
+    "text": (TextSearchItem, "href"),
+    "images": (ImagesSearchItem, "url"),
+    "videos": (VideosSearchItem, "content"),
+    "news": (NewsSearchItem, "url"),
+    "books": (BooksSearchItem, "title"),
+}
+
+# Compiled validator and serializer of each category's item list, building or dumping a whole list in one call
+ITEM_ADAPTERS: dict[str, TypeAdapter] = {category: TypeAdapter(list[model]) for category, (model, _) in SEARCH_ITEMS.items()}
+PAGE_ADAPTERS: dict[str, TypeAdapter] = {category: TypeAdapter(SearchPage[model]) for category, (model, _) in SEARCH_ITEMS.items()}
+
+
+def pagination_secret() -> bytes:
+    """Get the secret signing pagination cursors, required with several workers so any of them accepts the others' cursors"""
+    if settings.pagination_secret:
+        return settings.pagination_secret.encode()
+    if settings.web_concurrency > 1:
+        raise ValueError("PAGINATION_SECRET must be set when running several workers")
+    # A single worker can sign with a random secret, its cursors stop working after a restart
+    return os.urandom(32)
+
 
 class AsyncDDGS:
     """Async DDGS instance"""
 
-    def __init__(self, proxy: str | None = None, timeout: int | None = 5, verify: bool = True):
+    def __init__(
+        self,
+        proxy: str | None = None,
+        timeout: int | None = 5,
+        verify: bool = True,
+        cache: ResultCache | None = None,
+        engine: str = "thread",
+        pool: DDGSClientPool | None = None,
+        admission: AdmissionController | None = None,
+        tenants: TenantLimiter | None = None,
+        scheduler: FairScheduler | None = None,
+        index: LocalIndex | None = None,
+        fetcher: PageFetcher | None = None,
+        tracer: Tracer | None = None,
+    ):
         self.executor = get_executor()
-        self.ddgs = DDGS(proxy=proxy, timeout=timeout, verify=verify)
+        self.pool = pool or DDGSClientPool(proxies=[proxy], timeout=timeout, verify=verify)
+        self.cache = cache
+        # Harvested text and news results, answering searches locally before or instead of upstream
+        self.index = index
+        # Fetches result pages and extracts their text for search and fetch
+        self.fetcher = fetcher
+        # Starts the traces of REST requests and MCP tool calls, None when tracing is disabled
+        self.tracer = tracer
+        # Background workers running bulk search jobs, set up once the instance exists
+        self.jobs: JobRunner | None = None
+        self.engine = engine
+        # Per-API-key rate limits and quotas, checked by the REST and MCP layers
+        self.tenants = tenants or TenantLimiter()
+        if engine not in ("thread", "async"):
+            raise ValueError(f"Unknown search engine: {engine}")
+        # Runs upstream searches under admission control, with `DDGS` in the executor or, experimentally, on the event loop
+        options = {
+            "admission": admission,
+            "scheduler": scheduler,
+            "dedup": settings.dedup_enabled,
+            "dedup_max_distance": settings.dedup_max_distance,
+            "dedup_merge": settings.dedup_merge,
+        }
+        if engine == "async":
+            self.upstream: ThreadSearchClient = AsyncSearchClient(self.executor, self.pool, max_connections=settings.http_max_connections, **options)
+        else:
+            self.upstream = ThreadSearchClient(self.executor, self.pool, **options)
+        self.fanout = FanoutSearcher(
+            self.upstream,
+            max_backends=settings.fanout_max_backends,
+            hedge_percentile=settings.fanout_hedge_percentile,
+            hedge_delay=settings.fanout_hedge_delay,
+            max_hedges=settings.fanout_max_hedges,
+        )
+        self.paginator = Paginator(
+            self,
+            key_fields={category: required for category, (_, required) in SEARCH_ITEMS.items()},
+            secret=pagination_secret(),
+            text_fields=TEXT_FIELDS if settings.dedup_enabled else None,
+            window=settings.pagination_window,
+            max_results=settings.pagination_max_results,
+            ttl=settings.pagination_ttl,
+            max_buffers=settings.pagination_max_buffers,
+        )
+
+    async def _run(self, category: str, query: str, fanout: bool = False, **kwargs: Any) -> list[BaseModel]:
+        """Run a search upstream and convert the results to item models"""
+        if fanout:
+            results = await self.fanout.search(category, query, **kwargs)
+        else:
+            results = await self.upstream.search(category, query, **kwargs)
+        _, required = SEARCH_ITEMS[category]
+        with metrics.convert_seconds.time(category=category), tracing.span("convert"):
+            items = ITEM_ADAPTERS[category].validate_python([result for result in results if result.get(required)]) if results else []
+        if self.index is not None:
+            self.index.harvest(category, kwargs, items)
+        return items
+
+    async def _fetch(self, category: str, query: str, **kwargs: Any) -> list[BaseModel]:
+        """Answer a search from the local index when it has enough fresh results, otherwise run it upstream"""
+        if self.index is not None:
+            with tracing.span("index"):
+                results = await self.index.lookup(category, query, kwargs)
+            if results is not None:
+                metrics.local_index_served.inc(category=category, mode="fast")
+                return results
+        return await self._run(category, query, **kwargs)
+
+    async def _fallback(self, category: str, query: str, kwargs: dict[str, Any], error: Exception) -> list[BaseModel]:
+        """Serve a search that failed upstream from the local index, re-raising the error when it has nothing"""
+        # No results upstream is an answer, not a failure
+        if self.index is None or "No results found" in str(error):
+            raise error
+        results = await self.index.fallback(category, query, kwargs)
+        if not results:
+            raise error
+        logger.info(f"Serving {category} search from the local index after upstream error: {error!r}")
+        metrics.local_index_served.inc(category=category, mode="fallback")
+        return results
+
+    async def _search(self, category: str, query: str, timeout: float | None = None, **kwargs: Any) -> list[BaseModel]:
+        """Execute a canonicalized search within `timeout` seconds and any request deadline, serving it from the result cache when possible
+
+        When upstream fails, the search is answered from the local index if it has matching results, which are not cached.
+        """
+        query, kwargs = canonicalize(query, kwargs)
+        try:
+            with deadline_scope(timeout):
+                if self.cache is None:
+                    async with enforce_deadline():
+                        results = await self._fetch(category, query, **kwargs)
+                else:
+                    key = make_cache_key(category, query, kwargs)
+                    results = await self.cache.get_or_fetch(category, key, lambda: self._fetch(category, query, **kwargs))
+        except Exception as e:
+            results = await self._fallback(category, query, kwargs, e)
+        metrics.results.observe(len(results), category=category)
+        return results
+
+    async def stream(self, category: str, query: str, timeout: float | None = None, **kwargs: Any) -> AsyncIterator[BaseModel]:
+        """Yield item models as soon as each engine returns them, or all at once from the result cache
+
+        Engines still running when the deadline passes are dropped, ending the stream with the results so far.
+        """
+        query, kwargs = canonicalize(query, kwargs)
+        if self.cache is not None:
+            cached = await self.cache.get(make_cache_key(category, query, kwargs))
+            if cached is not None:
+                for item in cached:
+                    yield item
+                return
+
+        # Streaming already queries the backends in parallel
+        kwargs.pop("fanout", None)
+        model, required = SEARCH_ITEMS[category]
+        with deadline_scope(timeout):
+            async with aclosing(self.upstream.stream(category, query, **kwargs)) as results:
+                async for result in results:
+                    if result.get(required):
+                        yield model(**result)
 
     async def text(self, query: str, **kwargs: Any) -> list[TextSearchItem]:
         """async execute a text search"""
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(self.executor, lambda: list(self.ddgs.text(query, **kwargs)))
-        return [TextSearchItem(**result) for result in results if result.get("href")] if results else []
+        return await self._search("text", query, **kwargs)
 
     async def images(self, query: str, **kwargs: Any) -> list[ImagesSearchItem]:
         """async execute an image search"""
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(self.executor, lambda: list(self.ddgs.images(query, **kwargs)))
-        return [ImagesSearchItem(**result) for result in results if result.get("url")] if results else []
+        return await self._search("images", query, **kwargs)
 
     async def videos(self, query: str, **kwargs: Any) -> list[VideosSearchItem]:
         """async execute a video search"""
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(self.executor, lambda: list(self.ddgs.videos(query, **kwargs)))
-        return [VideosSearchItem(**result) for result in results if result.get("content")] if results else []
+        return await self._search("videos", query, **kwargs)
 
     async def news(self, query: str, **kwargs: Any) -> list[NewsSearchItem]:
         """async execute a news search"""
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(self.executor, lambda: list(self.ddgs.news(query, **kwargs)))
-        return [NewsSearchItem(**result) for result in results if result.get("url")] if results else []
+        return await self._search("news", query, **kwargs)
 
     async def books(self, query: str, **kwargs: Any) -> list[BooksSearchItem]:
         """async execute a book search"""
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(self.executor, lambda: list(self.ddgs.books(query, **kwargs)))
-        return [BooksSearchItem(**result) for result in results if result.get("title")] if results else []
+        return await self._search("books", query, **kwargs)
+
+    async def search_and_fetch(self, query: str, fetch_top: int = 3, max_chars: int | None = None, timeout: float | None = None, **kwargs: Any) -> list[FetchedTextItem]:
+        """Text search that also fetches the pages of the top `fetch_top` results concurrently, with at most `max_chars` of text each
+
+        Pages are fetched within the search's deadline, those that fail or run out of time carry their error instead of the page.
+        """
+        if self.fetcher is None:
+            raise RuntimeError("Page fetching is disabled")
+        with deadline_scope(timeout):
+            results = await self.text(query, **kwargs)
+            with tracing.span("fetch"):
+                pages = await self.fetcher.fetch_all([result.href for result in results[:fetch_top]])
+
+        items = [FetchedTextItem(**result.model_dump()) for result in results]
+        for item, page in zip(items, pages, strict=False):
+            if isinstance(page, BaseException):
+                item.error = fetch_error(page)
+            elif max_chars is not None and len(page.text) > max_chars:
+                item.page = page.model_copy(update={"text": page.text[:max_chars], "truncated": True})
+            else:
+                item.page = page
+        return items
+
+    async def warm_up(self, categories: list[str], connections: int, queries: list[str]) -> tuple[int, int]:
+        """Open upstream connections for the categories, then run canary text searches upstream, bypassing the cache
+
+        Returns the connections opened and the canary searches that succeeded.
+        """
+        opened = await self.upstream.warm_up(categories, connections)
+        results = await asyncio.gather(*(self._run("text", query) for query in queries), return_exceptions=True)
+        for query, result in zip(queries, results, strict=True):
+            if isinstance(result, BaseException):
+                logger.warning(f"Warm-up search for {query!r} failed: {result!r}")
+        return opened, sum(not isinstance(result, BaseException) for result in results)
+
+    def collect_metrics(self):
+        """Refresh the runtime gauges for a metrics scrape"""
+        metrics.executor_queue_depth.set(metrics.queued_tasks)
+        metrics.executor_threads.set(metrics.started_threads, state="total")
+        metrics.executor_threads.set(metrics.busy_threads, state="busy")
+
+        metrics.pool_clients.set(self.pool.stats()["clients"])
+
+        if self.cache is not None:
+            cache = self.cache.stats()
+            metrics.cache_hit_ratio.set(cache["hit_ratio"])
+            if "entries" in cache:
+                metrics.cache_entries.set(cache["entries"])
+
+        if self.upstream.admission is not None:
+            for engine, state in self.upstream.admission.stats()["engines"].items():
+                metrics.admission_limit.set(state["limit"], engine=engine)
+                metrics.admission_inflight.set(state["inflight"], engine=engine)
+                metrics.admission_circuit_open.set({"open": 1, "half_open": 0.5}.get(state["circuit"], 0), engine=engine)
+
+        for tenant, remaining in self.tenants.stats()["quota_remaining"].items():
+            metrics.tenant_quota_remaining.set(remaining, tenant=tenant)
+
+        if self.index is not None:
+            for category, (documents, size) in self.index.counts.items():
+                metrics.local_index_documents.set(documents, category=category)
+                metrics.local_index_bytes.set(size, category=category)
+
+        if self.fetcher is not None:
+            metrics.page_cache_pages.set(self.fetcher.stats()["cached_pages"])
+
+        if self.tracer is not None:
+            metrics.spans_queued.set(self.tracer.stats()["queued"])
+
+        if self.upstream.scheduler is not None:
+            scheduler = self.upstream.scheduler.stats()
+            metrics.scheduler_inflight.set(scheduler["inflight"])
+            metrics.scheduler_queued.clear()
+            for tenant, queued in scheduler["tenants"].items():
+                metrics.scheduler_queued.set(queued, tenant=tenant)
+
+    async def close(self):
+        """Stop the job workers, release the HTTP clients, cache backend and local index, then export the spans left"""
+        if self.jobs is not None:
+            await self.jobs.close()
+        await self.upstream.close()
+        if self.fetcher is not None:
+            await self.fetcher.close()
+        if self.cache is not None:
+            await self.cache.close()
+        if self.index is not None:
+            await self.index.close()
+        if self.tracer is not None:
+            await self.tracer.close()
 
 
 def initialize_ddgs():
     """Initialize DDGS instance"""
     initialize_executor()
 
+    cache = None
+    if settings.cache_enabled:
+        tracker = PopularityTracker(top_k=settings.cache_refresh_top_k) if settings.cache_refresh_enabled else None
+        cache = ResultCache(backend=create_cache_backend(settings), ttls=settings.cache_ttl, stale_ttl=settings.cache_stale_ttl, tracker=tracker)
+        cache.start_refresher(settings.cache_refresh_interval)
+
+    pool = DDGSClientPool(
+        proxies=settings.ddgs_proxies or [settings.ddgs_proxy],
+        timeout=settings.ddgs_timeout or 5,
+        verify=settings.ddgs_verify,
+        max_failures=settings.ddgs_max_failures,
+    )
+
+    admission = None
+    if settings.admission_enabled:
+        admission = AdmissionController(
+            limiter_options={
+                "initial": settings.admission_initial_limit,
+                "min_limit": settings.admission_min_limit,
+                "max_limit": settings.admission_max_limit,
+                "latency_tolerance": settings.admission_latency_tolerance,
+                "max_queue": settings.admission_max_queue,
+                "queue_timeout": settings.admission_queue_timeout,
+            },
+            breaker_options={
+                "failure_rate": settings.breaker_failure_rate,
+                "window": settings.breaker_window,
+                "min_requests": settings.breaker_min_requests,
+                "reset_timeout": settings.breaker_reset_timeout,
+            },
+        )
+
+    tenants = TenantLimiter(
+        rate=settings.tenant_rate,
+        burst=settings.tenant_burst,
+        quota=settings.tenant_quota,
+        quota_period=settings.tenant_quota_period,
+    )
+    scheduler = None
+    if settings.fair_scheduling:
+        # By default as many slots as the engine can run at once, so searches queue here by tenant rather than in the executor
+        max_concurrency = settings.fair_max_concurrency or (settings.executor_max_workers if settings.search_engine == "thread" else settings.http_max_connections)
+        scheduler = FairScheduler(max_concurrency=max_concurrency, max_queue=settings.fair_max_queue, queue_timeout=settings.fair_queue_timeout, weights=tenants)
+
+    index = None
+    if settings.local_index_enabled:
+        index = LocalIndex(
+            path=settings.local_index_path,
+            fresh_ages=settings.local_index_fresh_age,
+            fallback_ages=settings.local_index_fallback_age,
+            max_docs=settings.local_index_max_docs,
+            max_bytes=settings.local_index_max_bytes,
+        )
+
+    fetcher = None
+    if settings.fetch_enabled:
+        fetcher = PageFetcher(
+            proxy=pool.proxies[0],
+            verify=settings.ddgs_verify,
+            timeout=settings.fetch_timeout,
+            max_connections=settings.fetch_max_connections,
+            max_per_host=settings.fetch_max_per_host,
+            max_bytes=settings.fetch_max_bytes,
+            max_chars=settings.fetch_max_chars,
+            cache_ttl=settings.fetch_cache_ttl,
+            cache_max_entries=settings.fetch_cache_max_entries,
+            cache_max_bytes=settings.fetch_cache_max_bytes,
+            allow_private=settings.fetch_allow_private,
+            http2=settings.http2,
+        )
+
+    tracer = None
+    if settings.tracing_enabled:
+        if settings.tracing_exporter not in ("none", "otlp", "file"):
+            raise ValueError(f"Unknown tracing exporter: {settings.tracing_exporter}")
+        exporter = None
+        if settings.tracing_exporter != "none":
+            exporter = SpanExporter(
+                endpoint=settings.tracing_otlp_endpoint if settings.tracing_exporter == "otlp" else None,
+                path=settings.tracing_file if settings.tracing_exporter == "file" else None,
+                service_name=settings.tracing_service_name,
+                interval=settings.tracing_export_interval,
+                max_queue=settings.tracing_max_queue,
+            )
+        tracer = Tracer(sample_rate=settings.tracing_sample_rate, exporter=exporter)
+        tracer.start()
+
     global ddgs_instance
-    ddgs_instance = AsyncDDGS()
+    ddgs_instance = AsyncDDGS(
+        cache=cache, engine=settings.search_engine, pool=pool, admission=admission, tenants=tenants, scheduler=scheduler, index=index, fetcher=fetcher, tracer=tracer
+    )
+
+    if settings.jobs_enabled:
+        # Searches left claimed by a stopped worker are picked up again after their lease, which outlasts a search's deadline
+        store = JobStore(settings.jobs_path, lease=max(4 * settings.request_timeout, 60))
+        timeout = settings.request_timeout or None
+        ddgs_instance.jobs = JobRunner(
+            ddgs_instance, store, concurrency=settings.jobs_concurrency, max_attempts=settings.jobs_max_attempts, timeout=timeout, retention=settings.jobs_retention
+        )
+        ddgs_instance.jobs.start()
 
 
-def cleanup_ddgs():
+async def cleanup_ddgs():
     """Cleanup DDGS instance"""
-    cleanup_executor()
     global ddgs_instance
+    if ddgs_instance is not None:
+        await ddgs_instance.close()
+
+    cleanup_executor()
     ddgs_instance = None
 
 
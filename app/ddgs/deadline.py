@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from .limiter import OverloadedError
+
+
+class DeadlineExceededError(OverloadedError):
+    """Raised when a search runs out of its time budget, or its client went away"""
+
+    status_code = 504
+
+    def __init__(self, message: str = "Request deadline exceeded"):
+        super().__init__(message, retry_after=0)
+
+
+class Deadline:
+    """Point in time by which a request's searches must finish, within any enclosing deadline
+
+    Waits under `enforce_deadline` register here, so `expire` can end them early, e.g. when the client disconnects.
+    """
+
+    def __init__(self, expires_at: float = math.inf, parent: Deadline | None = None):
+        self.expires_at = expires_at
+        self.parent = parent
+        # Waits running under this deadline or a nested one, with the innermost deadline each runs under
+        self._timeouts: dict[asyncio.Timeout, Deadline] = {}
+
+    def time_left(self) -> float:
+        """Seconds left, negative once expired"""
+        left = self.expires_at - time.monotonic()
+        return min(left, self.parent.time_left()) if self.parent is not None else left
+
+    @property
+    def active(self) -> bool:
+        """Whether any work is running under this deadline"""
+        return bool(self._timeouts)
+
+    def _reschedule(self):
+        now = asyncio.get_running_loop().time()
+        for timeout, deadline in list(self._timeouts.items()):
+            left = deadline.time_left()
+            timeout.reschedule(now + max(left, 0) if left != math.inf else None)
+
+    def expire(self):
+        """End the deadline now, cancelling the waits running under it and under nested deadlines"""
+        self.expires_at = min(self.expires_at, time.monotonic())
+        self._reschedule()
+
+    def extend(self, expires_at: float):
+        """Move the deadline later, for work shared with a caller that can wait longer"""
+        if expires_at > self.expires_at:
+            self.expires_at = expires_at
+            self._reschedule()
+
+    def _chain(self) -> Iterator[Deadline]:
+        deadline: Deadline | None = self
+        while deadline is not None:
+            yield deadline
+            deadline = deadline.parent
+
+
+# Deadline of the current request, inherited by the tasks it spawns
+current_deadline: ContextVar[Deadline | None] = ContextVar("current_deadline", default=None)
+
+
+def expires_at() -> float:
+    """Monotonic time the current deadline passes at, infinity without one"""
+    deadline = current_deadline.get()
+    return time.monotonic() + deadline.time_left() if deadline is not None else math.inf
+
+
+def time_left() -> float | None:
+    """Seconds left until the current deadline, None without one"""
+    deadline = current_deadline.get()
+    return deadline.time_left() if deadline is not None else None
+
+
+def set_deadline(timeout: float | None) -> Deadline | None:
+    """Give the current context a deadline `timeout` seconds from now, within any it already has"""
+    parent = current_deadline.get()
+    if timeout is None:
+        return parent
+    deadline = Deadline(time.monotonic() + timeout, parent)
+    current_deadline.set(deadline)
+    return deadline
+
+
+@contextmanager
+def deadline_scope(timeout: float | None) -> Iterator[Deadline | None]:
+    """Run a block under a deadline `timeout` seconds from now, within any enclosing one"""
+    token = current_deadline.set(current_deadline.get())
+    try:
+        yield set_deadline(timeout)
+    finally:
+        current_deadline.reset(token)
+
+
+@asynccontextmanager
+async def enforce_deadline() -> AsyncIterator[None]:
+    """Cancel the enclosed work when the current deadline passes or is expired, raising `DeadlineExceededError`"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        yield
+        return
+
+    left = deadline.time_left()
+    if left <= 0:
+        raise DeadlineExceededError()
+    timeout = asyncio.timeout(left if left != math.inf else None)
+    chain = list(deadline._chain())
+    for owner in chain:
+        owner._timeouts[timeout] = deadline
+    try:
+        async with timeout:
+            yield
+    except TimeoutError as e:
+        if timeout.expired():
+            raise DeadlineExceededError() from e
+        raise
+    finally:
+        for owner in chain:
+            owner._timeouts.pop(timeout, None)
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import itertools
+import re
+from typing import Any
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Result fields that identify the same result across engines
+RESULT_KEY_FIELDS = ("href", "image", "url", "embed_url")
+
+# Fields hashed for near-duplicate detection per category, title first and then the snippet;
+# image and book results share titles too often to be told apart by text
+TEXT_FIELDS: dict[str, tuple[str, ...]] = {
+    "text": ("title", "body"),
+    "news": ("title", "body"),
+    "videos": ("title", "description"),
+    "images": (),
+    "books": (),
+}
+
+# Query parameters that only track the visit, never changing the page
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "ref_src"}
+
+MASK64 = (1 << 64) - 1
+WORD = re.compile(r"\w+")
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL for duplicate detection: scheme, `www.`, AMP variants, default ports, tracking parameters, fragment and trailing slash"""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+
+    host = (parts.hostname or "").lower().removeprefix("www.")
+    params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in TRACKING_PARAMS and not k.lower().startswith("utm_")]
+    path = parts.path.rstrip("/")
+    # Only a page marked as the AMP rendering by its host or query loses its AMP markers, an /amp path alone can be any page
+    amp_params = [(k, v) for k, v in params if is_amp_param(k, v)]
+    if host.startswith("amp.") or amp_params:
+        host = host.removeprefix("amp.")
+        path = path.removesuffix("/amp").removesuffix(".amp")
+        params = [param for param in params if param not in amp_params]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    return urlunsplit(("", host, path, urlencode(sorted(params)), ""))
+
+
+def is_amp_param(name: str, value: str) -> bool:
+    """Whether a query parameter asks for the AMP rendering of a page: `amp=1`, a bare `amp` or `outputType=amp`"""
+    name = name.lower()
+    return (name == "amp" and value in ("", "1")) or (name == "outputtype" and value.lower() == "amp")
+
+
+def result_key(result: dict[str, Any]) -> str | None:
+    """Identify a result across backends by its normalized URL"""
+    for name in RESULT_KEY_FIELDS:
+        if value := result.get(name):
+            return normalize_url(str(value))
+    return None
+
+
+def simhash(tokens: list[str]) -> int:
+    """64-bit SimHash of a token sequence, with word bigrams as features
+
+    Feature hashes are summed per bit in bit-sliced counters, where `planes[p]` holds bit `p` of all 64 counters,
+    so each feature costs a few integer operations instead of a loop over its bits.
+    Python's string hashes are salted per process, so hashes only compare within one process.
+    """
+    features = list(itertools.pairwise(tokens)) if len(tokens) > 1 else tokens
+    planes: list[int] = []
+    for feature in features:
+        carry = hash(feature) & MASK64
+        for p, plane in enumerate(planes):
+            planes[p] = plane ^ carry
+            carry &= plane
+            if not carry:
+                break
+        else:
+            planes.append(carry)
+
+    # Set the bits whose counter exceeds half the features, comparing all counters at once from the top bit down
+    threshold = len(features) // 2
+    greater, equal = 0, MASK64
+    for p in reversed(range(max(len(planes), threshold.bit_length()))):
+        plane = planes[p] if p < len(planes) else 0
+        if threshold >> p & 1:
+            equal &= plane
+        else:
+            greater |= equal & plane
+            equal &= ~plane
+    return greater
+
+
+class Deduplicator:
+    """Drop results whose normalized URL was already seen, or whose title and snippet are near-duplicates of a kept result
+
+    Near-duplicates are SimHashes within `max_distance` bits. The 64 bits are split into `max_distance + 1` bands,
+    any two such hashes agree on at least one band, so candidates are found by band lookup instead of comparing every pair.
+    With `merge`, a kept result takes fields it lacks and longer snippets from its duplicates.
+    """
+
+    def __init__(self, text_fields: tuple[str, ...] = (), max_distance: int = 3, merge: bool = True, min_tokens: int = 8):
+        self.text_fields = text_fields
+        self.max_distance = max_distance
+        self.merge = merge
+        # Shorter texts, such as bare titles, collide too easily to be compared
+        self.min_tokens = min_tokens
+        self.results: list[dict[str, Any]] = []
+        self.duplicates = 0
+        self._urls: dict[str, int] = {}
+        # SimHash per kept result index, and the indexes per band value
+        self._hashes: dict[int, int] = {}
+        self._band_bits = 64 // (max_distance + 1)
+        self._bands: list[dict[int, list[int]]] = [{} for _ in range(max_distance + 1)]
+
+    def _band_keys(self, value: int) -> list[int]:
+        mask = (1 << self._band_bits) - 1
+        return [value >> (i * self._band_bits) & mask for i in range(len(self._bands))]
+
+    def _near_duplicate(self, value: int) -> int | None:
+        for band, key in zip(self._bands, self._band_keys(value), strict=True):
+            for index in band.get(key, ()):
+                if (self._hashes[index] ^ value).bit_count() <= self.max_distance:
+                    return index
+        return None
+
+    def _merge_into(self, kept: dict[str, Any], duplicate: dict[str, Any]):
+        snippets = self.text_fields[1:]
+        for name, value in duplicate.items():
+            if not value:
+                continue
+            current = kept.get(name)
+            if not current or (name in snippets and isinstance(value, str) and isinstance(current, str) and len(value) > len(current)):
+                kept[name] = value
+
+    def add(self, result: dict[str, Any]) -> bool:
+        """Keep a result unless it duplicates one already kept, returning whether it was kept"""
+        url = result_key(result)
+        index = self._urls.get(url) if url is not None else None
+
+        value = None
+        if index is None and self.text_fields:
+            tokens = WORD.findall(" ".join(str(result.get(name) or "") for name in self.text_fields).casefold())
+            if len(tokens) >= self.min_tokens:
+                value = simhash(tokens)
+                index = self._near_duplicate(value)
+
+        if index is not None:
+            self.duplicates += 1
+            if self.merge:
+                self._merge_into(self.results[index], result)
+            if url is not None:
+                self._urls.setdefault(url, index)
+            return False
+
+        index = len(self.results)
+        self.results.append(result)
+        if url is not None:
+            self._urls[url] = index
+        if value is not None:
+            self._hashes[index] = value
+            for band, key in zip(self._bands, self._band_keys(value), strict=True):
+                band.setdefault(key, []).append(index)
+        return True
+
+
+def deduplicate(category: str, results: list[dict[str, Any]], max_distance: int = 3, merge: bool = True) -> list[dict[str, Any]]:
+    """Drop duplicate results, keeping the first, best ranked, of each"""
+    dedup = Deduplicator(TEXT_FIELDS.get(category, ()), max_distance=max_distance, merge=merge)
+    for result in results:
+        dedup.add(result)
+    return dedup.results
@@ -2,6 +2,8 @@ from concurrent.futures import ThreadPoolExecutor
 
 from app.config import settings
 
+from .metrics import track_thread_started
+
 # Thread pool executor for blocking I/O operations
 executor: ThreadPoolExecutor | None = None
 
@@ -18,7 +20,7 @@ def initialize_executor():
     global executor
 
     # Initialize thread pool executor
-    executor = ThreadPoolExecutor(max_workers=settings.executor_max_workers)
+    executor = ThreadPoolExecutor(max_workers=settings.executor_max_workers, initializer=track_thread_started)
 
 
 def cleanup_executor():
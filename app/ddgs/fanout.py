@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import defaultdict, deque
+from typing import Any
+
+from ddgs.engines import ENGINES
+
+from .dedup import result_key
+from .upstream import ThreadSearchClient, raise_no_results
+
+
+class LatencyTracker:
+    """Recent successful search latencies per category and backend"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: dict[tuple[str, str], deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, category: str, backend: str, latency: float):
+        self._samples[(category, backend)].append(latency)
+
+    def percentile(self, category: str, backend: str, percentile: float) -> float | None:
+        """Latency at `percentile` (0-100), or None until enough samples were recorded"""
+        samples = self._samples.get((category, backend))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(len(ordered) * percentile / 100), len(ordered) - 1)]
+
+
+class FanoutSearcher:
+    """Query several backends in parallel with hedged requests, merging the first results by reciprocal rank fusion"""
+
+    def __init__(
+        self,
+        upstream: ThreadSearchClient,
+        max_backends: int = 4,
+        hedge_percentile: float = 90,
+        hedge_delay: float = 1.0,
+        max_hedges: int = 1,
+        rrf_k: int = 60,
+    ):
+        self.upstream = upstream
+        self.max_backends = max_backends
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.max_hedges = max_hedges
+        self.rrf_k = rrf_k
+        self.latency = LatencyTracker()
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _backends(self, category: str, backend: str) -> list[str]:
+        """Backends to fan out to: the listed ones, or the highest-priority engines of the category for auto/all"""
+        names = [name.strip() for name in backend.split(",") if name.strip()]
+        if not names or "auto" in names or "all" in names:
+            engines = sorted(ENGINES[category].items(), key=lambda item: item[1].priority, reverse=True)
+            names = [name for name, _ in engines]
+        return [name for name in dict.fromkeys(names) if name in ENGINES[category]][: self.max_backends]
+
+    async def _search_backend(self, category: str, query: str, backend: str, params: dict[str, Any]) -> list[dict[str, Any]]:
+        """Search one backend, sending a duplicate request whenever the current ones are slower than the backend usually is"""
+        delay = self.latency.percentile(category, backend, self.hedge_percentile) or self.hedge_delay
+        started = time.monotonic()
+        original = asyncio.ensure_future(self.upstream.search(category, query, backend=backend, **params))
+        attempts = [original]
+        hedges = 0
+        error: Exception | None = None
+        try:
+            while attempts:
+                done, _ = await asyncio.wait(attempts, timeout=delay if hedges < self.max_hedges else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedges += 1
+                    self.hedges += 1
+                    attempts.append(asyncio.ensure_future(self.upstream.search(category, query, backend=backend, **params)))
+                    continue
+
+                for task in done:
+                    attempts.remove(task)
+                    if (error := task.exception()) is None:
+                        self.latency.record(category, backend, time.monotonic() - started)
+                        if task is not original:
+                            self.hedge_wins += 1
+                        return task.result()
+            raise error
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    def _fuse(self, ranked: dict[str, list[dict[str, Any]]], backends: list[str]) -> list[dict[str, Any]]:
+        """Merge ranked lists by reciprocal rank fusion, deduplicating by normalized URL
+
+        Ties are broken by best rank and then backend order, so the same inputs always merge the same way.
+        """
+        scores: dict[str, float] = {}
+        best: dict[str, tuple[int, int]] = {}
+        merged: dict[str, dict[str, Any]] = {}
+        for backend_index, backend in enumerate(backends):
+            for rank, result in enumerate(ranked.get(backend, [])):
+                key = result_key(result)
+                if key is None:
+                    continue
+                scores[key] = scores.get(key, 0.0) + 1 / (self.rrf_k + rank + 1)
+                if key not in merged:
+                    merged[key] = result
+                    best[key] = (rank, backend_index)
+                else:
+                    best[key] = min(best[key], (rank, backend_index))
+
+        order = sorted(merged, key=lambda key: (-scores[key], best[key]))
+        return [merged[key] for key in order]
+
+    async def search(self, category: str, query: str, backend: str = "auto", **params: Any) -> list[dict[str, Any]]:
+        """Search several backends at once, stopping as soon as `max_results` unique results are gathered"""
+        max_results = params.get("max_results", 10)
+        backends = self._backends(category, backend)
+        tasks = {asyncio.ensure_future(self._search_backend(category, query, name, params)): name for name in backends}
+        ranked: dict[str, list[dict[str, Any]]] = {}
+        seen: set[str] = set()
+        err: Exception | None = None
+
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        ranked[tasks[task]] = results = task.result()
+                    except Exception as e:
+                        err = e
+                        continue
+                    seen.update(key for result in results if (key := result_key(result)) is not None)
+                if max_results and len(seen) >= max_results:
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+
+        # Duplicates under different URLs only surface once the backends' results are merged
+        results = self.upstream.deduplicate(category, self._fuse(ranked, backends))
+        if results:
+            return results[:max_results] if max_results else results
+        raise_no_results(err)
+
+    def stats(self) -> dict[str, Any]:
+        """Get hedging counters"""
+        return {"hedges": self.hedges, "hedge_wins": self.hedge_wins}
@@ -0,0 +1,527 @@
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import re
+import socket
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterable, AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from importlib.util import find_spec
+from typing import Any
+
+import httpcore
+import httpx
+from lxml import etree
+
+from . import metrics
+from .deadline import DeadlineExceededError, enforce_deadline
+from .models import PageContent
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+# Elements whose text is never page content
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "math", "canvas", "iframe", "object", "select", "button", "head"}
+
+# Elements that usually hold navigation and other boilerplate rather than the page's content
+BOILERPLATE_TAGS = {"nav", "header", "footer", "aside", "form", "menu", "dialog"}
+
+# Class and id words marking boilerplate containers
+BOILERPLATE_WORDS = {
+    "ad",
+    "ads",
+    "advert",
+    "banner",
+    "breadcrumb",
+    "breadcrumbs",
+    "comment",
+    "comments",
+    "cookie",
+    "cookies",
+    "footer",
+    "header",
+    "menu",
+    "modal",
+    "nav",
+    "navbar",
+    "newsletter",
+    "popup",
+    "promo",
+    "related",
+    "share",
+    "sidebar",
+    "social",
+    "subscribe",
+}
+
+# Elements whose text the main content is looked for in first
+MAIN_TAGS = {"main", "article"}
+
+# Elements starting and ending a block of text
+BLOCK_TAGS = {
+    "address",
+    "article",
+    "blockquote",
+    "body",
+    "br",
+    "caption",
+    "dd",
+    "details",
+    "div",
+    "dl",
+    "dt",
+    "figcaption",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "hr",
+    "li",
+    "main",
+    "ol",
+    "p",
+    "pre",
+    "section",
+    "summary",
+    "table",
+    "td",
+    "th",
+    "tr",
+    "ul",
+}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+# Media types whose text can be extracted
+HTML_MEDIA_TYPES = {"text/html", "application/xhtml+xml"}
+TEXT_MEDIA_TYPES = HTML_MEDIA_TYPES | {"text/plain"}
+
+WHITESPACE = re.compile(r"\s+")
+WORD_SPLIT = re.compile(r"[^a-z0-9]+")
+
+
+class FetchError(Exception):
+    """Raised when a page cannot be fetched or holds no extractable text"""
+
+
+@dataclass(slots=True)
+class Block:
+    """A run of text between block elements"""
+
+    text: str
+    link_chars: int
+    heading: bool
+    boilerplate: bool
+    main: bool
+
+
+class TextExtractor:
+    """lxml parser target turning HTML fed in chunks into the page's readable text, readability-style
+
+    Text is split into blocks at block elements. Script-like elements are skipped, blocks that are mostly link text are dropped,
+    and boilerplate containers (navigation, headers, footers, sidebars) as well as text outside `<main>`/`<article>` are left out
+    unless without them too little text remains.
+    """
+
+    max_link_density = 0.5
+    # Characters of text that are enough to leave out the boilerplate or everything outside the main content
+    min_content_chars = 200
+
+    def __init__(self):
+        self.blocks: list[Block] = []
+        self._title: list[str] = []
+        self._text: list[str] = []
+        self._link_chars = 0
+        # Open elements with the counters they raised, closed up to the matching tag
+        self._stack: list[tuple[str, tuple[int, int, int, int, int, int]]] = []
+        self._skip = self._boilerplate = self._main = self._link = self._heading = self._in_title = 0
+
+    def start(self, tag: str, attrib: dict[str, str]):
+        if tag in BLOCK_TAGS:
+            self._flush()
+        words = set(WORD_SPLIT.split(f"{attrib.get('class', '')} {attrib.get('id', '')}".lower()))
+        raised = (
+            int(tag in SKIPPED_TAGS or "hidden" in attrib or attrib.get("aria-hidden") == "true"),
+            int(tag in BOILERPLATE_TAGS or (tag not in ("html", "body", *MAIN_TAGS) and not words.isdisjoint(BOILERPLATE_WORDS))),
+            int(tag in MAIN_TAGS or attrib.get("role") == "main"),
+            int(tag == "a"),
+            int(tag in HEADING_TAGS),
+            int(tag == "title"),
+        )
+        self._raise(raised, 1)
+        self._stack.append((tag, raised))
+
+    def end(self, tag: str):
+        if not any(open_tag == tag for open_tag, _ in self._stack):
+            return
+        if tag in BLOCK_TAGS:
+            self._flush()
+        while self._stack:
+            open_tag, raised = self._stack.pop()
+            self._raise(raised, -1)
+            if open_tag == tag:
+                break
+
+    def data(self, data: str):
+        if self._in_title:
+            self._title.append(data)
+        elif not self._skip:
+            self._text.append(data)
+            if self._link:
+                self._link_chars += len(data.strip())
+
+    def comment(self, text: str):
+        pass
+
+    def close(self) -> tuple[str | None, str]:
+        self._flush()
+        title = WHITESPACE.sub(" ", "".join(self._title)).strip() or None
+        return title, self.text()
+
+    def _raise(self, raised: tuple[int, ...], sign: int):
+        skip, boilerplate, main, link, heading, in_title = raised
+        self._skip += sign * skip
+        self._boilerplate += sign * boilerplate
+        self._main += sign * main
+        self._link += sign * link
+        self._heading += sign * heading
+        self._in_title += sign * in_title
+
+    def _flush(self):
+        text = WHITESPACE.sub(" ", "".join(self._text)).strip()
+        if text:
+            self.blocks.append(Block(text, self._link_chars, bool(self._heading), bool(self._boilerplate), bool(self._main)))
+        self._text.clear()
+        self._link_chars = 0
+
+    def text(self) -> str:
+        """Join the blocks making up the readable text"""
+        blocks = [block for block in self.blocks if block.heading or block.link_chars <= self.max_link_density * len(block.text)]
+        for keep in (lambda block: block.main and not block.boilerplate, lambda block: not block.boilerplate):
+            selected = [block for block in blocks if keep(block)]
+            if sum(len(block.text) for block in selected) >= self.min_content_chars:
+                blocks = selected
+                break
+        lines: list[str] = []
+        for block in blocks:
+            if not lines or lines[-1] != block.text:
+                lines.append(block.text)
+        return "\n".join(lines)
+
+
+def fetch_error(error: BaseException) -> str:
+    """Describe why a page could not be fetched"""
+    if isinstance(error, DeadlineExceededError | FetchError):
+        return str(error)
+    if isinstance(error, TimeoutError | httpx.TimeoutException):
+        return "Timed out fetching the page"
+    return f"Error fetching the page: {error or type(error).__name__}"
+
+
+@dataclass(slots=True)
+class CachedPage:
+    """A fetched page with the validators to revalidate it"""
+
+    page: PageContent
+    etag: str | None
+    last_modified: str | None
+    fetched_at: float
+
+
+def is_public_address(address: str) -> bool:
+    """Whether an IP address is routable on the internet"""
+    ip = ipaddress.ip_address(address)
+    return ip.is_global and not ip.is_multicast
+
+
+async def resolve_public(host: str, port: int) -> list[str]:
+    """Resolve a host to its addresses, refusing it when any of them is not public"""
+    try:
+        addresses = [str(ipaddress.ip_address(host))]
+    except ValueError:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError as e:
+            raise FetchError(f"Cannot resolve {host}") from e
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    if not all(is_public_address(address) for address in addresses):
+        raise FetchError(f"Refusing to fetch non-public address of {host}")
+    return addresses
+
+
+class PublicNetworkBackend(httpcore.AsyncNetworkBackend):
+    """Connects only to public addresses, resolving each host once and connecting to the addresses it checked
+
+    Checking a name and letting the connection resolve it again would let DNS answer with a private address the second time.
+    TLS and the Host header still use the host name, only the TCP connection goes to the checked address.
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend | None = None):
+        self.backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host: str, port: int, timeout: float | None = None, local_address: str | None = None, socket_options: Any = None) -> httpcore.AsyncNetworkStream:
+        addresses = await resolve_public(host, port)
+        for address in addresses[:-1]:
+            try:
+                return await self.backend.connect_tcp(address, port, timeout=timeout, local_address=local_address, socket_options=socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                continue
+        return await self.backend.connect_tcp(addresses[-1], port, timeout=timeout, local_address=local_address, socket_options=socket_options)
+
+    async def connect_unix_socket(self, path: str, timeout: float | None = None, socket_options: Any = None) -> httpcore.AsyncNetworkStream:
+        raise FetchError("Refusing to fetch over a Unix socket")
+
+    async def sleep(self, seconds: float):
+        await self.backend.sleep(seconds)
+
+
+# httpcore errors that httpx raises as its namesakes
+HTTPCORE_ERRORS = (httpcore.TimeoutException, httpcore.NetworkError, httpcore.ProtocolError, httpcore.ProxyError, httpcore.UnsupportedProtocol)
+
+
+@contextmanager
+def httpx_errors() -> Iterator[None]:
+    """Raise httpcore errors as the httpx errors of the same name, like httpx's own transport"""
+    try:
+        yield
+    except HTTPCORE_ERRORS as e:
+        raise getattr(httpx, type(e).__name__, httpx.TransportError)(str(e)) from e
+
+
+class PublicResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream: AsyncIterable[bytes]):
+        self.stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with httpx_errors():
+            async for chunk in self.stream:
+                yield chunk
+
+    async def aclose(self):
+        if hasattr(self.stream, "aclose"):
+            await self.stream.aclose()
+
+
+class PublicTransport(httpx.AsyncBaseTransport):
+    """An httpx transport whose connections only go to public addresses, over an httpcore pool using `PublicNetworkBackend`
+
+    httpx's own transport takes no network backend, so this one builds the pool and maps requests and responses the same way.
+    """
+
+    def __init__(self, verify: bool = True, http2: bool = False, limits: httpx.Limits = httpx.Limits()):
+        self.pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(verify=verify),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=PublicNetworkBackend(),
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = httpcore.URL(scheme=request.url.raw_scheme, host=request.url.raw_host, port=request.url.port, target=request.url.raw_path)
+        core_request = httpcore.Request(method=request.method, url=url, headers=request.headers.raw, content=request.stream, extensions=request.extensions)
+        with httpx_errors():
+            response = await self.pool.handle_async_request(core_request)
+        return httpx.Response(status_code=response.status, headers=response.headers, stream=PublicResponseStream(response.stream), extensions=response.extensions)
+
+    async def aclose(self):
+        await self.pool.aclose()
+
+
+class PageFetcher:
+    """Fetches pages concurrently with a pooled HTTP client and extracts their readable text while they download
+
+    Connections are limited per host as well as in total, at most `max_bytes` of a page are read, and pages are cached by URL
+    for `cache_ttl` seconds, then revalidated with their ETag or Last-Modified date. Unless `allow_private`, URLs, including
+    redirects, that resolve to private, loopback or link-local addresses are refused. Connections go to the addresses checked,
+    except through a proxy, which resolves the names itself.
+    """
+
+    def __init__(
+        self,
+        proxy: str | None = None,
+        verify: bool = True,
+        timeout: float = 10,
+        max_connections: int = 100,
+        max_per_host: int = 4,
+        max_bytes: int = 2 * 1024 * 1024,
+        max_chars: int = 20000,
+        cache_ttl: float = 600,
+        cache_max_entries: int = 1000,
+        cache_max_bytes: int = 64 * 1024 * 1024,
+        allow_private: bool = False,
+        http2: bool = True,
+    ):
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self.cache_max_bytes = cache_max_bytes
+        self.allow_private = allow_private
+        self.proxy = proxy
+        http2 = http2 and find_spec("h2") is not None
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.transport: httpx.AsyncBaseTransport
+        if not allow_private and proxy is None:
+            self.transport = PublicTransport(verify=verify, http2=http2, limits=limits)
+        else:
+            self.transport = httpx.AsyncHTTPTransport(proxy=proxy, verify=verify, http2=http2, limits=limits)
+        self.client = httpx.AsyncClient(
+            transport=self.transport,
+            timeout=timeout,
+            headers=DEFAULT_HEADERS,
+            follow_redirects=True,
+            event_hooks={"request": [self._check_target]},
+        )
+        # Per-host connection slots with the number of fetches holding or waiting for them, dropped once unused
+        self._hosts: dict[str, tuple[asyncio.Semaphore, list[int]]] = {}
+        self._cache: OrderedDict[str, CachedPage] = OrderedDict()
+        self._cache_bytes = 0
+        # Fetches in progress, shared by everyone asking for the same URL
+        self._inflight: dict[str, asyncio.Task[PageContent]] = {}
+
+    async def fetch(self, url: str) -> PageContent:
+        """Get the readable text of a page, from the cache while it is fresh"""
+        cached = self._cache.get(url)
+        if cached is not None and time.monotonic() - cached.fetched_at < self.cache_ttl:
+            self._cache.move_to_end(url)
+            metrics.page_fetches.inc(outcome="cached")
+            return cached.page
+
+        task = self._inflight.get(url)
+        if task is None:
+            task = self._inflight[url] = asyncio.create_task(self._fetch(url, cached))
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+            # Retrieve the error even when every caller gave up waiting
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        # Callers giving up leave the fetch running for the others and the cache
+        return await asyncio.shield(task)
+
+    async def fetch_all(self, urls: list[str]) -> list[PageContent | Exception]:
+        """Fetch pages concurrently within the current deadline, each giving its text or the error it failed with"""
+
+        async def fetch(url: str) -> PageContent:
+            async with enforce_deadline(), asyncio.timeout(self.timeout):
+                return await self.fetch(url)
+
+        return await asyncio.gather(*(fetch(url) for url in urls), return_exceptions=True)
+
+    async def _fetch(self, url: str, cached: CachedPage | None) -> PageContent:
+        headers = {}
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+        started = time.perf_counter()
+        try:
+            async with self._host_slot(httpx.URL(url).host), self.client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 304 and cached is not None:
+                    cached.fetched_at = time.monotonic()
+                    metrics.page_fetches.inc(outcome="revalidated")
+                    return cached.page
+                if response.status_code >= 400:
+                    raise FetchError(f"HTTP {response.status_code} fetching the page")
+                media_type = response.headers.get("content-type", "text/html").split(";")[0].strip().lower()
+                if media_type not in TEXT_MEDIA_TYPES:
+                    raise FetchError(f"Unsupported content type: {media_type}")
+                page = await self._extract(response, media_type)
+        except Exception:
+            metrics.page_fetches.inc(outcome="failed")
+            raise
+        finally:
+            metrics.page_fetch_seconds.observe(time.perf_counter() - started)
+
+        metrics.page_fetches.inc(outcome="fetched")
+        if "no-store" not in response.headers.get("cache-control", ""):
+            self._store(url, CachedPage(page, response.headers.get("etag"), response.headers.get("last-modified"), time.monotonic()))
+        return page
+
+    async def _extract(self, response: httpx.Response, media_type: str) -> PageContent:
+        """Read up to `max_bytes` of the body, feeding HTML to the extractor chunk by chunk as it arrives"""
+        extractor = TextExtractor() if media_type in HTML_MEDIA_TYPES else None
+        parser = etree.HTMLParser(target=extractor, encoding=response.charset_encoding) if extractor is not None else None
+        chunks: list[bytes] = []
+        size, truncated = 0, False
+        async for chunk in response.aiter_bytes():
+            if size + len(chunk) > self.max_bytes:
+                chunk, truncated = chunk[: self.max_bytes - size], True
+            size += len(chunk)
+            if parser is not None:
+                parser.feed(chunk)
+            else:
+                chunks.append(chunk)
+            if truncated:
+                break
+
+        if parser is not None:
+            try:
+                title, text = parser.close()
+            except etree.LxmlError:
+                title, text = None, ""
+        else:
+            title, text = None, b"".join(chunks).decode(response.charset_encoding or "utf-8", errors="replace").strip()
+
+        if not text:
+            raise FetchError("No text found on the page")
+        if len(text) > self.max_chars:
+            text, truncated = text[: self.max_chars], True
+        return PageContent(url=str(response.url), title=title, text=text, truncated=truncated)
+
+    @asynccontextmanager
+    async def _host_slot(self, host: str) -> AsyncIterator[None]:
+        """Hold one of the host's connection slots"""
+        slot = self._hosts.get(host)
+        if slot is None:
+            slot = self._hosts[host] = (asyncio.Semaphore(self.max_per_host), [0])
+        semaphore, users = slot
+        users[0] += 1
+        try:
+            async with semaphore:
+                yield
+        finally:
+            users[0] -= 1
+            if not users[0]:
+                self._hosts.pop(host, None)
+
+    async def _check_target(self, request: httpx.Request):
+        """Refuse non-HTTP URLs, and unless allowed, hosts resolving to non-public addresses when going through a proxy
+
+        Without a proxy, the network backend checks the addresses it connects to.
+        """
+        if request.url.scheme not in ("http", "https"):
+            raise FetchError(f"Unsupported URL scheme: {request.url.scheme}")
+        if not self.allow_private and self.proxy is not None:
+            await resolve_public(request.url.host, request.url.port or (443 if request.url.scheme == "https" else 80))
+
+    def _store(self, url: str, entry: CachedPage):
+        """Cache a page, evicting the least recently used ones beyond the entry and byte limits"""
+        previous = self._cache.pop(url, None)
+        if previous is not None:
+            self._cache_bytes -= len(previous.page.text)
+        self._cache[url] = entry
+        self._cache_bytes += len(entry.page.text)
+        while self._cache and (len(self._cache) > self.cache_max_entries or self._cache_bytes > self.cache_max_bytes):
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted.page.text)
+
+    def stats(self) -> dict[str, Any]:
+        """Get cached page counts and fetches in progress"""
+        return {"cached_pages": len(self._cache), "cached_bytes": self._cache_bytes, "inflight": len(self._inflight)}
+
+    async def close(self):
+        """Cancel fetches in progress and close the HTTP client"""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        await self.client.aclose()
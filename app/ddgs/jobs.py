@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from pydantic import BaseModel
+
+from . import metrics
+from .codec import decode_items, encode_items
+from .deadline import DeadlineExceededError
+from .limiter import OverloadedError
+from .models import JobResult, JobStatus
+from .tenants import current_tenant
+
+if TYPE_CHECKING:
+    from .ddgs import AsyncDDGS
+
+logger = logging.getLogger(__name__)
+
+# Task states: 0 waiting to run or to be retried, 1 claimed by a worker, 2 finished with results or an error
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        tenant TEXT NOT NULL,
+        limits TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        finished INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS jobs_tenant ON jobs (tenant, created_at)",
+    """CREATE TABLE IF NOT EXISTS tasks (
+        job_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        params TEXT NOT NULL,
+        state INTEGER NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        not_before REAL NOT NULL DEFAULT 0,
+        position INTEGER,
+        results BLOB,
+        error TEXT,
+        PRIMARY KEY (job_id, seq)
+    )""",
+    # Unfinished tasks by position in their job, so claims go round the jobs instead of draining the oldest first
+    "CREATE INDEX IF NOT EXISTS tasks_unfinished ON tasks (seq) WHERE state < 2",
+    "CREATE INDEX IF NOT EXISTS tasks_finished ON tasks (job_id, position) WHERE state = 2",
+)
+
+# A tenant's job, and all its jobs, with the columns `job_status` takes
+SELECT_JOB = "SELECT id, total, finished, failed, created_at, started_at, finished_at FROM jobs WHERE id = ? AND tenant = ?"
+SELECT_JOBS = "SELECT id, total, finished, failed, created_at, started_at, finished_at FROM jobs WHERE tenant = ? ORDER BY created_at DESC"
+
+# Pending tasks that are due, and claimed ones whose lease ran out because their worker stopped
+CLAIM = """UPDATE tasks SET state = 1, not_before = ? WHERE rowid = (
+        SELECT rowid FROM tasks WHERE state < 2 AND not_before <= ? ORDER BY seq, rowid LIMIT 1
+    ) RETURNING job_id, seq, category, params, attempts"""
+
+
+@dataclass(frozen=True, slots=True)
+class JobTask:
+    """One search of a job, claimed by a worker"""
+
+    job_id: str
+    seq: int
+    category: str
+    params: dict[str, Any]
+    attempts: int
+    tenant: str
+    limits: dict[str, float]
+
+
+def job_status(row: tuple) -> JobStatus:
+    job_id, total, finished, failed, created_at, started_at, finished_at = row
+    status = "done" if finished >= total else "running" if started_at is not None else "queued"
+    return JobStatus(id=job_id, status=status, total=total, finished=finished, failed=failed, created_at=created_at, started_at=started_at, finished_at=finished_at)
+
+
+class JobStore:
+    """Search jobs and their searches in an on-disk SQLite queue
+
+    Every finished search is stored with its results as it completes, so a job survives restarts and resumes where it
+    stopped. Claimed searches hold a lease, and are claimed again once it runs out, should their worker have stopped.
+    Several worker processes may share one queue file.
+    """
+
+    def __init__(self, path: str, lease: float = 120):
+        self.path = path
+        self.lease = lease
+        self._conn: sqlite3.Connection | None = None
+        # A single thread owns the connection, keeping disk I/O off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs-sqlite")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _transaction(self, func, *args):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn, *args)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _create(self, conn: sqlite3.Connection, tenant: str, limits: dict[str, float], searches: list[tuple[str, dict[str, Any]]]) -> tuple:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn.execute("INSERT INTO jobs (id, tenant, limits, total, created_at) VALUES (?, ?, ?, ?, ?)", (job_id, tenant, json.dumps(limits), len(searches), now))
+        conn.executemany(
+            "INSERT INTO tasks (job_id, seq, category, params) VALUES (?, ?, ?, ?)",
+            ((job_id, seq, category, json.dumps(params, separators=(",", ":"))) for seq, (category, params) in enumerate(searches)),
+        )
+        return job_id, len(searches), 0, 0, now, None, None
+
+    async def create(self, tenant: str, limits: dict[str, float] | None, searches: list[tuple[str, dict[str, Any]]]) -> JobStatus:
+        """Queue a job of (category, params) searches for a tenant"""
+        return job_status(await self._call(self._transaction, self._create, tenant, limits or {}, searches))
+
+    def _get(self, job_id: str, tenant: str) -> tuple | None:
+        return self._connect().execute(SELECT_JOB, (job_id, tenant)).fetchone()
+
+    async def get(self, job_id: str, tenant: str) -> JobStatus | None:
+        """Get a tenant's job, None when it has no such job"""
+        row = await self._call(self._get, job_id, tenant)
+        return job_status(row) if row is not None else None
+
+    async def jobs(self, tenant: str) -> list[JobStatus]:
+        """Get a tenant's jobs, the newest first"""
+        rows = await self._call(lambda: self._connect().execute(SELECT_JOBS, (tenant,)).fetchall())
+        return [job_status(row) for row in rows]
+
+    def _delete(self, conn: sqlite3.Connection, job_id: str, tenant: str) -> bool:
+        if not conn.execute("DELETE FROM jobs WHERE id = ? AND tenant = ?", (job_id, tenant)).rowcount:
+            return False
+        conn.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+        return True
+
+    async def delete(self, job_id: str, tenant: str) -> bool:
+        """Cancel and remove a tenant's job with its results. Returns whether it existed"""
+        return await self._call(self._transaction, self._delete, job_id, tenant)
+
+    def _claim(self, conn: sqlite3.Connection) -> JobTask | None:
+        now = time.time()
+        row = conn.execute(CLAIM, (now + self.lease, now)).fetchone()
+        if row is None:
+            return None
+        job_id, seq, category, params, attempts = row
+        tenant, limits = conn.execute("SELECT tenant, limits FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.execute("UPDATE jobs SET started_at = ? WHERE id = ? AND started_at IS NULL", (now, job_id))
+        return JobTask(job_id=job_id, seq=seq, category=category, params=json.loads(params), attempts=attempts, tenant=tenant, limits=json.loads(limits))
+
+    async def claim(self) -> JobTask | None:
+        """Take the next due search, round-robin across jobs, None when there is none"""
+        return await self._call(self._transaction, self._claim)
+
+    def _finish(self, conn: sqlite3.Connection, task: JobTask, results: bytes | None, error: str | None):
+        (position,) = conn.execute("SELECT finished FROM jobs WHERE id = ?", (task.job_id,)).fetchone() or (None,)
+        if position is None:
+            # Deleted while the search ran
+            return
+        finished = conn.execute(
+            "UPDATE tasks SET state = 2, position = ?, results = ?, error = ? WHERE job_id = ? AND seq = ? AND state = 1",
+            (position, results, error, task.job_id, task.seq),
+        ).rowcount
+        if finished:
+            conn.execute(
+                "UPDATE jobs SET finished = finished + 1, failed = failed + ?, finished_at = CASE WHEN finished + 1 >= total THEN ? END WHERE id = ?",
+                (error is not None, time.time(), task.job_id),
+            )
+
+    async def finish(self, task: JobTask, results: list[BaseModel] | None = None, error: str | None = None):
+        """Store a finished search's results, or its error"""
+        data = encode_items(task.category, results) if results else None
+        await self._call(self._transaction, self._finish, task, data, error)
+
+    def _release(self, conn: sqlite3.Connection, task: JobTask, delay: float, attempt: bool, hold_job: bool):
+        not_before = time.time() + delay
+        conn.execute(
+            "UPDATE tasks SET state = 0, not_before = ?, attempts = attempts + ? WHERE job_id = ? AND seq = ? AND state = 1",
+            (not_before, int(attempt), task.job_id, task.seq),
+        )
+        if hold_job:
+            conn.execute("UPDATE tasks SET not_before = MAX(not_before, ?) WHERE job_id = ? AND state = 0", (not_before, task.job_id))
+
+    async def release(self, task: JobTask, delay: float, attempt: bool = True, hold_job: bool = False):
+        """Put a claimed search back to run again in `delay` seconds, with the rest of its job when `hold_job`
+
+        Counts an attempt unless the search did not get to run.
+        """
+        await self._call(self._transaction, self._release, task, delay, attempt, hold_job)
+
+    def _results(self, job_id: str, tenant: str, after: int, limit: int) -> tuple[tuple | None, list[JobResult]]:
+        conn = self._connect()
+        job = self._get(job_id, tenant)
+        if job is None:
+            return None, []
+        rows = conn.execute(
+            "SELECT seq, category, params, results, error FROM tasks WHERE job_id = ? AND state = 2 AND position >= ? ORDER BY position LIMIT ?",
+            (job_id, after, limit),
+        ).fetchall()
+        results = [
+            JobResult(index=seq, category=category, query=json.loads(params)["query"], results=decode_items(data) if data else [], error=error)
+            for seq, category, params, data, error in rows
+        ]
+        return job, results
+
+    async def results(self, job_id: str, tenant: str, after: int = 0, limit: int = 100) -> tuple[JobStatus | None, list[JobResult]]:
+        """Get a tenant's job and up to `limit` of its results from the `after`th finished search on, in the order they finished"""
+        job, results = await self._call(self._results, job_id, tenant, after, limit)
+        return (job_status(job) if job is not None else None), results
+
+    def _purge(self, conn: sqlite3.Connection, before: float) -> int:
+        job_ids = [job_id for (job_id,) in conn.execute("SELECT id FROM jobs WHERE finished_at < ?", (before,))]
+        conn.executemany("DELETE FROM tasks WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+        conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+        return len(job_ids)
+
+    async def purge(self, before: float) -> int:
+        """Remove jobs finished before `before`, in seconds since the epoch. Returns how many"""
+        return await self._call(self._transaction, self._purge, before)
+
+    async def close(self):
+        """Close the database"""
+
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        await self._call(_close)
+        self._executor.shutdown(wait=True)
+
+
+class JobRunner:
+    """Workers running the searches of queued jobs in the background
+
+    Each search counts against its job's API key rate limit and quota like a request would, and runs in the key's turn
+    of the fair scheduler. A throttled search, or one shed by admission control, is put back until the limit allows it
+    instead of holding a worker. Failed searches are retried with exponential backoff up to `max_attempts` times.
+    """
+
+    # Seconds between housekeeping passes removing expired jobs
+    purge_interval = 60
+
+    def __init__(self, ddgs: AsyncDDGS, store: JobStore, concurrency: int = 10, max_attempts: int = 3, timeout: float | None = None, retention: float = 7 * 86400):
+        self.ddgs = ddgs
+        self.store = store
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.retention = retention
+        self.poll_interval = 1.0
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        """Start the workers, which pick up jobs left unfinished by a previous run"""
+        if not self._tasks:
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._work()) for _ in range(self.concurrency)]
+            self._tasks.append(loop.create_task(self._housekeep()))
+
+    async def submit(self, tenant: str, limits: dict[str, float] | None, searches: list[tuple[str, dict[str, Any]]]) -> JobStatus:
+        """Queue a job and wake the workers"""
+        status = await self.store.create(tenant, limits, searches)
+        self._wakeup.set()
+        return status
+
+    async def _work(self):
+        while True:
+            try:
+                task = await self.store.claim()
+            except sqlite3.Error as e:
+                logger.warning(f"Error claiming job search: {e}")
+                task = None
+            if task is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(task)
+            except asyncio.CancelledError:
+                # Shutting down, leave the search for the next start instead of waiting out its lease
+                await self.store.release(task, 0, attempt=False)
+                raise
+            except sqlite3.Error as e:
+                # The lease runs out and the search is claimed again
+                logger.warning(f"Error saving job search: {e}, job: {task.job_id}")
+
+    async def _run(self, task: JobTask):
+        """Run one search of a job, and store its results or put it back to retry"""
+        current_tenant.set(task.tenant)
+        params = {"timeout": self.timeout, **task.params}
+        try:
+            self.ddgs.tenants.check(task.tenant, task.limits)
+            results = await getattr(self.ddgs, task.category)(**params)
+        except DeadlineExceededError as e:
+            await self._retry(task, e, 2**task.attempts)
+        except OverloadedError as e:
+            # Over the API key's limits or shed by admission control: hold the whole job back until they allow more, without using up attempts
+            metrics.job_searches.inc(outcome="throttled")
+            await self.store.release(task, e.retry_after, attempt=False, hold_job=True)
+        except Exception as e:
+            if "No results found" in str(e):
+                metrics.job_searches.inc(outcome="done")
+                await self.store.finish(task, [])
+            else:
+                await self._retry(task, e, 2**task.attempts)
+        else:
+            metrics.job_searches.inc(outcome="done")
+            await self.store.finish(task, results)
+
+    async def _retry(self, task: JobTask, error: Exception, delay: float):
+        if task.attempts + 1 >= self.max_attempts:
+            logger.info(f"Job search failed after {task.attempts + 1} attempts: {error!r}, job: {task.job_id}")
+            metrics.job_searches.inc(outcome="failed")
+            await self.store.finish(task, error=str(error) or type(error).__name__)
+        else:
+            metrics.job_searches.inc(outcome="retried")
+            await self.store.release(task, max(delay, 1))
+
+    async def _housekeep(self):
+        while True:
+            try:
+                if purged := await self.store.purge(time.time() - self.retention):
+                    logger.info(f"Removed {purged} expired search jobs")
+            except sqlite3.Error as e:
+                logger.warning(f"Error removing expired search jobs: {e}")
+            await asyncio.sleep(self.purge_interval)
+
+    async def close(self):
+        """Stop the workers, their claimed searches are picked up again on the next start, and close the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.store.close()
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
+from . import metrics
+
+
+class OverloadedError(Exception):
+    """Raised when an upstream engine sheds a search instead of queueing it"""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(OverloadedError):
+    """Raised while an engine's circuit breaker is open"""
+
+    status_code = 503
+
+
+class QueueFullError(OverloadedError):
+    """Raised when an engine's concurrency limit is reached and its wait queue is full or too slow"""
+
+    status_code = 429
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit driven by observed latency and errors
+
+    The limit grows by about one per window of successful searches. It shrinks multiplicatively when a search fails,
+    or when the short-term average latency exceeds `latency_tolerance` times the long-term one, at most once per window
+    so a burst of slow or failed searches counts as one congestion signal.
+    """
+
+    def __init__(
+        self,
+        initial: int = 20,
+        min_limit: int = 2,
+        max_limit: int = 200,
+        latency_tolerance: float = 2.0,
+        max_queue: int = 100,
+        queue_timeout: float = 2.0,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        # Exponential moving averages of latency, the long one being the healthy baseline
+        self.short_latency: float | None = None
+        self.long_latency: float | None = None
+        self._since_decrease = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self):
+        """Wait for a concurrency slot, shedding the search if the wait queue is full or the wait too long"""
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            raise QueueFullError(f"Concurrency limit of {int(self.limit)} reached and wait queue full", retry_after=self.queue_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as the wait ended
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise QueueFullError(f"Waited {self.queue_timeout}s for a slot under concurrency limit {int(self.limit)}", retry_after=self.queue_timeout) from e
+            raise
+
+    def release(self):
+        """Free a slot, handing it to the oldest waiter while under the limit"""
+        self.inflight -= 1
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def _decrease(self, factor: float):
+        if self._since_decrease >= self.limit:
+            self.limit = max(self.min_limit, self.limit * factor)
+            self._since_decrease = 0
+
+    def on_success(self, latency: float):
+        self._since_decrease += 1
+        if self.short_latency is None or self.long_latency is None:
+            self.short_latency = self.long_latency = latency
+        self.short_latency += 0.2 * (latency - self.short_latency)
+        self.long_latency += 0.02 * (latency - self.long_latency)
+        if self.short_latency > self.latency_tolerance * self.long_latency:
+            self._decrease(0.9)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_failure(self):
+        self._since_decrease += 1
+        self._decrease(0.5)
+
+
+class CircuitBreaker:
+    """Opens when the error rate over recent searches crosses a threshold, then probes with a few searches once `reset_timeout` passes"""
+
+    def __init__(self, failure_rate: float = 0.5, window: int = 20, min_requests: int = 10, reset_timeout: float = 30, half_open_probes: int = 1):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probes = 0
+        self._outcomes: deque[bool] = deque(maxlen=window)
+
+    def allow(self):
+        """Let a search through, or raise while the circuit is open"""
+        if self.state == "open":
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError("Circuit breaker open after repeated upstream failures", retry_after=remaining)
+            self.state = "half_open"
+            self.probes = 0
+
+        if self.state == "half_open":
+            if self.probes >= self.half_open_probes:
+                raise CircuitOpenError("Circuit breaker probing upstream", retry_after=1)
+            self.probes += 1
+
+    def cancel_probe(self):
+        """Give back a probe slot taken by a search that never reached upstream"""
+        if self.state == "half_open" and self.probes > 0:
+            self.probes -= 1
+
+    def on_success(self):
+        if self.state == "half_open":
+            self.state = "closed"
+            self._outcomes.clear()
+        self._outcomes.append(True)
+
+    def on_failure(self):
+        if self.state == "half_open":
+            self._open()
+            return
+
+        self._outcomes.append(False)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.failure_rate:
+            self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self._outcomes.clear()
+
+
+class AdmissionController:
+    """Per-engine concurrency limiter and circuit breaker in front of upstream searches"""
+
+    def __init__(self, limiter_options: dict[str, Any] | None = None, breaker_options: dict[str, Any] | None = None):
+        self.limiter_options = limiter_options or {}
+        self.breaker_options = breaker_options or {}
+        self.limiters: dict[str, AdaptiveLimiter] = {}
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.shed = 0
+
+    def _get(self, key: str) -> tuple[AdaptiveLimiter, CircuitBreaker]:
+        if key not in self.limiters:
+            self.limiters[key] = AdaptiveLimiter(**self.limiter_options)
+            self.breakers[key] = CircuitBreaker(**self.breaker_options)
+        return self.limiters[key], self.breakers[key]
+
+    @asynccontextmanager
+    async def admit(self, key: str) -> AsyncIterator[None]:
+        """Run one upstream search for `key`, recording its latency and outcome"""
+        limiter, breaker = self._get(key)
+        try:
+            breaker.allow()
+        except OverloadedError:
+            self.shed += 1
+            metrics.admission_shed.inc()
+            raise
+
+        try:
+            await limiter.acquire()
+        except BaseException as e:
+            breaker.cancel_probe()
+            if isinstance(e, OverloadedError):
+                self.shed += 1
+                metrics.admission_shed.inc()
+            raise
+
+        started = time.monotonic()
+        try:
+            yield
+        except (asyncio.CancelledError, OverloadedError):
+            # Abandoned searches, and those cut short by their deadline (DeadlineExceededError) or shed, say nothing about upstream health
+            breaker.cancel_probe()
+            raise
+        except Exception:
+            limiter.on_failure()
+            breaker.on_failure()
+            raise
+        else:
+            limiter.on_success(time.monotonic() - started)
+            breaker.on_success()
+        finally:
+            limiter.release()
+
+    def stats(self) -> dict[str, Any]:
+        """Get limit, in-flight and breaker state per engine"""
+        return {
+            "shed": self.shed,
+            "engines": {key: {"limit": int(limiter.limit), "inflight": limiter.inflight, "circuit": self.breakers[key].state} for key, limiter in self.limiters.items()},
+        }
@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+from pydantic import BaseModel
+
+from .codec import CodecError, decode_items, encode_items
+from .dedup import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# Indexed categories and the field holding each result's URL
+INDEXED_FIELDS: dict[str, str] = {"text": "href", "news": "url"}
+
+# Safe search levels from the least to the most strict, a result found under a stricter level may be served to a laxer one
+SAFESEARCH_LEVELS = {"off": 0, "moderate": 1, "on": 2}
+
+# Time limits as seconds back from the search
+TIMELIMIT_SECONDS = {"d": 86400, "w": 7 * 86400, "m": 30 * 86400, "y": 365 * 86400}
+
+# Query words beyond this many are left out of the full-text match
+MAX_TERMS = 16
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS docs (
+        id INTEGER PRIMARY KEY,
+        category TEXT NOT NULL,
+        url TEXT NOT NULL,
+        region TEXT NOT NULL,
+        safesearch INTEGER NOT NULL,
+        published_after REAL NOT NULL,
+        title TEXT NOT NULL,
+        body TEXT NOT NULL,
+        item BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        fetched_at REAL NOT NULL,
+        UNIQUE (category, url)
+    )""",
+    "CREATE INDEX IF NOT EXISTS docs_fetched_at ON docs (fetched_at)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(title, body, content='docs', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN INSERT INTO docs_fts (rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN INSERT INTO docs_fts (docs_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+    """CREATE TRIGGER IF NOT EXISTS docs_au AFTER UPDATE OF title, body ON docs WHEN old.title IS NOT new.title OR old.body IS NOT new.body BEGIN
+        INSERT INTO docs_fts (docs_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO docs_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+)
+
+# A result seen again keeps the strictest safe search level and publication bound it was found under
+UPSERT = """INSERT INTO docs (category, url, region, safesearch, published_after, title, body, item, size, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (category, url) DO UPDATE SET
+        region = excluded.region,
+        safesearch = MAX(safesearch, excluded.safesearch),
+        published_after = MAX(published_after, excluded.published_after),
+        title = excluded.title,
+        body = excluded.body,
+        item = excluded.item,
+        size = excluded.size,
+        fetched_at = excluded.fetched_at"""
+
+# Title matches weigh more than body matches
+SEARCH = """SELECT docs.id, docs.item FROM docs_fts JOIN docs ON docs.id = docs_fts.rowid
+    WHERE docs_fts MATCH ? AND docs.category = ? AND docs.region = ? AND docs.safesearch >= ? AND docs.published_after >= ? AND docs.fetched_at >= ?
+    ORDER BY bm25(docs_fts, 10.0, 1.0) LIMIT ?"""
+
+
+class LocalIndexError(Exception):
+    """Raised when the local index cannot serve a request"""
+
+
+def match_expression(query: str, any_term: bool = False) -> str | None:
+    """Build an FTS5 match of the query's words, all of them or any, None when it has none
+
+    Search operators such as `site:` and `-word` have no local equivalent and are left out.
+    """
+    words = [word for word in query.split() if not word.startswith("-") and ":" not in word]
+    terms = list(dict.fromkeys(term for word in words for term in "".join(c if c.isalnum() else " " for c in word.casefold()).split()))[:MAX_TERMS]
+    if not terms:
+        return None
+    return (" OR " if any_term else " ").join(f'"{term}"' for term in terms)
+
+
+class LocalIndex:
+    """On-disk SQLite FTS5 index of text and news results harvested from upstream searches
+
+    Answers searches locally with BM25 ranking, either before asking upstream when enough results are fresh enough,
+    or as a fallback when upstream fails. Results are only served for the region they were found in, at the same or a
+    stricter safe search level, and within the search's time limit. Writes run on one thread in the background, reads
+    on a few threads with their own connections. FTS5 merges index segments incrementally as results are written.
+    """
+
+    # Run a size-bounded eviction pass every N harvests instead of on every one
+    evict_interval = 100
+    # Harvests waiting to be written before new ones are dropped
+    max_pending = 100
+    # Seconds between recounts of the documents held per category after writes
+    count_interval = 1.0
+
+    def __init__(
+        self,
+        path: str,
+        fresh_ages: dict[str, float] | None = None,
+        fallback_ages: dict[str, float] | None = None,
+        max_docs: int = 100000,
+        max_bytes: int = 256 * 1024 * 1024,
+        readers: int = 4,
+    ):
+        self.path = path
+        # Seconds results stay fresh enough to be served without asking upstream, per category, 0 disables
+        self.fresh_ages = fresh_ages or {}
+        # Seconds results stay good enough to be served when upstream fails, per category, 0 for any age
+        self.fallback_ages = fallback_ages or {}
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.harvested = 0
+        self.dropped = 0
+        self.evictions = 0
+        self.errors = 0
+        self.served = {"fast": 0, "fallback": 0}
+        self.counts: dict[str, tuple[int, int]] = {}
+        self._harvests = 0
+        # Harvests submitted to the writer and not finished yet
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._counted_at = 0.0
+        self._writer: sqlite3.Connection | None = None
+        self._readers: list[sqlite3.Connection] = []
+        self._local = threading.local()
+        # A single thread owns the writing connection, readers each have their own, keeping disk I/O off the event loop
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-write")
+        self._read_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="index-read")
+
+    def _connect_writer(self) -> sqlite3.Connection:
+        if self._writer is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # Only takes effect on a new database, letting compaction return freed pages to the file system
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._writer = conn
+            self._count(conn)
+        return self._writer
+
+    def _connect_reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # The schema must exist before readers query it
+            self._write_executor.submit(self._connect_writer).result()
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+            self._readers.append(conn)
+        return conn
+
+    async def _write(self, func, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._write_executor, func, *args)
+        except sqlite3.Error as e:
+            raise LocalIndexError(f"Local index error: {e}") from e
+
+    def harvest(self, category: str, params: dict[str, Any], items: list[BaseModel]):
+        """Queue results of an upstream search for indexing, dropping them when too many writes are already waiting"""
+        if category not in INDEXED_FIELDS or not items:
+            return
+        with self._pending_lock:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending += 1
+        future = self._write_executor.submit(self._add, category, params, items, time.time())
+        future.add_done_callback(self._harvested)
+
+    def _harvested(self, future: Future):
+        with self._pending_lock:
+            self._pending -= 1
+        if (e := future.exception()) is not None:
+            self.errors += 1
+            logger.warning(f"Error indexing search results: {e!r}")
+
+    def _add(self, category: str, params: dict[str, Any], items: list[BaseModel], now: float):
+        conn = self._connect_writer()
+        url_field = INDEXED_FIELDS[category]
+        region = params.get("region") or "us-en"
+        safesearch = SAFESEARCH_LEVELS.get(params.get("safesearch") or "moderate", 1)
+        # Results of a search with a time limit are known to be published after its start
+        span = TIMELIMIT_SECONDS.get(params.get("timelimit") or "")
+        published_after = now - span if span is not None else -math.inf
+        rows = []
+        for item in items:
+            data = item.__dict__
+            item_data = encode_items(category, [item])
+            rows.append((category, normalize_url(data[url_field]), region, safesearch, published_after, data["title"], data["body"], item_data, len(item_data), now))
+
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(UPSERT, rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.harvested += len(rows)
+
+        self._harvests += 1
+        if self._harvests % self.evict_interval == 0:
+            self._evict(conn, self.max_docs, self.max_bytes, None)
+        elif now - self._counted_at >= self.count_interval:
+            self._count(conn)
+
+    def _evict(self, conn: sqlite3.Connection, max_docs: int, max_bytes: int, max_age: float | None) -> int:
+        """Drop results older than `max_age`, then the least recently fetched ones until within the document and size limits"""
+        evicted = 0
+        if max_age is not None:
+            evicted += conn.execute("DELETE FROM docs WHERE fetched_at < ?", (time.time() - max_age,)).rowcount
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM docs").fetchone()
+        while count > max_docs or total > max_bytes:
+            batch = max(count - max_docs, 1, count // 10)
+            rows = conn.execute("SELECT id, size FROM docs ORDER BY fetched_at LIMIT ?", (batch,)).fetchall()
+            if not rows:
+                break
+            conn.executemany("DELETE FROM docs WHERE id = ?", [(doc_id,) for doc_id, _ in rows])
+            evicted += len(rows)
+            count -= len(rows)
+            total -= sum(size for _, size in rows)
+
+        self.evictions += evicted
+        self._count(conn)
+        return evicted
+
+    def _count(self, conn: sqlite3.Connection):
+        """Refresh the documents and bytes held per category"""
+        self._counted_at = time.time()
+        self.counts = {category: (count, size) for category, count, size in conn.execute("SELECT category, COUNT(*), COALESCE(SUM(size), 0) FROM docs GROUP BY category")}
+
+    def _search(self, category: str, query: str, params: dict[str, Any], max_age: float, limit: int, offset: int, any_term: bool) -> list[BaseModel]:
+        conn = self._connect_reader()
+        now = time.time()
+        region = params.get("region") or "us-en"
+        safesearch = SAFESEARCH_LEVELS.get(params.get("safesearch") or "moderate", 1)
+        span = TIMELIMIT_SECONDS.get(params.get("timelimit") or "")
+        published_after = now - span if span is not None else -math.inf
+        fetched_after = now - max_age if max_age > 0 else -math.inf
+        filters = (category, region, safesearch, published_after, fetched_after)
+
+        rows: dict[int, bytes] = {}
+        # Results matching all words rank first, those matching any word fill up what is left
+        for match in dict.fromkeys((match_expression(query), match_expression(query, any_term=True) if any_term else None)):
+            if match is None or len(rows) >= offset + limit:
+                continue
+            for doc_id, item in conn.execute(SEARCH, (match, *filters, offset + limit)):
+                rows.setdefault(doc_id, item)
+        return [decode_items(item)[0] for item in list(rows.values())[offset : offset + limit]]
+
+    async def search(self, category: str, query: str, params: dict[str, Any], max_age: float, any_term: bool = False) -> list[BaseModel]:
+        """Rank indexed results for a search fetched within `max_age` seconds (0 for any age), with all of its words or, with `any_term`, any
+
+        Returns at most the search's `max_results`, skipping the results of its earlier pages.
+        """
+        limit = params.get("max_results") or 10
+        offset = ((params.get("page") or 1) - 1) * limit
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._read_executor, self._search, category, query, params, max_age, limit, offset, any_term)
+        except (sqlite3.Error, CodecError) as e:
+            raise LocalIndexError(f"Local index error: {e}") from e
+
+    async def lookup(self, category: str, query: str, params: dict[str, Any]) -> list[BaseModel] | None:
+        """Answer a search without asking upstream, when a full set of results with all its words is fresh enough, None otherwise"""
+        max_age = self.fresh_ages.get(category, 0)
+        if category not in INDEXED_FIELDS or max_age <= 0:
+            return None
+        try:
+            results = await self.search(category, query, params, max_age)
+        except LocalIndexError as e:
+            self.errors += 1
+            logger.warning(f"Error searching local index: {e}")
+            return None
+        if len(results) < (params.get("max_results") or 10):
+            return None
+        self.served["fast"] += 1
+        return results
+
+    async def fallback(self, category: str, query: str, params: dict[str, Any]) -> list[BaseModel]:
+        """Best results for a search that failed upstream, within the fallback age, possibly none"""
+        if category not in INDEXED_FIELDS:
+            return []
+        try:
+            results = await self.search(category, query, params, self.fallback_ages.get(category, 0), any_term=True)
+        except LocalIndexError as e:
+            self.errors += 1
+            logger.warning(f"Error searching local index: {e}")
+            return []
+        if results:
+            self.served["fallback"] += 1
+        return results
+
+    async def evict(self, max_docs: int | None = None, max_bytes: int | None = None, max_age: float | None = None) -> int:
+        """Evict results older than `max_age` seconds and the oldest beyond the limits, the configured ones by default. Returns how many"""
+        max_docs = self.max_docs if max_docs is None else max_docs
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        return await self._write(lambda: self._evict(self._connect_writer(), max_docs, max_bytes, max_age))
+
+    async def recount(self):
+        """Count the documents and bytes held per category now, instead of waiting for the next write"""
+        await self._write(lambda: self._count(self._connect_writer()))
+
+    def _compact(self):
+        conn = self._connect_writer()
+        # Merge all full-text index segments into one, then hand pages freed by evictions back to the file system
+        conn.execute("INSERT INTO docs_fts (docs_fts) VALUES ('optimize')")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    async def compact(self):
+        """Merge the index segments and shrink the database file"""
+        await self._write(self._compact)
+
+    def file_size(self) -> int:
+        """Bytes the database takes on disk, with its write-ahead log"""
+        return sum(os.path.getsize(path) for path in (self.path, f"{self.path}-wal") if os.path.exists(path))
+
+    async def close(self):
+        """Finish pending writes and close the database"""
+
+        def _close():
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+        self._read_executor.shutdown(wait=True)
+        for conn in self._readers:
+            conn.close()
+        self._readers.clear()
+        await self._write(_close)
+        self._write_executor.shutdown(wait=True)
+
+    def stats(self) -> dict[str, Any]:
+        """Get index counters"""
+        return {
+            "path": self.path,
+            "documents": {category: count for category, (count, _) in self.counts.items()},
+            "bytes": sum(size for _, size in self.counts.values()),
+            "file_bytes": self.file_size(),
+            "harvested": self.harvested,
+            "dropped": self.dropped,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "served": dict(self.served),
+        }
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Any
+
+from . import tracing
+
+# Latency buckets in seconds, from in-process work to slow upstream searches
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RESULT_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 250)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """A named metric with a fixed set of labels, rendered in the Prometheus text format"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def clear(self):
+        """Drop every labelled value, for gauges whose label sets come and go"""
+        with self._lock:
+            self._values.clear()
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # Per label set: non-cumulative bucket counts (last one is +Inf), sum
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = {key: (list(counts), total[0]) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts, strict=True):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labels, key, 'le="' + le + '"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class MetricsRegistry:
+    """Process-wide metrics, rendered for a Prometheus scrape"""
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Any:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Request level, shared by REST routes and MCP tools
+request_seconds = registry.histogram("ddgs_api_request_seconds", "End-to-end search request latency", ("interface", "category"))
+request_errors = registry.counter("ddgs_api_request_errors_total", "Failed search requests by error type", ("interface", "category", "error"))
+client_disconnects = registry.counter("ddgs_api_client_disconnects_total", "Search requests whose client disconnected before the response was ready", ("interface",))
+results = registry.histogram("ddgs_api_results", "Results returned per search", ("category",), buckets=RESULT_BUCKETS)
+
+# Per upstream engine, split into waiting for an executor thread, the upstream search itself and converting results to models
+executor_queue_seconds = registry.histogram("ddgs_api_executor_queue_seconds", "Time an engine search waited for an executor thread", ("category", "backend"))
+upstream_seconds = registry.histogram("ddgs_api_upstream_seconds", "Upstream engine search latency, including parsing", ("category", "backend"))
+upstream_errors = registry.counter("ddgs_api_upstream_errors_total", "Failed upstream engine searches by error type", ("category", "backend", "error"))
+deadline_skipped = registry.counter("ddgs_api_deadline_skipped_total", "Engine searches dropped as their deadline passed while waiting for a thread", ("category", "backend"))
+convert_seconds = registry.histogram("ddgs_api_convert_seconds", "Time converting upstream results to item models", ("category",))
+local_index_served = registry.counter("ddgs_api_local_index_served_total", "Searches answered from the local index, by mode: fast or fallback", ("category", "mode"))
+page_fetches = registry.counter("ddgs_api_page_fetches_total", "Pages fetched for search and fetch by outcome: fetched, cached, revalidated or failed", ("outcome",))
+page_fetch_seconds = registry.histogram("ddgs_api_page_fetch_seconds", "Time fetching a page and extracting its text")
+job_searches = registry.counter("ddgs_api_job_searches_total", "Searches run for search jobs by outcome: done, retried, throttled or failed", ("outcome",))
+cache_events = registry.counter("ddgs_api_cache_events_total", "Result cache lookups by outcome, and background refreshes", ("outcome",))
+pool_evictions = registry.counter("ddgs_api_pool_evictions_total", "Pooled search clients evicted")
+admission_shed = registry.counter("ddgs_api_admission_shed_total", "Searches shed by admission control")
+tenant_throttled = registry.counter("ddgs_api_tenant_throttled_total", "Requests rejected by an API key's rate limit or quota", ("tenant",))
+spans_exported = registry.counter("ddgs_api_spans_exported_total", "Trace spans by export outcome: exported, failed, or dropped from a full queue", ("outcome",))
+
+# Runtime state, refreshed on each scrape
+executor_queue_depth = registry.gauge("ddgs_api_executor_queue_depth", "Tasks waiting for an executor thread")
+executor_threads = registry.gauge("ddgs_api_executor_threads", "Executor threads by state", ("state",))
+cache_hit_ratio = registry.gauge("ddgs_api_cache_hit_ratio", "Share of result cache lookups served without an upstream search")
+cache_entries = registry.gauge("ddgs_api_cache_entries", "Searches held in the result cache")
+pool_clients = registry.gauge("ddgs_api_pool_clients", "Live pooled search clients")
+admission_limit = registry.gauge("ddgs_api_admission_limit", "Adaptive concurrency limit per engine", ("engine",))
+admission_inflight = registry.gauge("ddgs_api_admission_inflight", "In-flight searches per engine", ("engine",))
+admission_circuit_open = registry.gauge("ddgs_api_admission_circuit_open", "Whether an engine's circuit breaker is open (1) or half open (0.5)", ("engine",))
+tenant_quota_remaining = registry.gauge("ddgs_api_tenant_quota_remaining", "Requests left in an API key's current quota window", ("tenant",))
+scheduler_inflight = registry.gauge("ddgs_api_scheduler_inflight", "Upstream searches holding a fair scheduler slot")
+scheduler_queued = registry.gauge("ddgs_api_scheduler_queued", "Upstream searches waiting for a fair scheduler slot per API key", ("tenant",))
+local_index_documents = registry.gauge("ddgs_api_local_index_documents", "Results held in the local index per category", ("category",))
+page_cache_pages = registry.gauge("ddgs_api_page_cache_pages", "Fetched pages held in the page cache")
+spans_queued = registry.gauge("ddgs_api_spans_queued", "Trace spans waiting for the next export")
+local_index_bytes = registry.gauge("ddgs_api_local_index_bytes", "Encoded size of the results held in the local index per category", ("category",))
+
+# Startup, set once
+startup_seconds = registry.gauge("ddgs_api_startup_seconds", "Time spent per startup phase: import, initialize, mcp, warmup", ("phase",))
+
+# Executor threads started, those currently running an engine search, and engine searches no thread has picked up yet
+started_threads = 0
+busy_threads = 0
+queued_tasks = 0
+_busy_lock = threading.Lock()
+
+
+def track_thread_started():
+    """Executor initializer counting each worker thread it starts"""
+    global started_threads
+    with _busy_lock:
+        started_threads += 1
+
+
+def _add_queued(amount: int):
+    global queued_tasks
+    with _busy_lock:
+        queued_tasks += amount
+
+
+def submit_queued[T](executor: Executor, func: Callable[[], T]) -> Future[T]:
+    """Submit `func` to the executor, counting it as queued until a thread starts it or it is cancelled"""
+    _add_queued(1)
+
+    def run() -> T:
+        _add_queued(-1)
+        return func()
+
+    future = executor.submit(run)
+    future.add_done_callback(lambda f: f.cancelled() and _add_queued(-1))
+    return future
+
+
+@contextmanager
+def track_busy() -> Iterator[None]:
+    """Count the calling executor thread as busy for the duration of the block"""
+    global busy_threads
+    with _busy_lock:
+        busy_threads += 1
+    try:
+        yield
+    finally:
+        with _busy_lock:
+            busy_threads -= 1
+
+
+@contextmanager
+def track_request(interface: str, category: str) -> Iterator[None]:
+    """Time a search request and count its failure by error type, traced as its search span"""
+    started = time.perf_counter()
+    try:
+        with tracing.span("search", interface=interface, category=category):
+            yield
+    except Exception as e:
+        request_errors.inc(interface=interface, category=category, error=type(e).__name__)
+        raise
+    finally:
+        request_seconds.observe(time.perf_counter() - started, interface=interface, category=category)
@@ -63,3 +63,70 @@ class BooksSearchItem(BaseModel):
     info: Annotated[str | None, Field(description="book info")]
     url: Annotated[str, Field(description="book url")]
     thumbnail: Annotated[str | None, Field(description="book cover url")]
+
+
+class BatchSearchResult(BaseModel):
+    """Batch search result model, one per sub-request in input order"""
+
+    category: Annotated[str, Field(description="search category of the sub-request")]
+    results: Annotated[
+        list[TextSearchItem | ImagesSearchItem | VideosSearchItem | NewsSearchItem | BooksSearchItem],
+        Field(description="search results, empty when the sub-request failed"),
+    ] = []
+    error: Annotated[str | None, Field(description="error message when the sub-request failed")] = None
+
+
+class SearchPage[ItemT: BaseModel](BaseModel):
+    """One page of cursor-paginated search results"""
+
+    results: Annotated[list[ItemT], Field(description="search results of this page")]
+    next_cursor: Annotated[str | None, Field(description="opaque cursor of the next page, null when there are no more results")] = None
+
+
+class PageContent(BaseModel):
+    """Readable text extracted from a fetched page"""
+
+    url: Annotated[str, Field(description="url the page was fetched from, after redirects")]
+    title: Annotated[str | None, Field(description="page title")] = None
+    text: Annotated[str, Field(description="readable text of the page, without navigation and other boilerplate")]
+    truncated: Annotated[bool, Field(description="whether the page or its text was cut at the size limit")] = False
+
+
+class FetchedTextItem(TextSearchItem):
+    """Text search item with the readable text of its page"""
+
+    page: Annotated[PageContent | None, Field(description="fetched page, null when it was not fetched or fetching failed")] = None
+    error: Annotated[str | None, Field(description="error message when fetching the page failed")] = None
+
+
+class JobStatus(BaseModel):
+    """Progress of a search job"""
+
+    id: Annotated[str, Field(description="job id")]
+    status: Annotated[str, Field(description="queued, running or done")]
+    total: Annotated[int, Field(description="searches in the job")]
+    finished: Annotated[int, Field(description="searches finished, with results or an error")]
+    failed: Annotated[int, Field(description="searches that failed after their retries")]
+    created_at: Annotated[float, Field(description="submission time, in seconds since the epoch")]
+    started_at: Annotated[float | None, Field(description="time the first search started")] = None
+    finished_at: Annotated[float | None, Field(description="time the last search finished")] = None
+
+
+class JobResult(BaseModel):
+    """Result of one search of a job"""
+
+    index: Annotated[int, Field(description="position of the search in the job")]
+    category: Annotated[str, Field(description="search category")]
+    query: Annotated[str, Field(description="search query")]
+    results: Annotated[
+        list[TextSearchItem | ImagesSearchItem | VideosSearchItem | NewsSearchItem | BooksSearchItem],
+        Field(description="search results, empty when the search failed"),
+    ] = []
+    error: Annotated[str | None, Field(description="error message when the search failed")] = None
+
+
+class JobResultsPage(BaseModel):
+    """One page of a job's results, in the order the searches finished"""
+
+    results: Annotated[list[JobResult], Field(description="finished searches of this page")]
+    next_cursor: Annotated[str | None, Field(description="cursor of the next page, null once the job is done and all results are read")] = None
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+from dataclasses import dataclass, field
+from math import ceil
+from typing import TYPE_CHECKING, Any
+
+from ddgs.exceptions import DDGSException
+from pydantic import BaseModel
+
+from .cache_backends import LRUCache
+from .canonical import ENGINE_DEFAULTS, canonicalize, make_cache_key
+from .dedup import Deduplicator, normalize_url
+
+if TYPE_CHECKING:
+    from .ddgs import AsyncDDGS
+
+CURSOR_VERSION = 1
+
+# Results per page of a `ddgs` engine, the unit its `page` parameter counts in
+UPSTREAM_PAGE_SIZE = 10
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded, is not signed by this server or belongs to another search category"""
+
+
+@dataclass
+class PageBuffer:
+    """Results fetched so far for one search, shared by every cursor walking it"""
+
+    items: list[BaseModel] = field(default_factory=list)
+    seen: set[str] = field(default_factory=set)
+    # Catches near-duplicates across upstream pages, results already served cannot take merged fields
+    dedup: Deduplicator = field(default_factory=lambda: Deduplicator(merge=False))
+    upstream_page: int = 0
+    exhausted: bool = False
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str, secret: bytes) -> str:
+    return _b64encode(hmac.new(secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def encode_cursor(category: str, query: str, params: dict[str, Any], offset: int, size: int, secret: bytes) -> str:
+    """Pack a search and a position in its results into an opaque token, signed so clients cannot choose its search parameters"""
+    data = json.dumps({"v": CURSOR_VERSION, "c": category, "q": query, "p": params, "o": offset, "n": size}, separators=(",", ":"), sort_keys=True)
+    payload = _b64encode(data.encode("utf-8"))
+    return f"{payload}.{_sign(payload, secret)}"
+
+
+def decode_cursor(cursor: str, secret: bytes) -> tuple[str, str, dict[str, Any], int, int]:
+    """Unpack a token from `encode_cursor` into category, query, params, offset and page size, checking its signature first"""
+    payload, _, signature = cursor.partition(".")
+    try:
+        valid = hmac.compare_digest(signature, _sign(payload, secret))
+    except (TypeError, UnicodeEncodeError):
+        valid = False
+    if not valid:
+        raise InvalidCursorError("Invalid cursor signature")
+    try:
+        data = json.loads(_b64decode(payload))
+        if data["v"] != CURSOR_VERSION:
+            raise InvalidCursorError("Unsupported cursor version")
+        category, query, params, offset, size = data["c"], data["q"], data["p"], data["o"], data["n"]
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, KeyError, TypeError) as e:
+        raise InvalidCursorError("Malformed cursor") from e
+    if not (isinstance(query, str) and isinstance(params, dict) and isinstance(offset, int) and isinstance(size, int)) or offset < 0 or not 1 <= size <= 100:
+        raise InvalidCursorError("Malformed cursor")
+    return category, query, params, offset, size
+
+
+class Paginator:
+    """Serve result pages from a bounded per-search buffer, fetching larger upstream windows only when it runs out
+
+    Cursors carry the search and offset, so a cursor whose buffer expired or lives in another worker rebuilds it.
+    They are signed with `secret`, which workers share to accept each other's cursors.
+    """
+
+    def __init__(
+        self,
+        ddgs: AsyncDDGS,
+        key_fields: dict[str, str],
+        secret: bytes,
+        text_fields: dict[str, tuple[str, ...]] | None = None,
+        window: int = 50,
+        max_results: int = 200,
+        ttl: float = 600,
+        max_buffers: int = 1000,
+    ):
+        self.ddgs = ddgs
+        self.secret = secret
+        # Item field identifying a result, and fields compared for near-duplicates, per search category
+        self.key_fields = key_fields
+        self.text_fields = text_fields or {}
+        self.window = window
+        self.max_results = max_results
+        self.ttl = ttl
+        # Sizes are item counts, bounding both the number of buffers and the results held in total
+        self.buffers = LRUCache(max_entries=max_buffers, max_bytes=max_buffers * max_results)
+        self.upstream_fetches = 0
+
+    async def _extend(self, category: str, query: str, params: dict[str, Any], buffer: PageBuffer, needed: int):
+        """Fetch upstream windows until the buffer holds `needed` results or the search runs dry
+
+        `page` counts the engines' own result pages, so a window is its engine pages fetched concurrently and added in order.
+        """
+        key_field = self.key_fields[category]
+        search = getattr(self.ddgs, category)
+        pages = max(ceil(self.window / UPSTREAM_PAGE_SIZE), 1)
+        while len(buffer.items) < needed and not buffer.exhausted:
+            if len(buffer.items) >= self.max_results:
+                buffer.exhausted = True
+                break
+            first = buffer.upstream_page + 1
+            self.upstream_fetches += pages
+            window = await asyncio.gather(*(search(query, **params, max_results=UPSTREAM_PAGE_SIZE, page=page) for page in range(first, first + pages)), return_exceptions=True)
+            for results in window:
+                if isinstance(results, DDGSException) and "No results found" in str(results):
+                    buffer.exhausted = True
+                    break
+                if isinstance(results, BaseException):
+                    if buffer.items:
+                        # Serve what is buffered, a later page retries upstream from the failed one
+                        return
+                    raise results
+
+                buffer.upstream_page += 1
+                added = 0
+                for item in results:
+                    key = normalize_url(str(getattr(item, key_field)))
+                    if key not in buffer.seen and len(buffer.items) < self.max_results and buffer.dedup.add(item.__dict__):
+                        buffer.seen.add(key)
+                        buffer.items.append(item)
+                        added += 1
+                if not added:
+                    buffer.exhausted = True
+                    break
+
+    async def page(self, category: str, query: str, params: dict[str, Any], cursor: str | None = None) -> tuple[list[BaseModel], str | None]:
+        """Get one page of results and the cursor of the next page, None once the results run out"""
+        if cursor:
+            cursor_category, query, params, offset, size = decode_cursor(cursor, self.secret)
+            if cursor_category != category:
+                raise InvalidCursorError(f"Cursor belongs to a {cursor_category} search")
+            params = {name: value for name, value in params.items() if name not in ("max_results", "page")}
+        else:
+            query, params = canonicalize(query, params)
+            size = params.pop("max_results", ENGINE_DEFAULTS["max_results"])
+            offset = (params.pop("page", 1) - 1) * size
+
+        key = make_cache_key(category, query, params)
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = PageBuffer(dedup=Deduplicator(self.text_fields.get(category, ()), merge=False))
+        async with buffer.lock:
+            await self._extend(category, query, params, buffer, offset + size)
+        self.buffers.set(key, buffer, max(len(buffer.items), 1), self.ttl)
+
+        items = buffer.items[offset : offset + size]
+        end = offset + size
+        has_more = end < len(buffer.items) or (not buffer.exhausted and end < self.max_results)
+        return items, encode_cursor(category, query, params, end, size, self.secret) if items and has_more else None
+
+    def stats(self) -> dict[str, Any]:
+        """Get buffer counters"""
+        return {"buffers": len(self.buffers), "buffered_items": self.buffers.total_bytes, "upstream_fetches": self.upstream_fetches}
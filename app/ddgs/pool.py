@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from ddgs import DDGS
+
+from . import metrics
+from .deadline import DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+
+def expand_proxy(proxy: str | None) -> str | None:
+    """Expand the "tb" alias to the local Tor Browser proxy, like `DDGS` does"""
+    return "socks5h://127.0.0.1:9150" if proxy == "tb" else proxy
+
+
+def is_client_failure(error: Exception) -> bool:
+    """Whether an error says something about the client's health (timeouts, proxy or connection errors) rather than the query or its deadline"""
+    return not isinstance(error, DeadlineExceededError) and "No results found" not in str(error)
+
+
+class PooledClient:
+    """A `DDGS` client owned by one thread, keeping its engines' HTTP sessions across searches"""
+
+    def __init__(self, proxy: str | None, timeout: int | None, verify: bool | str, proxy_index: int = 0):
+        self.proxy = proxy
+        self.proxy_index = proxy_index
+        self.ddgs = DDGS(proxy=proxy, timeout=timeout, verify=verify)
+        self.failures = 0
+        self.uses = 0
+        self.evicted = False
+
+
+class DDGSClientPool:
+    """Per-thread search clients built from the configured proxies, timeout and verify settings
+
+    New clients take proxies round-robin. A client that fails `max_failures` times in a row is evicted,
+    and its thread builds a fresh one on the next proxy.
+    """
+
+    def __init__(self, proxies: list[str | None] | None = None, timeout: int | None = 5, verify: bool | str = True, max_failures: int = 5):
+        self.proxies = [expand_proxy(proxy) for proxy in proxies or [None]]
+        self.timeout = timeout
+        self.verify = verify
+        self.max_failures = max_failures
+        self.created = 0
+        self.evictions = 0
+        self._proxy_cycle = itertools.cycle(range(len(self.proxies)))
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._clients: set[PooledClient] = set()
+
+    def _create(self) -> PooledClient:
+        with self._lock:
+            index = next(self._proxy_cycle)
+            self.created += 1
+        client = PooledClient(proxy=self.proxies[index], timeout=self.timeout, verify=self.verify, proxy_index=index)
+        with self._lock:
+            self._clients.add(client)
+        return client
+
+    def acquire(self) -> PooledClient:
+        """Get the calling thread's client, building a new one if it has none or it was evicted"""
+        client: PooledClient | None = getattr(self._local, "client", None)
+        if client is None or client.evicted:
+            client = self._local.client = self._create()
+        client.uses += 1
+        return client
+
+    def report_success(self, client: PooledClient):
+        client.failures = 0
+
+    def report_failure(self, client: PooledClient, error: Exception):
+        if not is_client_failure(error):
+            return
+
+        client.failures += 1
+        if client.failures >= self.max_failures and not client.evicted:
+            client.evicted = True
+            with self._lock:
+                self._clients.discard(client)
+                self.evictions += 1
+            metrics.pool_evictions.inc()
+            logger.warning(f"Evicting search client after {client.failures} consecutive failures, proxy #{client.proxy_index}, last error: {error}")
+
+    @contextmanager
+    def lease(self) -> Iterator[PooledClient]:
+        """Use the calling thread's client, recording the outcome for health-based eviction"""
+        client = self.acquire()
+        try:
+            yield client
+        except Exception as e:
+            self.report_failure(client, e)
+            raise
+        self.report_success(client)
+
+    def stats(self) -> dict[str, Any]:
+        """Get pool counters"""
+        return {"clients": len(self._clients), "created": self.created, "evictions": self.evictions, "proxies": len(self.proxies)}
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+from array import array
+from typing import Any
+
+
+class CountMinSketch:
+    """Approximate per-key counts in fixed memory, never underestimating"""
+
+    def __init__(self, width: int = 4096, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array("I", bytes(4 * width)) for _ in range(depth)]
+
+    def _indexes(self, key: str) -> list[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * self.depth).digest()
+        return [int.from_bytes(digest[4 * i : 4 * i + 4], "little") % self.width for i in range(self.depth)]
+
+    def add(self, key: str) -> int:
+        """Count one occurrence of `key` and return its estimated count"""
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(key), strict=True):
+            if row[index] < 0xFFFFFFFF:
+                row[index] += 1
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        return estimate or 0
+
+    def decay(self):
+        """Halve every counter so popularity reflects recent traffic"""
+        for row in self.rows:
+            for i, value in enumerate(row):
+                if value:
+                    row[i] = value >> 1
+
+
+class TopK:
+    """The `k` keys with the highest counts, with a min-heap to find the one to evict"""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.counts: dict[str, int] = {}
+        # (count, key) entries, stale ones are skipped when they surface
+        self._heap: list[tuple[int, str]] = []
+
+    def _push(self, key: str, count: int):
+        self.counts[key] = count
+        heapq.heappush(self._heap, (count, key))
+        if len(self._heap) > 4 * self.k:
+            self._heap = [(count, key) for key, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def offer(self, key: str, count: int) -> tuple[bool, str | None]:
+        """Offer a key with its new count, returning whether it is in the top K and which key it displaced"""
+        if key in self.counts or len(self.counts) < self.k:
+            self._push(key, count)
+            return True, None
+
+        while self._heap and self.counts.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        lowest, evicted = self._heap[0]
+        if count <= lowest:
+            return False, None
+        heapq.heappop(self._heap)
+        del self.counts[evicted]
+        self._push(key, count)
+        return True, evicted
+
+    def decay(self):
+        self.counts = {key: count >> 1 for key, count in self.counts.items()}
+        self._heap = [(count, key) for key, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+
+class PopularityTracker:
+    """Tracks search popularity and remembers how to re-run the most popular searches"""
+
+    def __init__(self, top_k: int = 100, width: int = 4096, depth: int = 4):
+        self.sketch = CountMinSketch(width=width, depth=depth)
+        self.top = TopK(top_k)
+        # Search to re-run per popular key, only kept while the key is in the top K
+        self.searches: dict[str, Any] = {}
+
+    def record(self, key: str, search: Any):
+        """Count a lookup of `key`, keeping `search` while the key is among the most popular"""
+        admitted, evicted = self.top.offer(key, self.sketch.add(key))
+        if evicted is not None:
+            self.searches.pop(evicted, None)
+        if admitted:
+            self.searches[key] = search
+
+    def popular(self, min_count: int = 2) -> list[tuple[str, Any]]:
+        """Popular keys with their searches, most popular first"""
+        keys = sorted(self.top.counts, key=self.top.counts.__getitem__, reverse=True)
+        return [(key, self.searches[key]) for key in keys if self.top.counts[key] >= min_count and key in self.searches]
+
+    def decay(self):
+        self.sketch.decay()
+        self.top.decay()
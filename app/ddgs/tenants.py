@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from . import metrics
+from .limiter import OverloadedError
+
+ANONYMOUS = "anonymous"
+
+# Tenant the current request is attributed to, set by authentication and inherited by the tasks it spawns
+current_tenant: ContextVar[str] = ContextVar("current_tenant", default=ANONYMOUS)
+
+
+class RateLimitedError(OverloadedError):
+    """Raised when a tenant exceeds its request rate or quota"""
+
+    status_code = 429
+
+
+class TokenBucket:
+    """Allows `burst` requests at once, refilled at `rate` requests per second"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1) -> float:
+        """Take `cost` tokens, returning 0 on success or the seconds until enough tokens are available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
+
+
+class Quota:
+    """Allows `limit` requests per fixed window of `period` seconds, starting with the first request"""
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self.used = 0
+        self.window_start = time.monotonic()
+
+    def take(self, cost: int = 1) -> float:
+        """Count `cost` requests, returning 0 on success or the seconds until the window resets"""
+        now = time.monotonic()
+        if now - self.window_start >= self.period:
+            self.window_start = now
+            self.used = 0
+        if self.used + cost > self.limit:
+            return self.window_start + self.period - now
+        self.used += cost
+        return 0
+
+
+class TenantLimiter:
+    """Per-tenant request rate limit and quota, with per-tenant overrides
+
+    State is kept per tenant and overrides, so keys of a tenant with different limits count separately and never reset each other's,
+    and a key reload with new limits starts counting against them without touching the state of the old ones.
+    """
+
+    def __init__(self, rate: float = 0, burst: float = 20, quota: int = 0, quota_period: float = 86400):
+        self.defaults = {"rate": rate, "burst": burst, "quota": quota, "quota_period": quota_period}
+        # Overrides last seen per tenant, for its fair-share weight
+        self.overrides: dict[str, dict[str, float]] = {}
+        self.buckets: dict[tuple[str, frozenset], TokenBucket | None] = {}
+        self.quotas: dict[tuple[str, frozenset], Quota | None] = {}
+        self.throttled: dict[str, int] = {}
+
+    def limits(self, overrides: dict[str, float] | None = None) -> dict[str, float]:
+        return {**self.defaults, **(overrides or {})}
+
+    def weight(self, tenant: str) -> float:
+        """Fair-share weight of a tenant, 1 unless overridden"""
+        return self.overrides.get(tenant, {}).get("weight", 1)
+
+    def check(self, tenant: str, overrides: dict[str, float] | None = None, cost: int = 1):
+        """Count a request against the tenant's rate limit and quota, raising when either is exceeded"""
+        overrides = overrides or {}
+        self.overrides[tenant] = overrides
+        key = (tenant, frozenset(overrides.items()))
+        if key not in self.buckets:
+            limits = self.limits(overrides)
+            self.buckets[key] = TokenBucket(limits["rate"], max(limits["burst"], 1)) if limits["rate"] > 0 else None
+            self.quotas[key] = Quota(int(limits["quota"]), limits["quota_period"]) if limits["quota"] > 0 else None
+
+        bucket, quota = self.buckets[key], self.quotas[key]
+        if bucket is not None and (wait := bucket.take(cost)):
+            self.throttled[tenant] = self.throttled.get(tenant, 0) + 1
+            metrics.tenant_throttled.inc(tenant=tenant)
+            raise RateLimitedError("Rate limit exceeded for this API key", retry_after=wait)
+        if quota is not None and (wait := quota.take(cost)):
+            if bucket is not None:
+                bucket.tokens += cost
+            self.throttled[tenant] = self.throttled.get(tenant, 0) + 1
+            metrics.tenant_throttled.inc(tenant=tenant)
+            raise RateLimitedError("Quota exhausted for this API key", retry_after=wait)
+
+    def stats(self) -> dict[str, Any]:
+        """Get throttled request counts, and the remaining quota per tenant, the lowest of its keys' when they have different limits"""
+        remaining: dict[str, int] = {}
+        for (tenant, _), quota in self.quotas.items():
+            if quota is not None:
+                remaining[tenant] = min(remaining.get(tenant, quota.limit), quota.limit - quota.used)
+        return {"throttled": dict(self.throttled), "quota_remaining": remaining}
+
+
+class FairScheduler:
+    """Deficit round robin across tenants over a fixed number of upstream search slots
+
+    While slots are free searches start immediately. Once they are all taken each tenant waits in its own queue,
+    and freed slots go round the tenants with waiting searches, each getting `weight` slots per round,
+    so a tenant flooding the service only lengthens its own queue.
+    """
+
+    def __init__(self, max_concurrency: int = 100, max_queue: int = 1000, queue_timeout: float = 10, weights: TenantLimiter | None = None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.weights = weights
+        self.inflight = 0
+        self.queued = 0
+        self._queues: dict[str, deque[asyncio.Future]] = {}
+        self._deficits: dict[str, float] = {}
+        # Tenants with waiting searches, in service order
+        self._ring: deque[str] = deque()
+
+    def _weight(self, tenant: str) -> float:
+        return max(self.weights.weight(tenant), 0.01) if self.weights is not None else 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting searches, round robin by tenant deficit"""
+        while self.inflight < self.max_concurrency and self._ring:
+            tenant = self._ring[0]
+            queue = self._queues[tenant]
+            while queue and queue[0].done():
+                queue.popleft()
+            if not queue:
+                # A tenant leaving the rotation forfeits its deficit, as in DRR
+                self._ring.popleft()
+                del self._queues[tenant]
+                del self._deficits[tenant]
+                continue
+            if self._deficits[tenant] < 1:
+                self._deficits[tenant] += self._weight(tenant)
+                if self._deficits[tenant] < 1:
+                    self._ring.rotate(-1)
+                    continue
+
+            self._deficits[tenant] -= 1
+            self.queued -= 1
+            self.inflight += 1
+            queue.popleft().set_result(None)
+            if self._deficits[tenant] < 1:
+                self._ring.rotate(-1)
+
+    async def acquire(self, tenant: str):
+        """Wait for an upstream slot in the tenant's turn"""
+        if self.inflight < self.max_concurrency and not self._ring:
+            self.inflight += 1
+            return
+
+        # Bounded per tenant, so a flooding tenant is turned away without crowding others out of the queue
+        if len(self._queues.get(tenant, ())) >= self.max_queue:
+            raise RateLimitedError("Upstream capacity exhausted and this API key's queue is full", retry_after=self.queue_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        if tenant not in self._queues:
+            self._queues[tenant] = deque()
+            self._deficits[tenant] = 0
+            self._ring.append(tenant)
+        self._queues[tenant].append(waiter)
+        self.queued += 1
+        # Slots may be free behind tenants whose searches all gave up waiting
+        self._dispatch()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as the wait ended
+                self.release()
+            else:
+                self.queued -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise RateLimitedError(f"Waited {self.queue_timeout}s for an upstream slot", retry_after=self.queue_timeout) from e
+            raise
+
+    def release(self):
+        self.inflight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tenant: str) -> AsyncIterator[None]:
+        """Hold one upstream slot for the tenant"""
+        await self.acquire(tenant)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict[str, Any]:
+        """Get in-flight and waiting searches, with waiting searches per tenant"""
+        return {
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "tenants": {tenant: sum(not waiter.done() for waiter in queue) for tenant, queue in self._queues.items()},
+        }
@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from random import random
+from typing import Any
+
+import httpx
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Spans are timed with perf_counter and exported in Unix time
+_EPOCH_OFFSET = time.time() - time.perf_counter()
+
+# W3C trace context: version, trace id, parent span id, flags
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# OTLP span kinds
+INTERNAL = 1
+SERVER = 2
+
+
+class Trace:
+    """The spans of one request, recorded from the event loop and executor threads alike"""
+
+    def __init__(self, trace_id: str | None = None, sampled: bool = False):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        # Whether the trace is exported once its root span ends
+        self.sampled = sampled
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: milliseconds per span name and backend, summed over repeats, spans still open counted until now
+
+        The root span, the first one, is reported as the total.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            root = self.spans[0] if self.spans else None
+            spans = sorted(self.spans, key=lambda span: span.start)
+        totals: dict[tuple[str, str | None], float] = {}
+        for span in spans:
+            key = ("total", None) if span is root else (span.name, span.attributes.get("backend"))
+            totals[key] = totals.get(key, 0.0) + (span.end if span.end is not None else now) - span.start
+        entries = []
+        for (name, backend), seconds in totals.items():
+            desc = f';desc="{backend}"' if backend else ""
+            entries.append(f"{name}{desc};dur={seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+
+class Span:
+    """A timed step of a request, with the span it is nested in"""
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "kind", "start", "end", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: str | None = None, start: float | None = None, kind: int = INTERNAL, attributes: dict[str, Any] | None = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start = time.perf_counter() if start is None else start
+        self.end: float | None = None
+        self.attributes = attributes or {}
+        self.error: str | None = None
+        trace.add(self)
+
+    def finish(self, error: BaseException | None = None):
+        self.end = time.perf_counter()
+        if error is not None:
+            self.error = type(error).__name__
+
+    def child(self, name: str, start: float | None = None, **attributes: Any) -> Span:
+        return Span(self.trace, name, self.span_id, start=start, attributes=attributes)
+
+
+# Innermost span of the current request, None when it is not traced
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, parent: Span | None = None, **attributes: Any) -> Iterator[Span | None]:
+    """Time a block as a child of `parent` or the current span, doing nothing outside a traced request
+
+    Executor threads do not inherit the context, so their work passes the span it belongs to as `parent`.
+    """
+    parent = parent or current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, **attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.finish(e)
+        raise
+    else:
+        child.finish()
+    finally:
+        current_span.reset(token)
+
+
+def record(name: str, started: float, parent: Span | None = None, **attributes: Any):
+    """Record a step that began at perf_counter time `started` and ends now, e.g. a wait measured elsewhere"""
+    parent = parent or current_span.get()
+    if parent is not None:
+        parent.child(name, start=started, **attributes).finish()
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """Trace id, parent span id and sampled flag of a W3C traceparent header, None when it is missing or invalid"""
+    match = TRACEPARENT.match(header.strip().lower()) if header else None
+    if match is None or match[1] == "0" * 32 or match[2] == "0" * 16:
+        return None
+    return match[1], match[2], bool(int(match[3], 16) & 1)
+
+
+class Tracer:
+    """Starts a trace per request or tool call and hands the sampled ones to the exporter
+
+    An incoming traceparent header continues the caller's trace and its sampling decision, other traces are sampled at `sample_rate`.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, exporter: SpanExporter | None = None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    @contextmanager
+    def trace(self, name: str, traceparent: str | None = None, kind: int = SERVER, **attributes: Any) -> Iterator[Span]:
+        """Run a block as the root span of a trace, exporting the trace when it is sampled"""
+        remote = parse_traceparent(traceparent)
+        if remote is not None:
+            trace_id, parent_id, sampled = remote
+        else:
+            trace_id, parent_id, sampled = None, None, random() < self.sample_rate  # noqa: S311
+        trace = Trace(trace_id, sampled=sampled and self.exporter is not None)
+        root = Span(trace, name, parent_id, kind=kind, attributes=attributes)
+        token = current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.finish(e)
+            raise
+        else:
+            root.finish()
+        finally:
+            current_span.reset(token)
+            if trace.sampled:
+                self.exporter.export(trace)
+
+    def start(self):
+        if self.exporter is not None:
+            self.exporter.start()
+
+    def stats(self) -> dict[str, Any]:
+        return self.exporter.stats() if self.exporter is not None else {"queued": 0, "exported": 0, "failed": 0, "dropped": 0}
+
+    async def close(self):
+        if self.exporter is not None:
+            await self.exporter.close()
+
+
+def otlp_value(value: Any) -> dict[str, Any]:
+    """OTLP/JSON AnyValue of an attribute value, 64-bit integers are strings there"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(span: Span) -> dict[str, Any]:
+    data: dict[str, Any] = {
+        "traceId": span.trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(int((span.start + _EPOCH_OFFSET) * 1e9)),
+        "endTimeUnixNano": str(int(((span.end if span.end is not None else span.start) + _EPOCH_OFFSET) * 1e9)),
+        "attributes": [{"key": key, "value": otlp_value(value)} for key, value in span.attributes.items() if value is not None],
+        # Unset, or error with the exception type
+        "status": {"code": 2, "message": span.error} if span.error else {},
+    }
+    if span.parent_id:
+        data["parentSpanId"] = span.parent_id
+    return data
+
+
+class SpanExporter:
+    """Exports finished traces in batches as OTLP/JSON, posted to a collector's /v1/traces endpoint or appended to a file one batch per line
+
+    Spans wait in a bounded queue between exports, the oldest are dropped when it is full.
+    """
+
+    def __init__(self, endpoint: str | None = None, path: str | None = None, service_name: str = "ddgs-api", interval: float = 5.0, max_queue: int = 2048, timeout: float = 10):
+        if not endpoint and not path:
+            raise ValueError("Span exporter needs an endpoint or a file path")
+        self.endpoint = endpoint
+        self.path = path
+        self.service_name = service_name
+        self.interval = interval
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._queue: deque[Span] = deque()
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._counts = {"exported": 0, "failed": 0, "dropped": 0}
+
+    def export(self, trace: Trace):
+        """Queue a finished trace's spans for the next export"""
+        with trace._lock:
+            spans = list(trace.spans)
+        with self._lock:
+            self._queue.extend(spans)
+            dropped = len(self._queue) - self.max_queue
+            for _ in range(max(dropped, 0)):
+                self._queue.popleft()
+                self._counts["dropped"] += 1
+            if dropped > 0:
+                metrics.spans_exported.inc(dropped, outcome="dropped")
+
+    def encode(self, spans: list[Span]) -> bytes:
+        """An OTLP ExportTraceServiceRequest in its JSON encoding"""
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                    "scopeSpans": [{"scope": {"name": "ddgs-api"}, "spans": [otlp_span(span) for span in spans]}],
+                }
+            ]
+        }
+        return json.dumps(request, separators=(",", ":")).encode()
+
+    def _append(self, line: bytes):
+        with open(self.path, "ab") as f:
+            f.write(line + b"\n")
+
+    async def flush(self):
+        """Export the queued spans now"""
+        with self._lock:
+            spans = list(self._queue)
+            self._queue.clear()
+        if not spans:
+            return
+        body = self.encode(spans)
+        try:
+            if self.endpoint:
+                if self._client is None:
+                    self._client = httpx.AsyncClient(timeout=self.timeout)
+                response = await self._client.post(self.endpoint, content=body, headers={"Content-Type": "application/json"})
+                response.raise_for_status()
+            else:
+                await asyncio.to_thread(self._append, body)
+        except (httpx.HTTPError, OSError) as e:
+            logger.warning(f"Exporting {len(spans)} spans failed: {e!r}")
+            self._counts["failed"] += len(spans)
+            metrics.spans_exported.inc(len(spans), outcome="failed")
+            return
+        self._counts["exported"] += len(spans)
+        metrics.spans_exported.inc(len(spans), outcome="exported")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        """Start exporting in the background, from within the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stats(self) -> dict[str, Any]:
+        return {"queued": len(self._queue), **self._counts}
+
+    async def close(self):
+        """Stop the background exports and export what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
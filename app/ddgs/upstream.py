@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+from concurrent.futures import Executor
+from contextlib import aclosing
+from math import ceil
+from random import random
+from typing import Any
+
+from ddgs.engines import ENGINES
+from ddgs.exceptions import DDGSException, TimeoutException
+
+from . import metrics, tracing
+from .deadline import Deadline, DeadlineExceededError, current_deadline, enforce_deadline
+from .dedup import RESULT_KEY_FIELDS, TEXT_FIELDS, Deduplicator, deduplicate
+from .limiter import AdmissionController, OverloadedError
+from .pool import DDGSClientPool
+from .tenants import FairScheduler, current_tenant
+
+logger = logging.getLogger(__name__)
+
+
+def raise_no_results(err: Exception | None):
+    """Raise the error for a search that produced no results, like `DDGS` does"""
+    if isinstance(err, OverloadedError):
+        raise err
+    if "timed out" in f"{err}":
+        raise TimeoutException(err)
+    raise DDGSException(err or "No results found.")
+
+
+def engine_names(category: str, backend: str) -> list[str]:
+    """Resolve a single or comma-delimited backend to the names of its engines, by priority with ties in random order like `DDGS`"""
+    engines = ENGINES[category]
+    backend_list = [x.strip() for x in backend.split(",")]
+    if "auto" in backend_list or "all" in backend_list:
+        names = list(engines)
+    else:
+        names = [name for name in dict.fromkeys(backend_list) if name in engines]
+    if not names:
+        logger.warning(f"No valid backend in {backend!r}, using 'auto'")
+        names = list(engines)
+    return sorted(names, key=lambda name: (engines[name].priority, random()), reverse=True)  # noqa: S311
+
+
+class ThreadSearchClient:
+    """Searches run by the `DDGS` client of an executor thread, in the tenant's turn, under admission control and within the request deadline
+
+    `search` is one `DDGS` call with the requested backend, `stream` makes one per engine so results arrive as each engine returns.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        pool: DDGSClientPool,
+        admission: AdmissionController | None = None,
+        scheduler: FairScheduler | None = None,
+        dedup: bool = True,
+        dedup_max_distance: int = 3,
+        dedup_merge: bool = True,
+    ):
+        self.executor = executor
+        # Per-thread DDGS clients
+        self.pool = pool
+        # Per-backend concurrency limits and circuit breakers
+        self.admission = admission
+        # Fair share of upstream slots across API keys
+        self.scheduler = scheduler
+        # Drop results repeated under different URLs or with near-identical text
+        self.dedup = dedup
+        self.dedup_max_distance = dedup_max_distance
+        self.dedup_merge = dedup_merge
+
+    def _search_sync(self, category: str, query: str, backend: str, submitted: float, deadline: Deadline | None, span: tracing.Span | None, **kwargs: Any) -> list[dict[str, Any]]:
+        """Run a search on the calling thread's `DDGS` client, unless its deadline passed while the job was queued
+
+        A running search cannot be interrupted, its requests time out after the client's timeout instead.
+        """
+        labels = {"category": category, "backend": backend}
+        metrics.executor_queue_seconds.observe(time.perf_counter() - submitted, **labels)
+        tracing.record("queue", submitted, span, backend=backend)
+        if deadline is not None and deadline.time_left() <= 0:
+            metrics.deadline_skipped.inc(**labels)
+            raise DeadlineExceededError()
+        with (
+            metrics.track_busy(),
+            metrics.upstream_seconds.time(**labels),
+            tracing.span("upstream", span, backend=backend),
+            self.pool.lease() as client,
+        ):
+            try:
+                return getattr(client.ddgs, category)(query, backend=backend, **kwargs)
+            except DDGSException as e:
+                # No results is an answer, not a failure of the backend
+                if "No results found" not in str(e):
+                    raise
+        return []
+
+    async def _run_backend(self, category: str, query: str, backend: str, **kwargs: Any) -> list[dict[str, Any]]:
+        """Run a search in the executor"""
+        submitted = time.perf_counter()
+        deadline = current_deadline.get()
+        span = tracing.current_span.get()
+        return await asyncio.wrap_future(metrics.submit_queued(self.executor, lambda: self._search_sync(category, query, backend, submitted, deadline, span, **kwargs)))
+
+    async def _search_backend(self, category: str, query: str, backend: str, **kwargs: Any) -> list[dict[str, Any]]:
+        """Search a backend in the tenant's turn and under its admission control, within the request deadline, counting failures by error type"""
+        try:
+            with tracing.span("engine", category=category, backend=backend):
+                async with enforce_deadline():
+                    if self.scheduler is None:
+                        return await self._search_admitted(category, query, backend, **kwargs)
+                    async with self.scheduler.slot(current_tenant.get()):
+                        return await self._search_admitted(category, query, backend, **kwargs)
+        except Exception as e:
+            metrics.upstream_errors.inc(category=category, backend=backend, error=type(e).__name__)
+            raise
+
+    async def _search_admitted(self, category: str, query: str, backend: str, **kwargs: Any) -> list[dict[str, Any]]:
+        if self.admission is None:
+            return await self._run_backend(category, query, backend, **kwargs)
+        async with self.admission.admit(f"{category}:{backend}"):
+            return await self._run_backend(category, query, backend, **kwargs)
+
+    async def iter_backends(
+        self, category: str, query: str, backend: str = "auto", max_results: int | None = 10, **kwargs: Any
+    ) -> AsyncIterator[tuple[str, list[dict[str, Any]] | Exception]]:
+        """Search the engines of a backend concurrently, yielding each engine's results or error as soon as it completes
+
+        Engines of a provider that already returned results are skipped, pending engines are cancelled when the caller stops iterating.
+        """
+        if not query:
+            raise DDGSException("query is mandatory.")
+
+        engines = ENGINES[category]
+        names = engine_names(category, backend)
+        providers = {engines[name].provider for name in names}
+        max_workers = min(len(providers), ceil(max_results / 10) + 1) if max_results else len(providers)
+
+        seen_providers: set[str] = set()
+        pending: dict[asyncio.Task, str] = {}
+        try:
+            while names or pending:
+                while names and len(pending) < max_workers:
+                    name = names.pop(0)
+                    if engines[name].provider in seen_providers:
+                        continue
+                    pending[asyncio.ensure_future(self._search_backend(category, query, name, max_results=max_results, **kwargs))] = name
+                if not pending:
+                    break
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        results = task.result()
+                    except Exception as e:
+                        logger.info(f"Error in engine {name}: {e!r}")
+                        yield name, e
+                        continue
+                    if results:
+                        seen_providers.add(engines[name].provider)
+                        yield name, results
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def deduplicate(self, category: str, results: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Drop duplicate results when deduplication is enabled"""
+        if not self.dedup:
+            return results
+        return deduplicate(category, results, max_distance=self.dedup_max_distance, merge=self.dedup_merge)
+
+    async def search(self, category: str, query: str, backend: str = "auto", **kwargs: Any) -> list[dict[str, Any]]:
+        """Search a backend with `DDGS`, which queries its engines concurrently and ranks their results"""
+        if not query:
+            raise DDGSException("query is mandatory.")
+        results = self.deduplicate(category, await self._search_backend(category, query, backend, **kwargs))
+        if results:
+            return results
+        raise_no_results(None)
+
+    async def stream(self, category: str, query: str, **kwargs: Any) -> AsyncIterator[dict[str, Any]]:
+        """Yield unique results as soon as each engine returns them, in arrival order instead of the ranked order of `search`"""
+        max_results = kwargs.get("max_results", 10)
+        # Results already sent cannot take merged fields
+        dedup = Deduplicator(TEXT_FIELDS.get(category, ()) if self.dedup else (), max_distance=self.dedup_max_distance, merge=False)
+        err: Exception | None = None
+
+        async with aclosing(self.iter_backends(category, query, **kwargs)) as backends:
+            async for _, results in backends:
+                if isinstance(results, Exception):
+                    err = results
+                    continue
+                for data in results:
+                    if not any(data.get(name) for name in RESULT_KEY_FIELDS) or not dedup.add(data):
+                        continue
+                    yield data
+                    if max_results and len(dedup.results) >= max_results:
+                        return
+
+        if not dedup.results:
+            raise_no_results(err)
+
+    async def warm_up(self, categories: list[str], connections: int) -> int:
+        """Open upstream connections ahead of traffic, returning how many opened
+
+        `DDGS` connects on its first search, so the thread engine is only warmed up by canary searches.
+        """
+        return 0
+
+    async def close(self):
+        """Release upstream connections, the `DDGS` clients close theirs when dropped"""
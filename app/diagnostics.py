@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import PurePath
+from types import CodeType, FrameType
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.ddgs import get_ddgs
+
+# Leaf frames of threads waiting for work rather than doing any, left out of profiles unless idle threads are asked for
+IDLE_FRAMES = {("selectors.py", "select"), ("threading.py", "wait"), ("thread.py", "_worker"), ("queue.py", "get")}
+
+
+class TracingMiddleware:
+    """Trace each HTTP request, reporting the time spent per span in a Server-Timing header of the response
+
+    The header is sent with the response head, so a streamed response reports the spans up to its first byte.
+    """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = True, exclude_paths: tuple[str, ...] = ()):
+        self.app = app
+        self.server_timing = server_timing
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        tracer = get_ddgs().tracer if scope["type"] == "http" else None
+        if tracer is None or scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        traceparent = Headers(scope=scope).get("traceparent")
+        with tracer.trace(method, traceparent=traceparent, **{"http.request.method": method, "url.path": scope["path"]}) as root:
+            # For work the request hands to other tasks, like MCP tool calls
+            scope.setdefault("state", {})["span"] = root
+
+            async def send_timed(message: Message):
+                if message["type"] == "http.response.start":
+                    root.attributes["http.response.status_code"] = message["status"]
+                    if message["status"] >= 500:
+                        root.error = str(message["status"])
+                    if self.server_timing:
+                        MutableHeaders(scope=message).append("Server-Timing", root.trace.server_timing())
+                await send(message)
+
+            await self.app(scope, receive, send_timed)
+            # The router leaves the matched route in the scope
+            route = scope.get("route")
+            if route is not None and hasattr(route, "path"):
+                root.name = f"{method} {route.path}"
+                root.attributes["http.route"] = route.path
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is running"""
+
+
+def thread_label(name: str) -> str:
+    """Thread name without its pool index, so a pool's threads share one root frame"""
+    return re.sub(r"_\d+$", "", name)
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling the Python stacks of all threads at a fixed interval, one run at a time
+
+    Stacks are counted in the collapsed format flame graph tools read: the thread and its frames from the outermost
+    to the leaf, separated by semicolons, then the number of samples.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels: dict[CodeType, str] = {}
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = PurePath(code.co_filename)
+            label = f"{code.co_qualname} ({'/'.join(path.parts[-2:])}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def _stack(self, frame: FrameType | None) -> list[str]:
+        stack = []
+        while frame is not None:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def sample(self, duration: float, interval: float = 0.01, idle: bool = False) -> tuple[Counter[str], int]:
+        """Sample every thread but the calling one for `duration` seconds, blocking meanwhile
+
+        Returns the count of each collapsed stack and the number of samples taken.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already running")
+        try:
+            own = threading.get_ident()
+            stacks: Counter[str] = Counter()
+            samples = 0
+            next_at = time.monotonic()
+            deadline = next_at + duration
+            while next_at < deadline:
+                names = {thread.ident: thread_label(thread.name) for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    if not idle and (PurePath(frame.f_code.co_filename).name, frame.f_code.co_name) in IDLE_FRAMES:
+                        continue
+                    stacks[";".join([names.get(ident, "thread"), *self._stack(frame)])] += 1
+                samples += 1
+                next_at += interval
+                time.sleep(max(next_at - time.monotonic(), 0))
+            return stacks, samples
+        finally:
+            self._lock.release()
+
+
+def collapsed(stacks: Counter[str]) -> str:
+    """Render stack counts as a collapsed stack file, most frequent first"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import gzip
+from collections.abc import Callable
+from typing import Any, Literal
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = {MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack"}
+
+# Response body formats: JSON, or MessagePack when the msgpack extra is installed and the client asks for it
+BodyFormat = Literal["json", "msgpack"]
+
+# Streamed bodies are sent as they are produced, compressing them would hold results back
+UNCOMPRESSED_MEDIA_TYPES = ("text/event-stream", "application/x-ndjson")
+
+# Fast compression levels: search responses are small and latency-sensitive, ratio gains past these are marginal
+COMPRESSORS: dict[str, Callable[[bytes], bytes]] = {"gzip": lambda data: gzip.compress(data, compresslevel=5, mtime=0)}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda data: brotli.compress(data, quality=4)
+if zstandard is not None:
+    _zstd = zstandard.ZstdCompressor(level=3)
+    COMPRESSORS["zstd"] = _zstd.compress
+
+
+def parse_qualities(header: str) -> dict[str, float]:
+    """Parse an Accept or Accept-Encoding header into lower-cased values and their q weights"""
+    qualities = {}
+    for part in header.split(","):
+        value, *params = (piece.strip() for piece in part.split(";"))
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, number = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        qualities[value.lower()] = q
+    return qualities
+
+
+def negotiate_encoding(accept_encoding: str, preference: list[str]) -> str | None:
+    """Pick the available content coding the client weighs highest, ties going to the first in `preference`"""
+    qualities = parse_qualities(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+    best, best_q = None, 0.0
+    for name in preference:
+        q = qualities.get(name, wildcard)
+        if name in COMPRESSORS and q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def negotiate_body_format(accept: str | None) -> BodyFormat:
+    """Use MessagePack when the client prefers it to JSON and it can be produced"""
+    if msgpack is None or not accept:
+        return "json"
+    qualities = parse_qualities(accept)
+    msgpack_q = max((qualities.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES), default=0.0)
+    json_q = max(qualities.get("application/json", 0.0), qualities.get("application/*", 0.0), qualities.get("*/*", 0.0))
+    return "msgpack" if msgpack_q > 0 and msgpack_q >= json_q else "json"
+
+
+def packb(data: Any) -> bytes:
+    """Serialize JSON-compatible data to MessagePack"""
+    return msgpack.packb(data, use_bin_type=True)
+
+
+class CompressionMiddleware:
+    """Compress whole response bodies with the best content coding the client accepts
+
+    Streamed responses, bodies under `min_size` bytes and bodies that already have a content coding are sent as they are.
+    """
+
+    def __init__(self, app: ASGIApp, min_size: int = 1024, encodings: list[str] | None = None):
+        self.app = app
+        self.min_size = min_size
+        self.encodings = [name for name in encodings or ["zstd", "br", "gzip"] if name in COMPRESSORS]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None or passthrough or message["type"] != "http.response.body":
+                if start is not None and not passthrough:
+                    passthrough = True
+                    await send(start)
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            media_type = headers.get("content-type", "")
+            if message.get("more_body") or "content-encoding" in headers or len(body) < self.min_size or media_type.startswith(UNCOMPRESSED_MEDIA_TYPES):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            body = COMPRESSORS[encoding](body)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+def hash_key(api_key: str) -> bytes:
+    return hashlib.sha256(api_key.encode("utf-8")).digest()
+
+
+@dataclass(frozen=True, slots=True)
+class ApiKey:
+    """A known API key, held only as its SHA-256 digest, with the tenant it belongs to and that tenant's scopes and limits"""
+
+    digest: bytes
+    tenant: str
+    scopes: tuple[str, ...] = ()
+    limits: dict[str, float] = field(default_factory=dict)
+
+
+class KeyStore:
+    """API keys indexed by digest, so a lookup costs one hash and one dict access however many keys there are
+
+    Keys come from `API_KEYS` and from an optional JSON file, which is re-read when it changes on disk,
+    checked at most once per `reload_interval` seconds. File entries are objects with the key itself (`key`)
+    or its hex SHA-256 digest (`sha256`), and optional `tenant`, `scopes` and `limits`.
+    """
+
+    def __init__(self, keys: list[str] | None = None, path: str | None = None, limits: dict[str, dict[str, float]] | None = None, reload_interval: float = 5):
+        self.path = path or None
+        self.reload_interval = reload_interval
+        # Per-key limit overrides from settings, keyed by the key itself
+        self.limits = limits or {}
+        self.static = {key.digest: key for key in (self._entry({"key": api_key}) for api_key in keys or [])}
+        self.keys = dict(self.static)
+        # Bumped on every reload, so caches of lookups know when to drop them
+        self.version = 0
+        self._file_state: tuple[int, int] | None = None
+        self._next_check = 0.0
+        self.reload()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether requests must authenticate, true once any key source is configured"""
+        return bool(self.static) or self.path is not None
+
+    def _entry(self, item: dict[str, Any]) -> ApiKey:
+        if "key" in item:
+            digest = hash_key(item["key"])
+            limits = {**self.limits.get(item["key"], {}), **item.get("limits", {})}
+        else:
+            digest = bytes.fromhex(item["sha256"])
+            if len(digest) != hashlib.sha256().digest_size:
+                raise ValueError("sha256 must be a hex SHA-256 digest")
+            limits = dict(item.get("limits", {}))
+        # Without a tenant name each key is its own tenant, named by a digest prefix that does not reveal the key
+        tenant = str(item.get("tenant") or digest[:6].hex())
+        return ApiKey(digest=digest, tenant=tenant, scopes=tuple(item.get("scopes", ())), limits=limits)
+
+    def reload(self) -> bool:
+        """Re-read the key file if it changed, keeping the current keys if it cannot be read. Returns whether keys changed"""
+        if self.path is None:
+            return False
+        self._next_check = time.monotonic() + self.reload_interval
+        try:
+            stat = os.stat(self.path)
+            state = (stat.st_mtime_ns, stat.st_size)
+            if state == self._file_state:
+                return False
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            entries = data["keys"] if isinstance(data, dict) else data
+            keys = dict(self.static)
+            for item in entries:
+                entry = self._entry({"key": item} if isinstance(item, str) else item)
+                keys[entry.digest] = entry
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Failed to load API keys from {self.path}: {e!r}, keeping {len(self.keys)} keys")
+            return False
+
+        self.keys = keys
+        self._file_state = state
+        self.version += 1
+        logger.info(f"Loaded {len(keys)} API keys")
+        return True
+
+    def check_reload(self):
+        """Reload the key file if it is due for a change check"""
+        if self.path is not None and time.monotonic() >= self._next_check:
+            self.reload()
+
+    def lookup(self, api_key: str) -> ApiKey | None:
+        """Find a key, None if it is unknown"""
+        self.check_reload()
+        digest = hash_key(api_key)
+        entry = self.keys.get(digest)
+        # The dict lookup already matched, comparing digests in constant time keeps timing independent of the key anyway
+        if entry is None or not hmac.compare_digest(entry.digest, digest):
+            return None
+        return entry
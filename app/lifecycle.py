@@ -0,0 +1,131 @@
+import asyncio
+import contextvars
+import importlib
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings
+from app.ddgs import get_ddgs
+from app.ddgs.metrics import startup_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class LazyMCP:
+    """ASGI app importing and starting the MCP server on its first request, or when warm-up loads it
+
+    This keeps fastmcp, most of the import time, out of startup. Until it is loaded, requests outside the MCP endpoint get a 404.
+    """
+
+    def __init__(self, path: str = "/mcp"):
+        # fastmcp's default endpoint path
+        self.path = path
+        self.app: ASGIApp | None = None
+        self._lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def load(self, parent: Any) -> ASGIApp:
+        """Import the MCP server and start its lifespan, once"""
+        async with self._lock:
+            if self.app is None:
+                started = time.perf_counter()
+                # Importing fastmcp takes a while, keep the event loop serving meanwhile
+                module = await asyncio.to_thread(importlib.import_module, "app.mcp")
+                running = asyncio.Event()
+                # Its lifespan is entered and left in a task of its own, not in whichever request happened to load it
+                self._task = asyncio.create_task(self._serve(module.mcp_app, parent, running), context=contextvars.Context())
+                waiter = asyncio.create_task(running.wait())
+                await asyncio.wait({self._task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if self._task.done():
+                    self._task.result()
+                self.app = module.mcp_app
+                elapsed = time.perf_counter() - started
+                startup_seconds.set(elapsed, phase="mcp")
+                logger.info(f"Loaded the MCP server in {elapsed:.2f}s")
+        return self.app
+
+    async def _serve(self, app: Any, parent: Any, running: asyncio.Event):
+        async with app.lifespan(parent):
+            running.set()
+            await self._stop.wait()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        app = self.app
+        if app is None:
+            path = scope["path"].removeprefix(scope.get("root_path", ""))
+            if not path.startswith(self.path):
+                await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+                return
+            app = await self.load(scope["app"])
+        await app(scope, receive, send)
+
+    async def close(self):
+        """Stop the MCP server's lifespan if it was started"""
+        self._stop.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class Startup:
+    """Startup progress: timings of the startup phases, and whether warm-up finished so the app is ready for traffic"""
+
+    def __init__(self):
+        self.ready = False
+        self.phases: dict[str, float] = {}
+        self.connections = 0
+        self.canaries = 0
+        self._task: asyncio.Task | None = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a startup phase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = round(seconds, 4)
+        startup_seconds.set(seconds, phase=name)
+
+    def start(self, app: Any, mcp: LazyMCP | None):
+        """Warm up in the background when enabled, otherwise report ready right away"""
+        if not settings.warmup_enabled:
+            self.ready = True
+            return
+        self._task = asyncio.create_task(self.warm_up(app, mcp))
+
+    async def warm_up(self, app: Any, mcp: LazyMCP | None):
+        """Load the MCP server, open upstream connections and run canary searches, then report ready, even if some of it failed"""
+        try:
+            with self.phase("warmup"):
+                async with asyncio.timeout(settings.warmup_timeout):
+                    if mcp is not None:
+                        await mcp.load(app)
+                    self.connections, self.canaries = await get_ddgs().warm_up(settings.warmup_categories, settings.warmup_connections, settings.warmup_queries)
+        except TimeoutError:
+            logger.warning(f"Warm-up did not finish within {settings.warmup_timeout}s")
+        except Exception as e:
+            logger.warning(f"Warm-up failed: {e!r}")
+        self.ready = True
+        logger.info(
+            f"Ready after warm-up: {self.connections} upstream connections opened, {self.canaries}/{len(settings.warmup_queries)} canary searches succeeded, phases: {self.phases}"
+        )
+
+    def status(self) -> dict[str, Any]:
+        return {"status": "ready" if self.ready else "warming up", "phases": self.phases, "connections": self.connections, "canaries": self.canaries}
+
+    async def close(self):
+        """Stop a warm-up still running"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
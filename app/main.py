@@ -1,43 +1,51 @@
 import logging
+import time
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from app import import_started
 from app.config import settings
-from app.ddgs import cleanup_ddgs, initialize_ddgs
-from app.mcp import mcp_app
-from app.routes import search
+from app.ddgs import cleanup_ddgs, get_ddgs, initialize_ddgs
+from app.ddgs.metrics import registry
+from app.diagnostics import TracingMiddleware
+from app.encoding import CompressionMiddleware
+from app.lifecycle import LazyMCP, Startup
+from app.routes import admin, jobs, search
 
+# The MCP server is only imported once warm-up or its first request needs it, and not at all without enabled tools
+mcp = LazyMCP() if settings.mcp_enable_tools else None
+startup = Startup()
 
-# Filter to exclude health check and docs endpoints from access logs
+
+# Filter to exclude health check, metrics and docs endpoints from access logs
 class HealthCheckFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
         message = record.getMessage()
-        return not any(path in message for path in ["/healthz", "/docs", "/redoc", "/openapi.json"])
+        return not any(path in message for path in ["/healthz", "/metrics", "/docs", "/redoc", "/openapi.json"])
 
 
 @asynccontextmanager
-async def app_lifespan(app: FastAPI):
+async def lifespan(app: FastAPI):
     """Application lifecycle management"""
 
     # Initialize DDGS on startup
-    initialize_ddgs()
+    with startup.phase("initialize"):
+        initialize_ddgs()
 
     # Add filter to uvicorn access logger to exclude /healthz logs
     logging.getLogger("uvicorn.access").addFilter(HealthCheckFilter())
 
-    yield
-    # Cleanup resources on shutdown (DDGS has no explicit close method, Python GC handles cleanup automatically)
-    cleanup_ddgs()
-
+    # Warm up in the background, readiness is reported once it is done
+    startup.start(app, mcp)
 
-# Combine both lifespans
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Run both lifespans
-    async with app_lifespan(app):
-        async with mcp_app.lifespan(app):
-            yield
+    yield
+    # Cleanup resources on shutdown
+    await startup.close()
+    if mcp is not None:
+        await mcp.close()
+    await cleanup_ddgs()
 
 
 app = FastAPI(
@@ -50,15 +58,43 @@ app = FastAPI(
     openapi_url=f"{settings.api_prefix}/openapi.json",
 )
 
+if settings.compression_enabled:
+    app.add_middleware(CompressionMiddleware, min_size=settings.compression_min_size, encodings=settings.compression_encodings)
 
-# add health check
+if settings.tracing_enabled:
+    # Outermost, so the request span covers compression too
+    app.add_middleware(TracingMiddleware, server_timing=settings.tracing_server_timing, exclude_paths=("/healthz", "/metrics"))
+
+
+# add health checks
 @app.get("/healthz")
+@app.get("/healthz/live")
 async def health_check():
+    """Liveness: the process is up and serving requests"""
     return "DDGS API is running"
 
 
+@app.get("/healthz/ready")
+async def readiness_check():
+    """Readiness: warm-up finished, so traffic can be routed here"""
+    return JSONResponse(startup.status(), status_code=200 if startup.ready else 503)
+
+
+if settings.metrics_enabled:
+    # add Prometheus metrics
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics():
+        get_ddgs().collect_metrics()
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # Register routes
 app.include_router(search.router, prefix=settings.api_prefix)
+app.include_router(jobs.router, prefix=settings.api_prefix)
+app.include_router(admin.router, prefix=settings.api_prefix)
 
 # add mcp server
-app.mount(settings.api_prefix, mcp_app)
+if mcp is not None:
+    app.mount(settings.api_prefix, mcp)
+
+startup.record("import", time.perf_counter() - import_started)
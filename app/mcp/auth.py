@@ -1,19 +1,41 @@
-from fastapi.security import HTTPAuthorizationCredentials
+from collections import OrderedDict
+
 from fastmcp.server.auth import AccessToken, AuthProvider
 
-# from fastmcp.server.dependencies import get_http_headers
-from app.auth import verify_token
+from app.auth import key_store
+from app.ddgs.tracing import span
+from app.keystore import hash_key
 
 
 class ApiKeyTokenVerifier(AuthProvider):
-    def __init__(self):
+    def __init__(self, cache_size: int = 1024):
         super().__init__(base_url="http://localhost", required_scopes=[])
+        # Recently verified tokens by key digest, so plaintext keys are not kept, dropped whenever the key store reloads
+        self.cache_size = cache_size
+        self._cache: OrderedDict[bytes, AccessToken] = OrderedDict()
+        self._cache_version = key_store.version
 
     async def verify_token(self, api_key: str) -> AccessToken | None:
-        api_key = api_key.removeprefix("Bearer ")
-        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=api_key)
-        try:
-            await verify_token(credentials)
-            return AccessToken(token=api_key, client_id="", scopes=[])
-        except Exception:
+        with span("auth"):
+            return self._verify(api_key.removeprefix("Bearer "))
+
+    def _verify(self, api_key: str) -> AccessToken | None:
+        key_store.check_reload()
+        if self._cache_version != key_store.version:
+            self._cache.clear()
+            self._cache_version = key_store.version
+
+        digest = hash_key(api_key)
+        access_token = self._cache.get(digest)
+        if access_token is not None:
+            self._cache.move_to_end(digest)
+            return access_token
+
+        entry = key_store.lookup(api_key)
+        if entry is None:
             return None
+        access_token = AccessToken(token=digest.hex(), client_id=entry.tenant, scopes=list(entry.scopes), claims={"limits": entry.limits})
+        self._cache[digest] = access_token
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return access_token
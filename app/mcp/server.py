@@ -1,12 +1,73 @@
+from math import ceil
+
 from fastmcp import FastMCP
+from fastmcp.exceptions import ToolError
+from fastmcp.server.dependencies import get_access_token, get_http_headers, get_http_request
+from fastmcp.server.middleware import CallNext, Middleware, MiddlewareContext
 
+from app.auth import key_store
 from app.config import settings
+from app.ddgs import RateLimitedError, get_ddgs
+from app.ddgs.deadline import deadline_scope
+from app.ddgs.tenants import ANONYMOUS, current_tenant
+from app.ddgs.tracing import Span, span
 
 from .auth import ApiKeyTokenVerifier
 
-mcp_auth = ApiKeyTokenVerifier() if settings.api_keys else None
+
+def request_span() -> Span | None:
+    """The span of the traced HTTP request carrying the current tool call"""
+    try:
+        return get_http_request().scope.get("state", {}).get("span")
+    except RuntimeError:
+        return None
+
+
+class TracingMiddleware(Middleware):
+    """Trace tool calls in the trace of the HTTP request carrying them, as they run in a task apart from the request
+
+    Calls without a traced request start a trace of their own, continuing any traceparent header.
+    """
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next: CallNext):
+        name = f"tools/call {context.message.name}"
+        attributes = {"mcp.tool": context.message.name}
+        parent = request_span()
+        if parent is not None:
+            with span(name, parent, **attributes):
+                return await call_next(context)
+        tracer = get_ddgs().tracer
+        if tracer is None:
+            return await call_next(context)
+        with tracer.trace(name, traceparent=get_http_headers().get("traceparent"), **attributes):
+            return await call_next(context)
+
+
+class TenantMiddleware(Middleware):
+    """Attribute tool calls to the caller's API key and apply the key's rate limit and quota, like REST requests"""
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next: CallNext):
+        access_token = get_access_token()
+        tenant = access_token.client_id if access_token is not None and access_token.client_id else ANONYMOUS
+        current_tenant.set(tenant)
+        try:
+            get_ddgs().tenants.check(tenant, access_token.claims.get("limits") if access_token is not None else None)
+        except RateLimitedError as e:
+            raise ToolError(f"{e}, retry after {ceil(e.retry_after)}s") from e
+        return await call_next(context)
+
+
+class DeadlineMiddleware(Middleware):
+    """Run tool calls under the configured request deadline, like REST requests"""
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next: CallNext):
+        with deadline_scope(settings.request_timeout or None):
+            return await call_next(context)
+
+
+mcp_auth = ApiKeyTokenVerifier() if key_store.enabled else None
 
 # Create MCP server with error masking enabled
-mcp = FastMCP("DDG-Search-API", mask_error_details=True, auth=mcp_auth)
+mcp = FastMCP("DDG-Search-API", mask_error_details=True, auth=mcp_auth, middleware=[TracingMiddleware(), TenantMiddleware(), DeadlineMiddleware()])
 
 mcp_app = mcp.http_app(stateless_http=True)
@@ -1,92 +1,148 @@
-from typing import Annotated
+from math import ceil
+from typing import Annotated, Any
+
+from fastmcp.exceptions import ToolError
+from pydantic import BaseModel
 
 from app.config import settings
-from app.ddgs import BooksSearchItem, ImagesSearchItem, NewsSearchItem, TextSearchItem, VideosSearchItem, get_ddgs
+from app.ddgs import (
+    BatchSearchResult,
+    BooksSearchItem,
+    Compactor,
+    DeadlineExceededError,
+    FetchedTextItem,
+    ImagesSearchItem,
+    InvalidFieldsError,
+    Layout,
+    NewsSearchItem,
+    OverloadedError,
+    TextSearchItem,
+    VideosSearchItem,
+    batch_results_adapter,
+    check_fields,
+    compact_format,
+    get_ddgs,
+    run_batch,
+)
+from app.ddgs.metrics import track_request
+from app.routes.models import BatchItem
 
 from .server import mcp
 
 default_max_results = settings.default_max_results or 10
 
 
-if "text" in settings.mcp_enable_tools:
+def tool_error(e: OverloadedError) -> ToolError:
+    """Report shed load with when to retry, and a passed deadline as it is"""
+    if isinstance(e, DeadlineExceededError):
+        return ToolError(str(e))
+    return ToolError(f"{e}, retry after {ceil(e.retry_after)}s")
 
-    @mcp.tool
-    async def search_text(
-        query: Annotated[str, "search query"],
-        max_results: Annotated[int, "maximum number of results to return"] = default_max_results,
-    ) -> list[TextSearchItem]:
-        """search web pages"""
-        params = {"query": query, "max_results": max_results}
-        try:
-            results = await get_ddgs().text(**params)
-            return results
-        except Exception:
-            return []
 
+def compactor(category: str, fields: list[str] | None, max_tokens: int | None, output_layout: Layout | None) -> Compactor | None:
+    """Get the renderer of the compact output a tool call asks for, None for full results"""
+    fmt = compact_format(fields, None, max_tokens or settings.mcp_max_tokens or None, output_layout, settings.compact_chars_per_token)
+    if fmt is None:
+        return None
+    try:
+        return Compactor(category, fmt)
+    except InvalidFieldsError as e:
+        raise ToolError(str(e)) from e
 
-if "images" in settings.mcp_enable_tools:
 
-    @mcp.tool
-    async def search_images(
+def search_tool(category: str, item: type[BaseModel], description: str):
+    """Register the tool searching `category`, returning `item` results or their compact form"""
+
+    async def search(
         query: Annotated[str, "search query"],
         max_results: Annotated[int, "maximum number of results to return"] = default_max_results,
-    ) -> list[ImagesSearchItem]:
-        """search images"""
-
-        params = {"query": query, "max_results": max_results}
+        fields: Annotated[list[str] | None, "only return these result fields, e.g. title and href"] = None,
+        max_tokens: Annotated[int | None, "approximate token budget for all results, long snippets are shortened to fit"] = None,
+        output_layout: Annotated[Layout | None, "compact layout: json, or table for tab-separated rows under a header row"] = None,
+    ) -> list[item] | list[dict[str, Any]] | str:
+        compact = compactor(category, fields, max_tokens, output_layout)
         try:
-            results = await get_ddgs().images(**params)
-            return results
+            with track_request("mcp", category):
+                results = await getattr(get_ddgs(), category)(query=query, max_results=max_results)
+        except OverloadedError as e:
+            raise tool_error(e) from e
         except Exception:
             return []
+        return compact.render(results) if compact is not None else results
 
+    mcp.tool(search, name=f"search_{category}", description=description)
 
-if "videos" in settings.mcp_enable_tools:
 
-    @mcp.tool
-    async def search_videos(
-        query: Annotated[str, "search query"],
-        max_results: Annotated[int, "maximum number of results to return"] = default_max_results,
-    ) -> list[VideosSearchItem]:
-        """search videos"""
+# Result model and description of the search tool of each category
+SEARCH_TOOLS: dict[str, tuple[type[BaseModel], str]] = {
+    "text": (TextSearchItem, "search web pages"),
+    "images": (ImagesSearchItem, "search images"),
+    "videos": (VideosSearchItem, "search videos"),
+    "news": (NewsSearchItem, "search news"),
+    "books": (BooksSearchItem, "search books"),
+}
 
-        params = {"query": query, "max_results": max_results}
-        try:
-            results = await get_ddgs().videos(**params)
-            return results
-        except Exception:
-            return []
+for category, (item_model, description) in SEARCH_TOOLS.items():
+    if category in settings.mcp_enable_tools:
+        search_tool(category, item_model, description)
 
 
-if "news" in settings.mcp_enable_tools:
+if "fetch" in settings.mcp_enable_tools:
 
     @mcp.tool
-    async def search_news(
+    async def search_and_fetch(
         query: Annotated[str, "search query"],
         max_results: Annotated[int, "maximum number of results to return"] = default_max_results,
-    ) -> list[NewsSearchItem]:
-        """search news"""
-
-        params = {"query": query, "max_results": max_results}
+        fetch_top: Annotated[int, "read the pages of this many top results"] = 3,
+        max_tokens: Annotated[int | None, "approximate token budget for the page texts, shared evenly by the pages"] = None,
+    ) -> list[FetchedTextItem]:
+        """search web pages and read the top results' pages in one call, each result comes with the readable text of its page"""
+        ddgs = get_ddgs()
+        if ddgs.fetcher is None:
+            raise ToolError("Page fetching is disabled")
+        fetch_top = max(min(fetch_top, settings.fetch_max_pages), 0)
+        max_tokens = max_tokens or settings.mcp_max_tokens or None
+        max_chars = max(int(max_tokens * settings.compact_chars_per_token / fetch_top), 1) if max_tokens and fetch_top else None
         try:
-            results = await get_ddgs().news(**params)
-            return results
+            with track_request("mcp", "fetch"):
+                return await ddgs.search_and_fetch(query, fetch_top=fetch_top, max_chars=max_chars, max_results=max_results)
+        except OverloadedError as e:
+            raise tool_error(e) from e
         except Exception:
             return []
 
 
-if "books" in settings.mcp_enable_tools:
+if "batch" in settings.mcp_enable_tools:
 
     @mcp.tool
-    async def search_books(
-        query: Annotated[str, "search query"],
-        max_results: Annotated[int, "maximum number of results to return"] = default_max_results,
-    ) -> list[BooksSearchItem]:
-        """search books"""
-
-        params = {"query": query, "max_results": max_results}
-        try:
-            results = await get_ddgs().books(**params)
-            return results
-        except Exception:
-            return []
+    async def search_batch(
+        requests: Annotated[list[BatchItem], "searches to run concurrently, each with a category (text, images, videos, news or books) and a query"],
+    ) -> list[BatchSearchResult] | list[dict[str, Any]]:
+        """run many searches in one call, results are returned in request order"""
+
+        def is_allowed(index: int, item: BatchItem) -> bool:
+            return index < settings.batch_max_requests and item.category in settings.mcp_enable_tools
+
+        searches = []
+        for i, item in enumerate(requests):
+            if is_allowed(i, item):
+                if item.fields:
+                    try:
+                        check_fields(item.category, item.fields)
+                    except InvalidFieldsError as e:
+                        raise ToolError(str(e)) from e
+                params = item.to_dict({})
+                params.setdefault("max_results", default_max_results)
+                searches.append((item.category, params))
+
+        with track_request("mcp", "batch"):
+            results = iter(await run_batch(get_ddgs(), searches, concurrency=settings.batch_max_concurrency, timeout=settings.batch_timeout))
+        batch = [
+            next(results) if is_allowed(i, item) else BatchSearchResult(category=item.category, error=f"{item.category} search is not allowed in this batch")
+            for i, item in enumerate(requests)
+        ]
+        if not any(item.fields for item in requests):
+            return batch
+        # Each sub-request keeps its own fields, sub-requests without fields keep all of them
+        include = {i: {"category": True, "error": True, "results": {"__all__": set(item.fields)}} if item.fields else True for i, item in enumerate(requests)}
+        return batch_results_adapter.dump_python(batch, mode="json", include=include)
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import time
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from app.auth import require_scope
+from app.config import settings
+from app.ddgs import LocalIndex, LocalIndexError, get_ddgs
+from app.diagnostics import ProfilerBusyError, collapsed, profiler
+
+from .models import IndexEvictRequest
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_scope("admin"))])
+
+
+def local_index() -> LocalIndex:
+    """Get the local index, 404 when it is disabled"""
+    index = get_ddgs().index
+    if index is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Local index is disabled")
+    return index
+
+
+@router.get("/index")
+async def index_stats(index: LocalIndex = Depends(local_index)) -> dict[str, Any]:
+    """Local index statistics"""
+    try:
+        await index.recount()
+    except LocalIndexError as e:
+        logger.error(f"Error counting local index: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)) from e
+    return index.stats()
+
+
+@router.post("/index/compact")
+async def compact_index(index: LocalIndex = Depends(local_index)) -> dict[str, Any]:
+    """Merge the local index segments and shrink its database file"""
+    before = index.file_size()
+    try:
+        await index.compact()
+    except LocalIndexError as e:
+        logger.error(f"Error compacting local index: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)) from e
+    return {"file_bytes_before": before, **index.stats()}
+
+
+@router.post("/index/evict")
+async def evict_index(request: IndexEvictRequest | None = None, index: LocalIndex = Depends(local_index)) -> dict[str, Any]:
+    """Evict local index results beyond an age, document count or size, the configured limits by default"""
+    request = request or IndexEvictRequest()
+    try:
+        evicted = await index.evict(max_docs=request.max_docs, max_bytes=request.max_bytes, max_age=request.max_age)
+    except LocalIndexError as e:
+        logger.error(f"Error evicting from local index: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)) from e
+    return {"evicted": evicted, **index.stats()}
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    duration: float = Query(10, gt=0, description="seconds to sample for, at most PROFILER_MAX_DURATION"),
+    interval: float = Query(0.01, ge=0.001, le=1, description="seconds between samples"),
+    idle: bool = Query(False, description="also count threads waiting for work"),
+) -> PlainTextResponse:
+    """Sample the stacks of all threads, returned in the collapsed stack format of flame graph tools"""
+    if not settings.profiler_enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profiler is disabled")
+    duration = min(duration, settings.profiler_max_duration)
+    try:
+        # Sampling blocks, so it runs in a thread of its own, which leaves itself out of the profile
+        stacks, samples = await asyncio.to_thread(profiler.sample, duration, interval, idle)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e)) from e
+    filename = time.strftime("profile-%Y%m%dT%H%M%S.folded", time.gmtime())
+    return PlainTextResponse(collapsed(stacks), headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Profile-Samples": str(samples)})
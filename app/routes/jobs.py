@@ -0,0 +1,178 @@
+import asyncio
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+
+from app.auth import identify_tenant, limit_tenant, require_api_key, verify_token
+from app.config import settings
+from app.ddgs import JobResultsPage, JobRunner, JobStatus, get_ddgs
+from app.keystore import ApiKey
+
+from .models import Category, JobRequest, StreamFormat, batch_item_adapter
+
+# Jobs belong to the tenant of their API key, so without API keys everyone would share them.
+# Only creating a job counts against the rate limit, its searches are counted as they run and following a job is free
+router = APIRouter(prefix="/jobs", tags=["Jobs"], dependencies=[Depends(require_api_key("Search jobs"))])
+
+NDJSON_MEDIA_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+
+# Invalid queries reported at most per rejected job
+MAX_REPORTED_ERRORS = 10
+
+# Seconds between checks for newly finished searches while streaming results
+STREAM_POLL_INTERVAL = 1.0
+
+page_adapter = TypeAdapter(JobResultsPage)
+
+
+def job_runner() -> JobRunner:
+    """Get the job runner, 404 when jobs are disabled"""
+    runner = get_ddgs().jobs
+    if runner is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Search jobs are disabled")
+    return runner
+
+
+def parse_ndjson(body: bytes) -> list[Any]:
+    """Read one query string or search request object per line, skipping blank lines"""
+    entries = []
+    for number, line in enumerate(body.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Line {number} is not valid JSON: {e}") from e
+        if len(entries) > settings.jobs_max_queries:
+            break
+    return entries
+
+
+def job_searches(entries: list[Any], shared: dict[str, Any]) -> list[tuple[str, dict[str, Any]]]:
+    """Validate a job's queries into (category, params) searches, rejecting the job with its first invalid queries"""
+    if len(entries) > settings.jobs_max_queries:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Job exceeds the limit of {settings.jobs_max_queries} queries")
+
+    searches, errors = [], []
+    for index, entry in enumerate(entries):
+        try:
+            item = batch_item_adapter.validate_python({**shared, **(entry if isinstance(entry, dict) else {"query": entry})})
+        except ValidationError as e:
+            errors.append({"index": index, "errors": e.errors(include_url=False, include_context=False, include_input=False)})
+            if len(errors) >= MAX_REPORTED_ERRORS:
+                break
+            continue
+        searches.append((item.category, item.to_dict(settings.default_search_params)))
+    if errors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors)
+    return searches
+
+
+def parse_cursor(cursor: str | None) -> int:
+    """Position in a job's finished searches a cursor points at"""
+    if cursor is None:
+        return 0
+    if not cursor.isdigit():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed cursor")
+    return int(cursor)
+
+
+@router.post("", status_code=status.HTTP_202_ACCEPTED)
+async def create_job(
+    request: Request,
+    category: Category = Query("text", description="search category of NDJSON queries without their own"),
+    tenant: str = Depends(limit_tenant),
+    api_key: ApiKey | None = Depends(verify_token),
+) -> JobStatus:
+    """Queue a search job (a JSON job request, or NDJSON with one query string or search request object per line)
+
+    The searches run in the background within the API key's rate limit and quota, fetch their results from `/jobs/{id}/results`.
+    """
+    runner = job_runner()
+    body = await request.body()
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if media_type in NDJSON_MEDIA_TYPES:
+        entries, shared = parse_ndjson(body), {"category": category}
+    else:
+        try:
+            job = JobRequest.model_validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False)) from e
+        entries, shared = job.queries, job.shared()
+
+    searches = job_searches(entries, shared)
+    return await runner.submit(tenant, api_key.limits if api_key is not None else None, searches)
+
+
+@router.get("")
+async def list_jobs(tenant: str = Depends(identify_tenant)) -> list[JobStatus]:
+    """List the API key's search jobs, the newest first"""
+    return await job_runner().store.jobs(tenant)
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, tenant: str = Depends(identify_tenant)) -> JobStatus:
+    """Search job progress"""
+    job = await job_runner().store.get(job_id, tenant)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@router.delete("/{job_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_job(job_id: str, tenant: str = Depends(identify_tenant)):
+    """Cancel a search job and delete its results"""
+    if not await job_runner().store.delete(job_id, tenant):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+
+
+@router.get("/{job_id}/results")
+async def job_results(
+    job_id: str,
+    cursor: str | None = Query(None, description="next_cursor of a previous page"),
+    limit: int = Query(100, description="results per page", ge=1, le=1000),
+    stream: StreamFormat | None = Query(None, description="stream results as newline-delimited JSON (ndjson) or server-sent events (sse) as they finish, until the job is done"),
+    tenant: str = Depends(identify_tenant),
+) -> JobResultsPage:
+    """Results of a search job's finished searches, in the order they finished, each with its position in the job"""
+    store = job_runner().store
+    after = parse_cursor(cursor)
+    job, results = await store.results(job_id, tenant, after, limit)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+
+    if stream:
+        return StreamingResponse(stream_job_results(job_id, tenant, after, stream), media_type="text/event-stream" if stream == "sse" else "application/x-ndjson")
+
+    position = after + len(results)
+    next_cursor = None if job.status == "done" and position >= job.finished else str(position)
+    return Response(content=page_adapter.dump_json(JobResultsPage(results=results, next_cursor=next_cursor)), media_type="application/json")
+
+
+async def stream_job_results(job_id: str, tenant: str, after: int, stream: StreamFormat) -> AsyncIterator[str]:
+    """Send a job's results from the `after`th on as they finish, until the job is done or deleted"""
+    store = job_runner().store
+    count = 0
+    while True:
+        job, results = await store.results(job_id, tenant, after, 500)
+        if job is None:
+            break
+        for result in results:
+            count += 1
+            if stream == "sse":
+                yield f"event: result\ndata: {result.model_dump_json()}\n\n"
+            else:
+                yield f"{result.model_dump_json()}\n"
+        after += len(results)
+        if not results:
+            if job.status == "done" and after >= job.finished:
+                break
+            await asyncio.sleep(STREAM_POLL_INTERVAL)
+
+    if stream == "sse":
+        yield f'event: done\ndata: {{"count": {count}}}\n\n'
@@ -1,6 +1,14 @@
-from typing import Any
+from typing import Annotated, Any, Literal, Self
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter, field_validator, model_validator
+
+from app.ddgs.compact import CompactFormat, Layout, compact_format
+
+# Streaming response formats: newline-delimited JSON or server-sent events
+StreamFormat = Literal["ndjson", "sse"]
+
+# Search categories
+Category = Literal["text", "images", "videos", "news", "books"]
 
 
 class BaseSearchRequest(BaseModel):
@@ -13,10 +21,32 @@ class BaseSearchRequest(BaseModel):
     max_results: int | None = Field(None, description="maximum number of results to return. Defaults to 10", ge=1, le=100)
     page: int | None = Field(None, description="page of results to return. Defaults to 1", ge=1)
     backend: str | None = Field(None, description='single or comma-delimited backends. Defaults to "auto"')
+    fanout: bool | None = Field(None, description="query the backends in parallel with hedged requests and merge the first results")
+    paginate: bool | None = Field(None, description="return a page object with a next_cursor instead of a plain result list")
+    cursor: str | None = Field(None, description="next_cursor of a previous page, the search parameters are taken from it")
+    timeout: float | None = Field(None, description="seconds to wait for results, can only shorten the request deadline", gt=0)
+    fields: list[str] | None = Field(None, description="result fields to return, e.g. title and href, also as one comma-separated string")
+    max_chars: int | None = Field(None, description="compact output: character budget for all results, long snippets are shortened to fit", ge=1)
+    max_tokens: int | None = Field(None, description="compact output: approximate token budget for all results", ge=1)
+    output_layout: Layout | None = Field(None, description="compact output: a JSON list (json) or tab-separated rows under a header row (table)")
+
+    @field_validator("fields", mode="before")
+    @classmethod
+    def split_fields(cls, value: Any) -> Any:
+        """Accept comma-separated field names, as in `?fields=title,href`"""
+        if isinstance(value, str):
+            value = [value]
+        if isinstance(value, list) and all(isinstance(item, str) for item in value):
+            return [name.strip() for item in value for name in item.split(",") if name.strip()]
+        return value
 
     def to_dict(self, defaults: dict[str, Any]) -> dict[str, Any]:
         """Convert request to dictionary"""
-        return {**defaults, **self.model_dump(exclude_none=True)}
+        return {**defaults, **self.model_dump(exclude_none=True, exclude={"paginate", "cursor", "fields", "max_chars", "max_tokens", "output_layout"})}
+
+    def compact_format(self, chars_per_token: float) -> CompactFormat | None:
+        """Get the compact output format asked for, None for full results"""
+        return compact_format(self.fields, self.max_chars, self.max_tokens, self.output_layout, chars_per_token)
 
 
 class TextSearchRequest(BaseSearchRequest):
@@ -25,6 +55,18 @@ class TextSearchRequest(BaseSearchRequest):
     pass
 
 
+class TextQueryRequest(TextSearchRequest):
+    """Quick search request model, read from the query string together with the streaming format"""
+
+    stream: StreamFormat | None = Field(None, description="stream results as they arrive, as newline-delimited JSON (ndjson) or server-sent events (sse)")
+
+    def to_dict(self, defaults: dict[str, Any]) -> dict[str, Any]:
+        """Convert query parameters to search parameters"""
+        params = super().to_dict(defaults)
+        params.pop("stream", None)
+        return params
+
+
 class ImagesSearchRequest(BaseSearchRequest):
     """Image search request model"""
 
@@ -53,3 +95,112 @@ class BooksSearchRequest(BaseSearchRequest):
     """Books search request model"""
 
     pass
+
+
+class SearchFetchRequest(BaseModel):
+    """Search and fetch request model"""
+
+    query: str = Field(..., description="search query", min_length=1)
+    region: str | None = Field(None, description="region to use for the search (e.g., us-en, uk-en, ru-ru, etc.)")
+    safesearch: str | None = Field(None, description="safesearch setting (e.g., on, moderate, off)")
+    timelimit: str | None = Field(None, description="timelimit for the search (e.g., d, w, m, y) or custom date range")
+    max_results: int | None = Field(None, description="maximum number of results to return. Defaults to 10", ge=1, le=100)
+    backend: str | None = Field(None, description='single or comma-delimited backends. Defaults to "auto"')
+    fanout: bool | None = Field(None, description="query the backends in parallel with hedged requests and merge the first results")
+    timeout: float | None = Field(None, description="seconds to wait for results and pages, can only shorten the request deadline", gt=0)
+    fetch_top: int = Field(3, description="fetch the pages of this many top results, up to the configured maximum", ge=0)
+    page_max_chars: int | None = Field(None, description="characters of text returned per page, up to the configured maximum", ge=1)
+
+    def to_dict(self, defaults: dict[str, Any]) -> dict[str, Any]:
+        """Convert request to search and fetch parameters"""
+        params = {**defaults, **self.model_dump(exclude_none=True, exclude={"page_max_chars"})}
+        if self.page_max_chars is not None:
+            params["max_chars"] = self.page_max_chars
+        return params
+
+
+class BatchSearchItem(BaseSearchRequest):
+    """Base model of a batch sub-request, tagged with its search category"""
+
+    @model_validator(mode="after")
+    def reject_page_and_compact_options(self) -> Self:
+        """Sub-requests return plain result lists, so refuse the paging and compact output options instead of ignoring them"""
+        unsupported = [name for name in ("paginate", "cursor", "max_chars", "max_tokens", "output_layout") if getattr(self, name) is not None]
+        if unsupported:
+            raise ValueError(f"{', '.join(unsupported)} not supported in batch sub-requests")
+        return self
+
+    def to_dict(self, defaults: dict[str, Any]) -> dict[str, Any]:
+        """Convert sub-request to search parameters"""
+        params = super().to_dict(defaults)
+        params.pop("category", None)
+        return params
+
+
+class TextBatchItem(BatchSearchItem, TextSearchRequest):
+    """Text batch sub-request model"""
+
+    category: Literal["text"]
+
+
+class ImagesBatchItem(BatchSearchItem, ImagesSearchRequest):
+    """Images batch sub-request model"""
+
+    category: Literal["images"]
+
+
+class VideosBatchItem(BatchSearchItem, VideosSearchRequest):
+    """Videos batch sub-request model"""
+
+    category: Literal["videos"]
+
+
+class NewsBatchItem(BatchSearchItem, NewsSearchRequest):
+    """News batch sub-request model"""
+
+    category: Literal["news"]
+
+
+class BooksBatchItem(BatchSearchItem, BooksSearchRequest):
+    """Books batch sub-request model"""
+
+    category: Literal["books"]
+
+
+BatchItem = Annotated[TextBatchItem | ImagesBatchItem | VideosBatchItem | NewsBatchItem | BooksBatchItem, Field(discriminator="category")]
+
+
+class BatchSearchRequest(BaseModel):
+    """Batch search request model"""
+
+    requests: list[BatchItem] = Field(..., description="search sub-requests, may mix categories", min_length=1)
+    concurrency: int | None = Field(None, description="maximum number of sub-requests searched at once", ge=1)
+    timeout: float | None = Field(None, description="deadline for the whole batch in seconds", gt=0)
+
+
+# Validates one search of a job, tagged with its category
+batch_item_adapter: TypeAdapter[BatchItem] = TypeAdapter(BatchItem)
+
+
+class JobRequest(BaseModel):
+    """Search job request model, the search parameters given here apply to every query that does not set its own"""
+
+    queries: list[str | dict[str, Any]] = Field(..., description="queries, or search requests with their own parameters and category", min_length=1)
+    category: Category = Field("text", description="search category of the queries")
+    region: str | None = Field(None, description="region to use for the searches (e.g., us-en, uk-en, ru-ru, etc.)")
+    safesearch: str | None = Field(None, description="safesearch setting (e.g., on, moderate, off)")
+    timelimit: str | None = Field(None, description="timelimit for the searches (e.g., d, w, m, y)")
+    max_results: int | None = Field(None, description="maximum number of results per search. Defaults to 10", ge=1, le=100)
+    backend: str | None = Field(None, description='single or comma-delimited backends. Defaults to "auto"')
+
+    def shared(self) -> dict[str, Any]:
+        """Search parameters shared by the queries"""
+        return self.model_dump(exclude_none=True, exclude={"queries"})
+
+
+class IndexEvictRequest(BaseModel):
+    """Local index eviction request model, limits left out default to the configured ones"""
+
+    max_docs: int | None = Field(None, description="results to keep at most, the least recently fetched are evicted first", ge=0)
+    max_bytes: int | None = Field(None, description="encoded size of the results to keep at most", ge=0)
+    max_age: float | None = Field(None, description="evict results fetched more than this many seconds ago", ge=0)
@@ -1,104 +1,324 @@
+import asyncio
+import json
 import logging
+import math
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from math import ceil
+from typing import Any
 
-from fastapi import APIRouter, Depends, Query
-from models import BooksSearchRequest, ImagesSearchRequest, NewsSearchRequest, TextSearchRequest, VideosSearchRequest
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import TypeAdapter
 
-from app.auth import verify_token
+from app.auth import limit_tenant
 from app.config import settings
-from app.ddgs import BooksSearchItem, ImagesSearchItem, NewsSearchItem, TextSearchItem, VideosSearchItem, get_ddgs
+from app.ddgs import (
+    ITEM_ADAPTERS,
+    PAGE_ADAPTERS,
+    BatchSearchResult,
+    BooksSearchItem,
+    Compactor,
+    FetchedTextItem,
+    ImagesSearchItem,
+    InvalidCursorError,
+    InvalidFieldsError,
+    NewsSearchItem,
+    OverloadedError,
+    SearchPage,
+    TextSearchItem,
+    VideosSearchItem,
+    batch_results_adapter,
+    check_fields,
+    get_ddgs,
+    run_batch,
+)
+from app.ddgs.deadline import Deadline, DeadlineExceededError, current_deadline, deadline_scope
+from app.ddgs.metrics import client_disconnects, track_request
+from app.ddgs.tracing import span
+from app.encoding import MSGPACK_MEDIA_TYPE, BodyFormat, negotiate_body_format, packb
+
+from .models import (
+    BaseSearchRequest,
+    BatchSearchRequest,
+    BooksSearchRequest,
+    ImagesSearchRequest,
+    NewsSearchRequest,
+    SearchFetchRequest,
+    StreamFormat,
+    TextQueryRequest,
+    TextSearchRequest,
+    VideosSearchRequest,
+)
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/search", tags=["Search"], dependencies=[Depends(verify_token)])
 
+async def watch_disconnect(request: Request, deadline: Deadline):
+    """Expire the request's deadline when its client disconnects, cancelling the searches nobody waits for any more"""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+    if deadline.active:
+        client_disconnects.inc(interface="rest")
+    deadline.expire()
 
-@router.get("")
-async def search(request: TextSearchRequest = Query(...)) -> list[TextSearchItem]:
-    """Quick search (direct text search)"""
+
+async def request_deadline(
+    request: Request,
+    x_request_timeout: float | None = Header(None, description="seconds to wait for results, up to the configured maximum", gt=0),
+) -> AsyncIterator[Deadline]:
+    """Give the request a deadline from its X-Request-Timeout header or the configured default, expired early on disconnect"""
+    timeout = x_request_timeout or settings.request_timeout
+    if settings.request_max_timeout > 0:
+        timeout = min(timeout, settings.request_max_timeout)
+    # Without a timeout the deadline never passes, but still ends the searches of a client that went away
+    deadline = Deadline(time.monotonic() + timeout if timeout > 0 else math.inf)
+    current_deadline.set(deadline)
+    # The body is read before dependencies run, so the only message left to receive is the disconnect
+    watcher = asyncio.create_task(watch_disconnect(request, deadline))
+    try:
+        yield deadline
+    finally:
+        watcher.cancel()
+
+
+router = APIRouter(prefix="/search", tags=["Search"], dependencies=[Depends(limit_tenant), Depends(request_deadline)])
+
+fetched_items_adapter = TypeAdapter(list[FetchedTextItem])
+
+stream_query = Query(None, description="stream results as they arrive, as newline-delimited JSON (ndjson) or server-sent events (sse)")
+
+
+def overloaded(e: OverloadedError) -> HTTPException:
+    """Turn shed load into a 503/429 response telling the client when to retry, and a passed deadline into a 504"""
+    if isinstance(e, DeadlineExceededError):
+        return HTTPException(status_code=e.status_code, detail=str(e))
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(ceil(e.retry_after))})
+
+
+def accepted_body_format(request: Request) -> BodyFormat:
+    """Negotiate the response body format from the Accept header"""
+    return negotiate_body_format(request.headers.get("accept"))
+
+
+def projection(category: str, fields: list[str] | None) -> set[str] | None:
+    """Validate the result fields a request asks for, None for all fields"""
+    if not fields:
+        return None
+    try:
+        check_fields(category, fields)
+    except InvalidFieldsError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+    return set(fields)
+
+
+@dataclass(frozen=True, slots=True)
+class Output:
+    """How a request wants its results sent: which fields, compacted to a budget or not, and in which body format"""
+
+    category: str
+    fields: set[str] | None = None
+    compact: Compactor | None = None
+    body_format: BodyFormat = "json"
+
+
+def output(category: str, request: BaseSearchRequest, body_format: BodyFormat) -> Output:
+    """Get the output a search request asks for, rejecting unknown fields before anything is searched"""
+    fields = projection(category, request.fields)
+    fmt = request.compact_format(settings.compact_chars_per_token)
+    # Projection alone is cheaper done by the serializer, the compactor only runs for budgets and tables
+    compact = Compactor(category, fmt) if fmt is not None and (fmt.max_chars is not None or fmt.layout == "table") else None
+    return Output(category, fields=fields, compact=compact, body_format=body_format)
+
+
+def encoded_response(adapter: TypeAdapter, value: Any, include: Any, body_format: BodyFormat) -> Response:
+    """Serialize straight to JSON or MessagePack bytes, keeping only the included fields"""
+    with span("serialize"):
+        if body_format == "msgpack":
+            return Response(content=packb(adapter.dump_python(value, mode="json", include=include)), media_type=MSGPACK_MEDIA_TYPE)
+        return Response(content=adapter.dump_json(value, include=include), media_type="application/json")
+
+
+def search_response(results: list[Any], out: Output) -> Any:
+    """Serialize results straight to bytes, skipping response model revalidation unless `FAST_RESPONSE` is off
+
+    With a compactor, results are projected and shrunk to its budget, tables are sent as plain text.
+    """
+    if out.compact is not None:
+        with span("serialize"):
+            rendered = out.compact.render(results)
+            if isinstance(rendered, str):
+                return PlainTextResponse(rendered)
+            if out.body_format == "msgpack":
+                return Response(content=packb(rendered), media_type=MSGPACK_MEDIA_TYPE)
+            return Response(content=json.dumps(rendered, ensure_ascii=False, separators=(",", ":")), media_type="application/json")
+    if settings.fast_response or out.fields is not None or out.body_format != "json":
+        return encoded_response(ITEM_ADAPTERS[out.category], results, {"__all__": out.fields} if out.fields else None, out.body_format)
+    return results
+
+
+async def search_page(params: dict[str, Any], cursor: str | None, out: Output) -> Any:
+    """Get one page of results with the cursor of the next page"""
+    category = out.category
+    query = params.pop("query")
+    timeout = params.pop("timeout", None)
+    try:
+        with track_request("rest", category), deadline_scope(timeout):
+            items, next_cursor = await get_ddgs().paginator.page(category, query, params, cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+    except OverloadedError as e:
+        raise overloaded(e) from e
+    except Exception as e:
+        logger.error(f"Error paginating {category}: {e}, params: {params}")
+        items, next_cursor = [], None
+
+    page = SearchPage(results=items, next_cursor=next_cursor)
+    if settings.fast_response or out.fields is not None or out.body_format != "json":
+        return encoded_response(PAGE_ADAPTERS[category], page, {"results": {"__all__": out.fields}, "next_cursor": True} if out.fields else None, out.body_format)
+    return page
+
+
+def stream_search(params: dict[str, Any], stream: StreamFormat, out: Output) -> StreamingResponse:
+    """Stream search results to the client as soon as the engines return them"""
+    category = out.category
+
+    async def events() -> AsyncIterator[str]:
+        count = 0
+        try:
+            with track_request("stream", category):
+                async for item in get_ddgs().stream(category, **params):
+                    count += 1
+                    if stream == "sse":
+                        yield f"event: result\ndata: {item.model_dump_json(include=out.fields)}\n\n"
+                    else:
+                        yield f"{item.model_dump_json(include=out.fields)}\n"
+        except OverloadedError as e:
+            logger.warning(f"Shed streaming {category}: {e}, params: {params}")
+            if stream == "sse":
+                yield f"event: error\ndata: {json.dumps({'detail': str(e), 'retry_after': ceil(e.retry_after)})}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming {category}: {e}, params: {params}")
+            if stream == "sse":
+                yield "event: error\ndata: {}\n\n"
+
+        if stream == "sse":
+            yield f'event: done\ndata: {{"count": {count}}}\n\n'
+
+    if stream == "sse":
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+async def category_search(category: str, request: BaseSearchRequest, stream: StreamFormat | None, body_format: BodyFormat) -> Any:
+    """Answer a search of `category` as a stream, a page or the full result list
+
+    Shed load and passed deadlines are answered with their status code, other upstream failures with an empty list.
+    """
     params = request.to_dict(settings.default_search_params)
+    out = output(category, request, body_format)
+    if stream:
+        return stream_search(params, stream, out)
+    if request.paginate or request.cursor:
+        return await search_page(params, request.cursor, out)
+
     try:
-        results = await get_ddgs().text(**params)
-        return results
+        with track_request("rest", category):
+            results = await getattr(get_ddgs(), category)(**params)
+    except OverloadedError as e:
+        raise overloaded(e) from e
     except Exception as e:
-        logger.error(f"Error searching text: {e}, params: {params}")
+        logger.error(f"Error searching {category}: {e}, params: {params}")
         return []
+    return search_response(results, out)
+
+
+@router.get("")
+async def search(request: TextQueryRequest = Query(...), body_format: BodyFormat = Depends(accepted_body_format)) -> list[TextSearchItem] | SearchPage[TextSearchItem]:
+    """Quick search (direct text search)"""
+    return await category_search("text", request, request.stream, body_format)
 
 
 @router.post("/text")
-async def search_text(request: TextSearchRequest) -> list[TextSearchItem]:
+async def search_text(
+    request: TextSearchRequest, stream: StreamFormat | None = stream_query, body_format: BodyFormat = Depends(accepted_body_format)
+) -> list[TextSearchItem] | SearchPage[TextSearchItem]:
     """Text search"""
+    return await category_search("text", request, stream, body_format)
+
+
+@router.post("/fetch")
+async def search_and_fetch(request: SearchFetchRequest, body_format: BodyFormat = Depends(accepted_body_format)) -> list[FetchedTextItem]:
+    """Text search that also fetches the top results' pages concurrently and returns their readable text"""
+    ddgs = get_ddgs()
+    if ddgs.fetcher is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Page fetching is disabled")
+
     params = request.to_dict(settings.default_search_params)
+    params["fetch_top"] = min(request.fetch_top, settings.fetch_max_pages)
     try:
-        results = await get_ddgs().text(**params)
-        return results
+        with track_request("rest", "fetch"):
+            results = await ddgs.search_and_fetch(**params)
+    except OverloadedError as e:
+        raise overloaded(e) from e
     except Exception as e:
-        logger.error(f"Error searching text: {e}, params: {params}")
+        logger.error(f"Error searching and fetching: {e}, params: {params}")
         return []
+    if settings.fast_response or body_format != "json":
+        return encoded_response(fetched_items_adapter, results, None, body_format)
+    return results
 
 
 @router.post("/images")
-async def search_images(request: ImagesSearchRequest) -> list[ImagesSearchItem]:
+async def search_images(
+    request: ImagesSearchRequest, stream: StreamFormat | None = stream_query, body_format: BodyFormat = Depends(accepted_body_format)
+) -> list[ImagesSearchItem] | SearchPage[ImagesSearchItem]:
     """Image search"""
-    params = request.to_dict(settings.default_search_params)
-    # Add image-specific parameters
-    if request.size is not None:
-        params["size"] = request.size
-    if request.color is not None:
-        params["color"] = request.color
-    if request.type_image is not None:
-        params["type_image"] = request.type_image
-    if request.layout is not None:
-        params["layout"] = request.layout
-    if request.license_image is not None:
-        params["license_image"] = request.license_image
-
-    try:
-        results = await get_ddgs().images(**params)
-        return results
-    except Exception as e:
-        logger.error(f"Error searching images: {e}, params: {params}")
-        return []
+    return await category_search("images", request, stream, body_format)
 
 
 @router.post("/videos")
-async def search_videos(request: VideosSearchRequest) -> list[VideosSearchItem]:
+async def search_videos(
+    request: VideosSearchRequest, stream: StreamFormat | None = stream_query, body_format: BodyFormat = Depends(accepted_body_format)
+) -> list[VideosSearchItem] | SearchPage[VideosSearchItem]:
     """Video search"""
-    params = request.to_dict(settings.default_search_params)
-    # Add video-specific parameters
-    if request.resolution is not None:
-        params["resolution"] = request.resolution
-    if request.duration is not None:
-        params["duration"] = request.duration
-    if request.license_videos is not None:
-        params["license_videos"] = request.license_videos
-
-    try:
-        results = await get_ddgs().videos(**params)
-        return results
-    except Exception as e:
-        logger.error(f"Error searching videos: {e}, params: {params}")
-        return []
+    return await category_search("videos", request, stream, body_format)
 
 
 @router.post("/news")
-async def search_news(request: NewsSearchRequest) -> list[NewsSearchItem]:
+async def search_news(
+    request: NewsSearchRequest, stream: StreamFormat | None = stream_query, body_format: BodyFormat = Depends(accepted_body_format)
+) -> list[NewsSearchItem] | SearchPage[NewsSearchItem]:
     """News search"""
-    params = request.to_dict(settings.default_search_params)
-    try:
-        results = await get_ddgs().news(**params)
-        return results
-    except Exception as e:
-        logger.error(f"Error searching news: {e}, params: {params}")
-        return []
+    return await category_search("news", request, stream, body_format)
 
 
 @router.post("/books")
-async def search_books(request: BooksSearchRequest) -> list[BooksSearchItem]:
+async def search_books(
+    request: BooksSearchRequest, stream: StreamFormat | None = stream_query, body_format: BodyFormat = Depends(accepted_body_format)
+) -> list[BooksSearchItem] | SearchPage[BooksSearchItem]:
     """Books search"""
-    params = request.to_dict(settings.default_search_params)
-    try:
-        results = await get_ddgs().books(**params)
-        return results
-    except Exception as e:
-        logger.error(f"Error searching books: {e}, params: {params}")
-        return []
+    return await category_search("books", request, stream, body_format)
+
+
+@router.post("/batch")
+async def search_batch(request: BatchSearchRequest, body_format: BodyFormat = Depends(accepted_body_format)) -> list[BatchSearchResult]:
+    """Batch search (many searches of any category, run concurrently, results in input order)"""
+    if len(request.requests) > settings.batch_max_requests:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Batch exceeds the limit of {settings.batch_max_requests} requests",
+        )
+
+    searches = [(item.category, item.to_dict(settings.default_search_params)) for item in request.requests]
+    # Each sub-request keeps its own fields, sub-requests without fields keep all of them
+    projections = [projection(item.category, item.fields) for item in request.requests]
+    include = {i: {"category": True, "error": True, "results": {"__all__": fields}} if fields else True for i, fields in enumerate(projections)} if any(projections) else None
+    concurrency = min(request.concurrency or settings.batch_max_concurrency, settings.batch_max_concurrency)
+    timeout = min(request.timeout or settings.batch_timeout, settings.batch_timeout)
+    with track_request("rest", "batch"):
+        results = await run_batch(get_ddgs(), searches, concurrency=concurrency, timeout=timeout)
+    if settings.fast_response or include is not None or body_format != "json":
+        return encoded_response(batch_results_adapter, results, include, body_format)
+    return results
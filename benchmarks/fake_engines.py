@@ -0,0 +1,52 @@
+"""Search engines that query the local fake upstream instead of the real search providers
+
+They only define a payload and a JSON parser, so they run on the event loop with `SEARCH_ENGINE=async`
+and through `DDGS` in the thread pool otherwise, exactly like the real engines.
+"""
+
+import json
+import os
+from typing import Any
+
+from ddgs.base import BaseSearchEngine
+from ddgs.engines import ENGINES
+
+from app.ddgs.aio import NATIVE_ENGINES
+
+UPSTREAM_URL = os.environ.get("BENCH_UPSTREAM_URL", "http://127.0.0.1:8765")
+
+CATEGORIES = ("text", "images", "videos", "news", "books")
+
+
+def make_engine(category: str) -> type[BaseSearchEngine]:
+    """Build a fake engine class for a search category"""
+
+    class FakeEngine(BaseSearchEngine):
+        name = "fake"
+        provider = "fake"
+        search_url = f"{UPSTREAM_URL}/search/{category}"
+        search_method = "GET"
+
+        def build_payload(self, query: str, region: str, safesearch: str, timelimit: str | None, page: int, **kwargs: Any) -> dict[str, Any]:
+            return {"q": query, "page": str(page)}
+
+        def extract_results(self, html_text: str) -> list[Any]:
+            results = []
+            for data in json.loads(html_text)["results"]:
+                result = self.result_type()
+                for key, value in data.items():
+                    if hasattr(result, key):
+                        setattr(result, key, value)
+                results.append(result)
+            return results
+
+    FakeEngine.category = category
+    return FakeEngine
+
+
+def install():
+    """Replace every real engine with the fake one, in place so all importers of `ENGINES` see it, and run it natively with the async engine"""
+    for category in CATEGORIES:
+        ENGINES[category].clear()
+        ENGINES[category]["fake"] = make_engine(category)
+        NATIVE_ENGINES[category] = {"fake"}
@@ -0,0 +1,259 @@
+"""Benchmark the API against the local fake upstream and print machine-readable results
+
+Starts the fake upstream and the API (with the fake engines installed) as uvicorn subprocesses, drives each scenario at a fixed
+concurrency for a fixed duration, then reports throughput, latency percentiles and per-worker memory as JSON.
+API settings are taken from the environment as usual, e.g. `SEARCH_ENGINE=async CACHE_ENABLED=false python -m benchmarks.run`.
+
+Scenarios:
+
+- `text` - `POST /search/text`
+- `batch` - `POST /search/batch` with `--batch-size` text searches
+- `stream` - `POST /search/text?stream=ndjson`, read to the end
+- `mcp` - `search_text` tool call on the `/mcp` endpoint
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import secrets
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+SCENARIOS = ("text", "batch", "stream", "mcp")
+
+
+def percentile(ordered: list[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def rss_bytes(pid: int) -> int | None:
+    """Resident set size of a process, from /proc"""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def worker_pids(pid: int) -> list[int]:
+    """The uvicorn worker processes under a server process, or the process itself when it has no workers"""
+    try:
+        children = [int(child) for child in Path(f"/proc/{pid}/task/{pid}/children").read_text().split()]
+    except OSError:
+        children = []
+    return children or [pid]
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()  # noqa: S607
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(app: str, port: int, workers: int, env: dict[str, str]) -> subprocess.Popen:
+    command = [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    return subprocess.Popen(command, cwd=ROOT, env=env)  # noqa: S603
+
+
+async def wait_ready(url: str, timeout: float = 30, started: float | None = None) -> float:
+    """Poll until the URL answers with a success status, return the seconds since `started` (default: now)"""
+    started = time.monotonic() if started is None else started
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).is_success:
+                    return time.monotonic() - started
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+
+def build_request(scenario: str, base_url: str, query: str, args: argparse.Namespace) -> tuple[str, str, dict[str, Any], dict[str, str]]:
+    """Method, URL, JSON body and headers of one scenario request"""
+    headers = {"Authorization": f"Bearer {args.api_key}"} if args.api_key else {}
+    if scenario == "text":
+        return "POST", f"{base_url}/search/text", {"query": query, "max_results": args.max_results}, headers
+    if scenario == "batch":
+        requests = [{"category": "text", "query": f"{query} {i}", "max_results": args.max_results} for i in range(args.batch_size)]
+        return "POST", f"{base_url}/search/batch", {"requests": requests}, headers
+    if scenario == "stream":
+        return "POST", f"{base_url}/search/text?stream=ndjson", {"query": query, "max_results": args.max_results}, headers
+    if scenario == "mcp":
+        body = {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": "search_text", "arguments": {"query": query, "max_results": args.max_results}}}
+        return "POST", f"{base_url}/mcp", body, {**headers, "Accept": "application/json, text/event-stream"}
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def run_scenario(scenario: str, base_url: str, server: subprocess.Popen, args: argparse.Namespace) -> dict[str, Any]:
+    """Drive one scenario at `args.concurrency` for `args.duration` seconds"""
+    queries = itertools.cycle([f"{scenario} query {i}" for i in range(args.queries)])
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    errors = 0
+    peak_rss: dict[int, int] = {}
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+
+        async def worker(deadline: float):
+            nonlocal errors
+            while time.monotonic() < deadline:
+                method, url, body, headers = build_request(scenario, base_url, next(queries), args)
+                started = time.perf_counter()
+                try:
+                    async with client.stream(method, url, json=body, headers=headers) as resp:
+                        await resp.aread()
+                    status = str(resp.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+                if not status.startswith("2"):
+                    errors += 1
+
+        async def sample_memory(deadline: float):
+            while time.monotonic() < deadline:
+                for pid in worker_pids(server.pid):
+                    if (rss := rss_bytes(pid)) is not None:
+                        peak_rss[pid] = max(peak_rss.get(pid, 0), rss)
+                await asyncio.sleep(0.5)
+
+        if args.warmup > 0:
+            warmup_deadline = time.monotonic() + args.warmup
+            await asyncio.gather(*(worker(warmup_deadline) for _ in range(args.concurrency)))
+            latencies.clear()
+            statuses.clear()
+            errors = 0
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(sample_memory(deadline), *(worker(deadline) for _ in range(args.concurrency)))
+        elapsed = time.monotonic() - started
+
+    ordered = sorted(latencies)
+    pids = worker_pids(server.pid)
+    return {
+        "scenario": scenario,
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 3),
+        "requests": len(ordered),
+        "errors": errors,
+        "status_counts": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+            "p50": round(percentile(ordered, 50) * 1000, 2),
+            "p95": round(percentile(ordered, 95) * 1000, 2),
+            "p99": round(percentile(ordered, 99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        },
+        "memory": {
+            "workers": len(pids),
+            "rss_bytes": {str(pid): rss_bytes(pid) for pid in pids},
+            "peak_rss_bytes": {str(pid): rss for pid, rss in sorted(peak_rss.items())},
+        },
+    }
+
+
+async def main(args: argparse.Namespace) -> dict[str, Any]:
+    env = {**os.environ, "BENCH_UPSTREAM_URL": f"http://127.0.0.1:{args.upstream_port}"}
+    # Workers share the secret signing pagination cursors
+    env.setdefault("PAGINATION_SECRET", secrets.token_hex(32))
+    upstream = start_server("benchmarks.upstream:app", args.upstream_port, 1, env)
+    started = time.monotonic()
+    api = start_server("benchmarks.server:app", args.port, args.workers, env)
+    base_url = f"http://127.0.0.1:{args.port}{os.environ.get('API_PREFIX', '')}"
+    try:
+        await wait_ready(f"http://127.0.0.1:{args.upstream_port}/docs")
+        # Time until the API serves requests (liveness), and until its warm-up finished (readiness)
+        startup = {"live_seconds": round(await wait_ready(f"http://127.0.0.1:{args.port}/healthz/live", started=started), 3)}
+        startup["ready_seconds"] = round(await wait_ready(f"http://127.0.0.1:{args.port}/healthz/ready", started=started), 3)
+        results = [await run_scenario(scenario, base_url, api, args) for scenario in args.scenarios]
+    finally:
+        for process in (api, upstream):
+            process.terminate()
+            process.wait(timeout=30)
+
+    settings_env = {
+        name: value
+        for name, value in sorted(os.environ.items())
+        if name.startswith(
+            (
+                "BENCH_",
+                "SEARCH_ENGINE",
+                "CACHE_",
+                "EXECUTOR_",
+                "HTTP_",
+                "HTTP2",
+                "ADMISSION_",
+                "BREAKER_",
+                "TENANT_",
+                "FAIR_",
+                "REQUEST_",
+                "FANOUT_",
+                "BATCH_",
+                "WARMUP_",
+                "TRACING_",
+            )
+        )
+    }
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {name: value for name, value in vars(args).items() if name != "api_key"},
+            "env": settings_env,
+            "startup": startup,
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", choices=SCENARIOS, default=["text", "mcp"], help="scenarios to run (default: text mcp)")
+    parser.add_argument("-c", "--concurrency", type=int, default=50, help="concurrent clients (default: 50)")
+    parser.add_argument("-d", "--duration", type=float, default=10, help="seconds per scenario (default: 10)")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of unmeasured load before each scenario (default: 2)")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="API worker processes (default: 1)")
+    parser.add_argument("-q", "--queries", type=int, default=1000, help="distinct queries cycled through, fewer means more cache hits (default: 1000)")
+    parser.add_argument("--max-results", type=int, default=10, help="max_results of each search (default: 10)")
+    parser.add_argument("--batch-size", type=int, default=10, help="searches per batch request (default: 10)")
+    parser.add_argument("--timeout", type=float, default=30, help="client timeout in seconds (default: 30)")
+    parser.add_argument("--port", type=int, default=8760, help="API port (default: 8760)")
+    parser.add_argument("--upstream-port", type=int, default=8765, help="fake upstream port (default: 8765)")
+    parser.add_argument("--api-key", default=os.environ.get("BENCH_API_KEY"), help="bearer token when API_KEYS is set")
+    parser.add_argument("-o", "--output", help="write the JSON report to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    report = asyncio.run(main(arguments))
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        Path(arguments.output).write_text(output + "\n")
+    else:
+        print(output)
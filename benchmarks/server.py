@@ -0,0 +1,9 @@
+"""The API app with upstream engines swapped for the fake ones, run with `uvicorn benchmarks.server:app`"""
+
+from benchmarks import fake_engines
+
+fake_engines.install()
+
+from app.main import app  # noqa: E402
+
+__all__ = ["app"]
@@ -0,0 +1,82 @@
+"""Local stand-in for upstream search engines, with configurable latency, error rate and result size
+
+Configured by environment variables:
+
+- `BENCH_LATENCY` - latency distribution: `fixed`, `uniform`, `exponential` or `lognormal` (default: `lognormal`)
+- `BENCH_LATENCY_MS` - mean latency in milliseconds (default: 200)
+- `BENCH_LATENCY_SIGMA` - spread of the lognormal distribution (default: 0.5)
+- `BENCH_ERROR_RATE` - share of searches answered with an error (default: 0)
+- `BENCH_ERROR_STATUS` - HTTP status of those errors (default: 503)
+- `BENCH_RESULTS` - results per page (default: 10)
+- `BENCH_BODY_BYTES` - size of each result's body text (default: 200)
+- `BENCH_SEED` - random seed (default: 0)
+
+Run with `uvicorn benchmarks.upstream:app`.
+"""
+
+import asyncio
+import math
+import os
+import random
+
+from fastapi import FastAPI, Query, Response
+
+LATENCY = os.environ.get("BENCH_LATENCY", "lognormal")
+LATENCY_MS = float(os.environ.get("BENCH_LATENCY_MS", "200"))
+LATENCY_SIGMA = float(os.environ.get("BENCH_LATENCY_SIGMA", "0.5"))
+ERROR_RATE = float(os.environ.get("BENCH_ERROR_RATE", "0"))
+ERROR_STATUS = int(os.environ.get("BENCH_ERROR_STATUS", "503"))
+RESULTS = int(os.environ.get("BENCH_RESULTS", "10"))
+BODY_BYTES = int(os.environ.get("BENCH_BODY_BYTES", "200"))
+
+rng = random.Random(int(os.environ.get("BENCH_SEED", "0")))  # noqa: S311
+
+app = FastAPI(title="Fake search upstream")
+
+
+def sample_latency() -> float:
+    """Draw one latency in seconds from the configured distribution"""
+    mean = LATENCY_MS / 1000
+    if LATENCY == "fixed":
+        return mean
+    if LATENCY == "uniform":
+        return rng.uniform(0, 2 * mean)
+    if LATENCY == "exponential":
+        return rng.expovariate(1 / mean) if mean > 0 else 0.0
+    if LATENCY == "lognormal":
+        # Parameterized so the distribution's mean is `mean`
+        return rng.lognormvariate(math.log(mean) - LATENCY_SIGMA**2 / 2, LATENCY_SIGMA) if mean > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution: {LATENCY}")
+
+
+def make_result(category: str, query: str, page: int, rank: int) -> dict[str, str]:
+    """Build one result with the fields every category's item model needs"""
+    url = f"https://example.com/{category}/{query.replace(' ', '-')}/{page}/{rank}"
+    body = (f"{query} result {rank} " * (BODY_BYTES // 10 + 1))[:BODY_BYTES]
+    return {
+        "title": f"{query} {page}-{rank}",
+        "href": url,
+        "url": url,
+        "body": body,
+        "image": f"{url}.jpg",
+        "thumbnail": f"{url}.thumb.jpg",
+        "height": "600",
+        "width": "800",
+        "source": "example",
+        "date": "2024-01-01T00:00:00+00:00",
+        "content": url,
+        "description": body,
+        "duration": "1:00",
+        "embed_url": f"{url}/embed",
+        "publisher": "example",
+        "author": "example",
+        "info": body,
+    }
+
+
+@app.get("/search/{category}")
+async def search(category: str, q: str = Query(...), page: int = 1):
+    await asyncio.sleep(sample_latency())
+    if rng.random() < ERROR_RATE:
+        return Response(status_code=ERROR_STATUS)
+    return {"results": [make_result(category, q, page, rank) for rank in range(RESULTS)]}
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.keystore import KeyStore
+from app.main import app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "warmup_enabled", False)
+    monkeypatch.setattr(settings, "profiler_enabled", True)
+    with TestClient(app) as client:
+        yield client
+
+
+def use_keys(monkeypatch, tmp_path, keys: list[dict]):
+    path = tmp_path / "keys.json"
+    path.write_text(json.dumps({"keys": keys}))
+    monkeypatch.setattr("app.auth.key_store", KeyStore(path=str(path)))
+
+
+def test_admin_refused_without_api_keys(client, monkeypatch):
+    monkeypatch.setattr("app.auth.key_store", KeyStore())
+    response = client.get("/admin/profile", params={"duration": 0.05})
+    assert response.status_code == 403
+
+
+def test_admin_needs_admin_scope(client, monkeypatch, tmp_path):
+    use_keys(monkeypatch, tmp_path, [{"key": "user"}, {"key": "root", "scopes": ["admin"]}])
+    assert client.get("/admin/profile", params={"duration": 0.05}).status_code == 401
+    assert client.get("/admin/profile", params={"duration": 0.05}, headers={"Authorization": "Bearer user"}).status_code == 403
+    response = client.get("/admin/profile", params={"duration": 0.05}, headers={"Authorization": "Bearer root"})
+    assert response.status_code == 200
+    assert response.headers["x-profile-samples"]
+
+
+def test_profiler_disabled_by_default():
+    assert type(settings).model_fields["profiler_enabled"].default is False
@@ -0,0 +1,91 @@
+import asyncio
+
+from app.ddgs import TextSearchItem
+from app.ddgs.cache import ResultCache
+from app.ddgs.cache_backends import MemoryCacheBackend
+
+
+def items(label: str) -> list[TextSearchItem]:
+    return [TextSearchItem(title=label, href=f"https://example.com/{label}", body="body")]
+
+
+def make_cache(ttl: float = 60, stale_ttl: float = 0) -> ResultCache:
+    return ResultCache(MemoryCacheBackend(max_entries=100, max_bytes=1 << 20), ttls={"text": ttl}, stale_ttl=stale_ttl)
+
+
+def test_concurrent_searches_are_coalesced():
+    async def run():
+        cache = make_cache()
+        calls = 0
+        release = asyncio.Event()
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return items("shared")
+
+        waiters = [asyncio.create_task(cache.get_or_fetch("text", "key", fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        return cache, calls, results
+
+    cache, calls, results = asyncio.run(run())
+    assert calls == 1
+    assert all(result[0].title == "shared" for result in results)
+    assert (cache.misses, cache.coalesced) == (1, 4)
+
+
+def test_cached_results_are_hits():
+    async def run():
+        cache = make_cache()
+
+        async def fetch():
+            return items("first")
+
+        await cache.get_or_fetch("text", "key", fetch)
+        return cache, await cache.get_or_fetch("text", "key", fetch)
+
+    cache, results = asyncio.run(run())
+    assert results[0].title == "first"
+    assert (cache.misses, cache.hits) == (1, 1)
+
+
+def test_stale_results_are_served_while_refreshing():
+    async def run():
+        cache = make_cache(ttl=0.05, stale_ttl=60)
+        labels = iter(["first", "second"])
+
+        async def fetch():
+            return items(next(labels))
+
+        await cache.get_or_fetch("text", "key", fetch)
+        await asyncio.sleep(0.1)
+        stale = await cache.get_or_fetch("text", "key", fetch)
+        # Let the background refresh store its results
+        await asyncio.sleep(0.01)
+        refreshed = await cache.get("key")
+        return cache, stale, refreshed
+
+    cache, stale, refreshed = asyncio.run(run())
+    assert stale[0].title == "first"
+    assert refreshed[0].title == "second"
+    assert cache.stale == 1
+
+
+def test_expired_results_without_stale_ttl_are_searched_again():
+    async def run():
+        cache = make_cache(ttl=0.05)
+        labels = iter(["first", "second"])
+
+        async def fetch():
+            return items(next(labels))
+
+        await cache.get_or_fetch("text", "key", fetch)
+        await asyncio.sleep(0.1)
+        return cache, await cache.get_or_fetch("text", "key", fetch)
+
+    cache, results = asyncio.run(run())
+    assert results[0].title == "second"
+    assert (cache.misses, cache.stale) == (2, 0)
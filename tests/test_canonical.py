@@ -0,0 +1,53 @@
+import pytest
+
+from app.config import settings
+from app.ddgs.canonical import canonicalize, make_cache_key, normalize_backend, normalize_query
+
+
+@pytest.fixture(autouse=True)
+def no_default_params(monkeypatch):
+    monkeypatch.setattr(settings, "default_search_params", {})
+
+
+def key(category: str, query: str, **params) -> str:
+    return make_cache_key(category, *canonicalize(query, params))
+
+
+def test_query_whitespace_width_and_case_do_not_change_the_key():
+    assert key("text", "  Python　Tutorial ") == key("text", "python tutorial")
+    assert key("text", "ｐｙｔｈｏｎ") == key("text", "python")
+
+
+def test_operators_keep_their_case():
+    assert key("text", "cats OR dogs") != key("text", "cats or dogs")
+
+
+def test_engine_defaults_are_dropped():
+    assert canonicalize("python", {"region": "US-EN", "safesearch": "moderate", "max_results": 10, "page": 1, "backend": "all", "timelimit": None}) == ("python", {})
+    assert key("text", "python", max_results=10) == key("text", "python")
+
+
+def test_parameters_are_normalized():
+    _, params = canonicalize("python", {"region": " DE-de ", "timelimit": "W", "backend": "Bing, duckduckgo,bing"})
+    assert params == {"region": "de-de", "timelimit": "w", "backend": "bing,duckduckgo"}
+
+
+def test_custom_date_range_keeps_its_case():
+    assert canonicalize("python", {"timelimit": "2024-01-01..2024-02-01"})[1] == {"timelimit": "2024-01-01..2024-02-01"}
+
+
+def test_differing_searches_get_differing_keys():
+    assert key("text", "python") != key("news", "python")
+    assert key("text", "python", region="de-de") != key("text", "python")
+    assert key("text", "python", page=2) != key("text", "python")
+
+
+def test_settings_defaults_fill_omitted_parameters(monkeypatch):
+    monkeypatch.setattr(settings, "default_search_params", {"region": "de-de"})
+    assert key("text", "python") == key("text", "python", region="de-de")
+
+
+def test_helpers():
+    assert normalize_query(" a \t b\n") == "a b"
+    assert normalize_backend("") == "auto"
+    assert normalize_backend("auto, bing") == "auto"
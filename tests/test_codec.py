@@ -0,0 +1,45 @@
+import pytest
+
+from app.ddgs import ImagesSearchItem, TextSearchItem, VideosSearchItem
+from app.ddgs.codec import CodecError, decode_items, encode_items
+
+
+def test_text_items_round_trip():
+    items = [TextSearchItem(title="Python ✓", href="https://example.com/", body=""), TextSearchItem(title="b", href="https://example.org/", body="x" * 500)]
+    assert decode_items(encode_items("text", items)) == items
+
+
+def test_images_items_round_trip_with_numbers():
+    items = [ImagesSearchItem(title="sunset", image="https://i/1.jpg", thumbnail="https://t/1.jpg", url="https://example.com/", height=1080, width=1920, source="bing")]
+    decoded = decode_items(encode_items("images", items))
+    assert decoded == items
+    assert isinstance(decoded[0], ImagesSearchItem)
+
+
+def test_videos_items_round_trip_with_dicts_and_none():
+    item = VideosSearchItem(
+        title="talk",
+        content="https://example.com/v",
+        description=None,
+        duration="1:00",
+        embed_html=None,
+        embed_url=None,
+        image_token=None,
+        images={"large": "https://i/l.jpg"},
+        provider=None,
+        published=None,
+        publisher="site",
+        statistics={"viewCount": 12345678901, "likes": -1},
+        uploader=None,
+    )
+    assert decode_items(encode_items("videos", [item])) == [item]
+
+
+def test_empty_list_round_trips():
+    assert decode_items(encode_items("news", [])) == []
+
+
+@pytest.mark.parametrize("data", [b"", b"XX\x01\x00\x00", b"DI\x09\x00\x00", encode_items("text", [TextSearchItem(title="t", href="h", body="b")])[:-3]])
+def test_invalid_data_is_rejected(data):
+    with pytest.raises(CodecError):
+        decode_items(data)
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from app.ddgs import TextSearchItem
+from app.ddgs.compact import ELLIPSIS, CompactFormat, InvalidFieldsError, compact, compact_format, fair_shares, truncate
+
+
+def results(count: int, body_length: int = 400) -> list[TextSearchItem]:
+    return [TextSearchItem(title=f"Result {i}", href=f"https://example.com/{i}", body=("word " * body_length)[:body_length]) for i in range(count)]
+
+
+def test_full_results_need_no_compact_format():
+    assert compact_format(None, None, None, None) is None
+
+
+def test_tighter_budget_applies():
+    assert compact_format(None, 1000, 100, None, chars_per_token=4).max_chars == 400
+    assert compact_format(None, 300, 100, None, chars_per_token=4).max_chars == 300
+
+
+def test_fair_shares_give_leftovers_to_longer_items():
+    assert fair_shares([10, 100, 100], 150) == [10, 70, 70]
+    assert fair_shares([10, 20], 100) == [10, 20]
+    assert sum(fair_shares([50, 50, 50], 100)) <= 100
+
+
+def test_truncate_cuts_at_a_word_and_marks_the_cut():
+    text = "the quick brown fox jumps over the lazy dog"
+    cut = truncate(text, 20)
+    assert len(cut) <= 20
+    assert cut.endswith(ELLIPSIS)
+    assert text.startswith(cut.removesuffix(ELLIPSIS))
+    assert truncate(text, 8) == ""
+    assert truncate(text, 100) == text
+
+
+@pytest.mark.parametrize("budget", [300, 800, 2000])
+def test_json_output_fits_the_budget(budget):
+    rendered = compact("text", results(5), CompactFormat(max_chars=budget))
+    assert len(json.dumps(rendered, ensure_ascii=False, separators=(",", ":"))) <= budget
+    assert [row["title"] for row in rendered] == [f"Result {i}" for i in range(len(rendered))]
+
+
+def test_table_output_fits_the_budget():
+    rendered = compact("text", results(5), CompactFormat(fields=("title", "body"), max_chars=500, layout="table"))
+    lines = rendered.split("\n")
+    assert len(rendered) <= 500
+    assert lines[0] == "title\tbody"
+    assert all(line.count("\t") == 1 for line in lines)
+
+
+def test_fields_are_projected_without_a_budget():
+    assert compact("text", results(2, 10), CompactFormat(fields=("href",))) == [{"href": "https://example.com/0"}, {"href": "https://example.com/1"}]
+
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(InvalidFieldsError):
+        compact("text", results(1), CompactFormat(fields=("title", "nope")))
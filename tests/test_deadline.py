@@ -0,0 +1,87 @@
+import asyncio
+import math
+import time
+
+import pytest
+
+from app.ddgs.deadline import Deadline, DeadlineExceededError, current_deadline, deadline_scope, enforce_deadline, time_left
+
+
+def test_no_deadline_without_a_scope():
+    assert time_left() is None
+    with deadline_scope(None) as deadline:
+        assert deadline is None
+        assert time_left() is None
+
+
+def test_nested_scopes_only_shorten_the_deadline():
+    with deadline_scope(0.5) as outer:
+        with deadline_scope(10):
+            assert time_left() <= 0.5
+        with deadline_scope(0.1):
+            assert time_left() <= 0.1
+        assert current_deadline.get() is outer
+    assert current_deadline.get() is None
+
+
+def test_enforce_deadline_cancels_slow_work():
+    async def run():
+        with deadline_scope(0.05):
+            async with enforce_deadline():
+                await asyncio.sleep(5)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(run())
+    assert time.monotonic() - started < 1
+
+
+def test_passed_deadline_fails_before_starting():
+    async def run():
+        with deadline_scope(0) as deadline:
+            assert deadline.time_left() <= 0
+            async with enforce_deadline():
+                pytest.fail("work ran after its deadline")
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(run())
+
+
+def test_expiring_a_deadline_ends_work_in_spawned_tasks():
+    async def run():
+        deadline = Deadline()
+        current_deadline.set(deadline)
+
+        async def search():
+            # Tasks inherit the request deadline, within their own shorter one
+            with deadline_scope(10):
+                async with enforce_deadline():
+                    await asyncio.sleep(5)
+
+        task = asyncio.create_task(search())
+        await asyncio.sleep(0.01)
+        assert deadline.active
+        deadline.expire()
+        with pytest.raises(DeadlineExceededError):
+            await task
+        assert not deadline.active
+
+    asyncio.run(run())
+
+
+def test_extending_a_deadline_lets_shared_work_finish():
+    async def run():
+        deadline = Deadline(time.monotonic() + 0.05)
+        current_deadline.set(deadline)
+
+        async def search():
+            async with enforce_deadline():
+                await asyncio.sleep(0.1)
+                return "done"
+
+        task = asyncio.create_task(search())
+        await asyncio.sleep(0.01)
+        deadline.extend(math.inf)
+        return await task
+
+    assert asyncio.run(run()) == "done"
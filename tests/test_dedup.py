@@ -0,0 +1,64 @@
+import itertools
+import random
+
+import pytest
+
+from app.ddgs.dedup import MASK64, Deduplicator, deduplicate, normalize_url, simhash
+
+
+def reference_simhash(tokens: list[str]) -> int:
+    features = list(itertools.pairwise(tokens)) if len(tokens) > 1 else tokens
+    hashes = [hash(feature) & MASK64 for feature in features]
+    return sum(1 << bit for bit in range(64) if sum(h >> bit & 1 for h in hashes) > len(features) // 2)
+
+
+@pytest.mark.parametrize(
+    ("url", "normalized"),
+    [
+        ("https://www.Example.com/page/", "//example.com/page"),
+        ("http://example.com/page?utm_source=x&b=2&a=1&fbclid=y#top", "//example.com/page?a=1&b=2"),
+        ("https://amp.example.com/news/story/amp", "//example.com/news/story"),
+        ("https://example.com/story.amp?amp=1", "//example.com/story"),
+        ("https://example.com/docs/amp", "//example.com/docs/amp"),
+        ("https://example.com:443/", "//example.com"),
+        ("https://example.com:8443/", "//example.com:8443"),
+    ],
+)
+def test_normalize_url(url, normalized):
+    assert normalize_url(url) == normalized
+
+
+def test_simhash_matches_bit_counting():
+    rng = random.Random(7)  # noqa: S311
+    words = [f"word{i}" for i in range(50)]
+    for length in (1, 2, 3, 8, 31, 200):
+        tokens = [rng.choice(words) for _ in range(length)]
+        assert simhash(tokens) == reference_simhash(tokens)
+
+
+def test_url_duplicates_are_merged_into_the_first():
+    results = deduplicate(
+        "text",
+        [
+            {"title": "Python", "href": "https://www.python.org/", "body": "short"},
+            {"title": "Python", "href": "http://python.org", "body": "a longer snippet of the page"},
+        ],
+    )
+    assert len(results) == 1
+    assert results[0]["href"] == "https://www.python.org/"
+    assert results[0]["body"] == "a longer snippet of the page"
+
+
+def test_near_duplicate_text_is_dropped():
+    body = "Python is a programming language that lets you work quickly and integrate systems more effectively"
+    dedup = Deduplicator(("title", "body"), merge=False)
+    assert dedup.add({"title": "Welcome to Python", "href": "https://python.org/", "body": body})
+    assert not dedup.add({"title": "Welcome to Python!", "href": "https://mirror.example/python", "body": body.upper()})
+    assert dedup.add({"title": "Rust", "href": "https://rust-lang.org/", "body": "A language empowering everyone to build reliable and efficient software today"})
+    assert dedup.duplicates == 1
+
+
+def test_short_texts_are_not_compared():
+    dedup = Deduplicator(("title", "body"))
+    assert dedup.add({"title": "Home", "href": "https://a.example/"})
+    assert dedup.add({"title": "Home", "href": "https://b.example/"})
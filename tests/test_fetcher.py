@@ -0,0 +1,90 @@
+import asyncio
+
+import httpcore
+import httpx
+import pytest
+
+from app.config import Settings
+from app.ddgs.fetcher import FetchError, PageFetcher, PublicNetworkBackend, PublicTransport
+
+
+class RecordingBackend(httpcore.AsyncMockBackend):
+    def __init__(self, buffer: list[bytes] | None = None):
+        super().__init__(buffer or [])
+        self.connected: list[tuple[str, int]] = []
+
+    async def connect_tcp(self, host, port, *args, **kwargs):
+        self.connected.append((host, port))
+        return await super().connect_tcp(host, port, *args, **kwargs)
+
+
+def resolving(monkeypatch, answers):
+    """Make name resolution return the next list of addresses on each call"""
+    calls = iter(answers)
+
+    async def getaddrinfo(self, host, port, **kwargs):
+        return [(2, 1, 6, "", (address, port)) for address in next(calls)]
+
+    monkeypatch.setattr(asyncio.BaseEventLoop, "getaddrinfo", getaddrinfo)
+
+
+def test_connects_to_checked_address(monkeypatch):
+    # A second lookup would rebind the name to loopback, the connection must use the first answer
+    resolving(monkeypatch, [["93.184.216.34"], ["127.0.0.1"]])
+    inner = RecordingBackend()
+    backend = PublicNetworkBackend(inner)
+
+    async def connect():
+        await backend.connect_tcp("rebind.example", 80)
+
+    asyncio.run(connect())
+    assert inner.connected == [("93.184.216.34", 80)]
+
+
+def test_refuses_private_addresses(monkeypatch):
+    resolving(monkeypatch, [["93.184.216.34", "10.0.0.1"]])
+    backend = PublicNetworkBackend(RecordingBackend())
+    with pytest.raises(FetchError):
+        asyncio.run(backend.connect_tcp("mixed.example", 80))
+    with pytest.raises(FetchError):
+        asyncio.run(backend.connect_tcp("127.0.0.1", 80))
+
+
+def test_fetcher_refuses_loopback():
+    async def fetch():
+        fetcher = PageFetcher()
+        try:
+            return await fetcher.fetch("http://127.0.0.1:9/")
+        finally:
+            await fetcher.client.aclose()
+
+    with pytest.raises(FetchError, match="non-public"):
+        asyncio.run(fetch())
+
+
+def test_fetcher_transport_pins_public_addresses(monkeypatch):
+    resolving(monkeypatch, [["93.184.216.34"], ["127.0.0.1"]])
+    body = b"<html><title>Hi</title><p>Hello</p></html>"
+    inner = RecordingBackend([b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nContent-Length: %d\r\n\r\n" % len(body), body])
+
+    async def fetch():
+        fetcher = PageFetcher()
+        assert isinstance(fetcher.transport, PublicTransport)
+        fetcher.transport.pool = httpcore.AsyncConnectionPool(network_backend=PublicNetworkBackend(inner))
+        try:
+            return await fetcher.fetch("http://rebind.example/")
+        finally:
+            await fetcher.client.aclose()
+
+    page = asyncio.run(fetch())
+    assert page.title == "Hi"
+    assert inner.connected == [("93.184.216.34", 80)]
+
+
+def test_fetcher_transport_without_checks():
+    fetcher = PageFetcher(allow_private=True)
+    assert isinstance(fetcher.transport, httpx.AsyncHTTPTransport)
+
+
+def test_fetch_disabled_by_default():
+    assert Settings.model_fields["fetch_enabled"].default is False
@@ -0,0 +1,207 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.ddgs import OverloadedError, TextSearchItem
+from app.ddgs.jobs import JobRunner, JobStore
+from app.keystore import KeyStore
+from app.main import app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "warmup_enabled", False)
+    monkeypatch.setattr("app.auth.key_store", KeyStore([]))
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.mark.parametrize(("method", "path"), [("GET", "/jobs"), ("POST", "/jobs"), ("GET", "/jobs/abc"), ("GET", "/jobs/abc/results"), ("DELETE", "/jobs/abc")])
+def test_jobs_refused_without_api_keys(client, method, path):
+    response = client.request(method, path, json={"queries": ["python"]} if method == "POST" else None)
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Search jobs need API keys to be configured"
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("app.ddgs.jobs.time.time", clock)
+    return clock
+
+
+def run_store(tmp_path, func, **kwargs):
+    """Run `func` against a job store on a file in `tmp_path`, closing it afterwards"""
+
+    async def main():
+        store = JobStore(str(tmp_path / "jobs.sqlite3"), **kwargs)
+        try:
+            return await func(store)
+        finally:
+            await store.close()
+
+    return asyncio.run(main())
+
+
+def searches(*queries: str) -> list[tuple[str, dict]]:
+    return [("text", {"query": query}) for query in queries]
+
+
+def test_claims_go_round_the_jobs(tmp_path, clock):
+    async def check(store):
+        first = await store.create("key", None, searches("a", "b"))
+        second = await store.create("key", None, searches("c", "d"))
+        claimed = [await store.claim() for _ in range(5)]
+        assert claimed[-1] is None
+        return [(task.job_id, task.params["query"]) for task in claimed[:-1]], first.id, second.id
+
+    claimed, first, second = run_store(tmp_path, check)
+    assert claimed == [(first, "a"), (second, "c"), (first, "b"), (second, "d")]
+
+
+def test_expired_lease_is_claimed_again_after_a_restart(tmp_path, clock):
+    async def submit(store):
+        job = await store.create("key", {"rate": 5}, searches("python"))
+        task = await store.claim()
+        assert task.limits == {"rate": 5}
+        assert await store.claim() is None
+        return job.id
+
+    job_id = run_store(tmp_path, submit, lease=60)
+
+    async def resume(store):
+        clock.now += 30
+        assert await store.claim() is None
+        clock.now += 31
+        task = await store.claim()
+        assert task.job_id == job_id
+        await store.finish(task, [TextSearchItem(title="Python", href="https://python.org", body="Python language")])
+        # A worker that lost its lease finishing the same search does not count it twice
+        await store.finish(task, [])
+        return await store.results(job_id, "key")
+
+    job, results = run_store(tmp_path, resume, lease=60)
+    assert (job.status, job.finished, job.failed, job.finished_at) == ("done", 1, 0, clock.now)
+    assert [(result.query, [item.href for item in result.results]) for result in results] == [("python", ["https://python.org"])]
+
+
+def test_results_page_in_finish_order(tmp_path, clock):
+    async def check(store):
+        job = await store.create("key", None, searches("a", "b", "c"))
+        tasks = [await store.claim() for _ in range(3)]
+        for task in reversed(tasks):
+            await store.finish(task, error="failed" if task.seq == 1 else None)
+        _, page = await store.results(job.id, "key", after=1, limit=1)
+        status, _ = await store.results(job.id, "key")
+        assert await store.results(job.id, "other") == (None, [])
+        return status, page
+
+    status, page = run_store(tmp_path, check)
+    assert (status.finished, status.failed) == (3, 1)
+    assert [(result.index, result.error) for result in page] == [(1, "failed")]
+
+
+def test_release_holds_back_the_job(tmp_path, clock):
+    async def check(store):
+        await store.create("key", None, searches("a", "b"))
+        task = await store.claim()
+        await store.release(task, 10, attempt=False, hold_job=True)
+        assert await store.claim() is None
+        clock.now += 10
+        return await store.claim()
+
+    task = run_store(tmp_path, check)
+    assert (task.params["query"], task.attempts) == ("a", 0)
+
+
+class FakeTenants:
+    def check(self, tenant, overrides=None):
+        pass
+
+
+class FakeDDGS:
+    tenants = FakeTenants()
+
+    def __init__(self, text):
+        self.text = text
+
+
+def test_runner_retries_then_fails(tmp_path, clock):
+    async def text(query, **kwargs):
+        raise RuntimeError("upstream down")
+
+    async def check(store):
+        runner = JobRunner(FakeDDGS(text), store, max_attempts=2)
+        job = await store.create("key", None, searches("python"))
+        await runner._run(await store.claim())
+        assert await store.claim() is None
+        clock.now += 1
+        task = await store.claim()
+        assert task.attempts == 1
+        await runner._run(task)
+        return await store.get(job.id, "key")
+
+    job = run_store(tmp_path, check)
+    assert (job.status, job.failed) == ("done", 1)
+
+
+def test_runner_throttled_search_keeps_its_attempts(tmp_path, clock):
+    async def text(query, **kwargs):
+        raise OverloadedError("Rate limit exceeded", retry_after=5)
+
+    async def check(store):
+        runner = JobRunner(FakeDDGS(text), store, max_attempts=1)
+        await store.create("key", None, searches("python"))
+        await runner._run(await store.claim())
+        clock.now += 5
+        return await store.claim()
+
+    assert run_store(tmp_path, check).attempts == 0
+
+
+def test_runner_close_leaves_the_search_for_the_next_start(tmp_path):
+    async def first_run():
+        started = asyncio.Event()
+
+        async def text(query, **kwargs):
+            started.set()
+            await asyncio.Event().wait()
+
+        store = JobStore(str(tmp_path / "jobs.sqlite3"))
+        runner = JobRunner(FakeDDGS(text), store, concurrency=1)
+        runner.start()
+        job = await runner.submit("key", None, searches("python"))
+        await asyncio.wait_for(started.wait(), 5)
+        await runner.close()
+        return job.id
+
+    job_id = asyncio.run(first_run())
+
+    async def second_run():
+        async def text(query, **kwargs):
+            return [TextSearchItem(title=query, href="https://example.com", body="body")]
+
+        store = JobStore(str(tmp_path / "jobs.sqlite3"))
+        runner = JobRunner(FakeDDGS(text), store, concurrency=1)
+        runner.poll_interval = 0.01
+        runner.start()
+        try:
+            async with asyncio.timeout(5):
+                while (job := await store.get(job_id, "key")).status != "done":
+                    await asyncio.sleep(0.01)
+            return job
+        finally:
+            await runner.close()
+
+    job = asyncio.run(second_run())
+    assert (job.finished, job.failed) == (1, 0)
@@ -0,0 +1,58 @@
+import hashlib
+import json
+import os
+
+from app.keystore import KeyStore
+
+
+def write_keys(path, entries, mtime_ns: int):
+    path.write_text(json.dumps({"keys": entries}), encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_static_keys_and_settings_limits():
+    store = KeyStore(["secret"], limits={"secret": {"rate": 5}})
+    key = store.lookup("secret")
+    assert key is not None
+    assert key.limits == {"rate": 5}
+    assert store.lookup("other") is None
+    assert store.enabled
+
+
+def test_file_keys_are_reloaded_when_the_file_changes(tmp_path):
+    path = tmp_path / "keys.json"
+    write_keys(path, [{"key": "one", "tenant": "acme", "scopes": ["admin"]}], 1_000_000_000)
+    store = KeyStore(path=str(path), reload_interval=0)
+    key = store.lookup("one")
+    assert (key.tenant, key.scopes) == ("acme", ("admin",))
+
+    digest = hashlib.sha256(b"two").hexdigest()
+    write_keys(path, [{"sha256": digest, "limits": {"quota": 10}}], 2_000_000_000)
+    assert store.lookup("one") is None
+    key = store.lookup("two")
+    assert key.limits == {"quota": 10}
+    # Without a tenant, a key is its own tenant named without revealing it
+    assert key.tenant == digest[:12]
+    assert store.version == 2
+
+
+def test_unreadable_file_keeps_the_current_keys(tmp_path):
+    path = tmp_path / "keys.json"
+    write_keys(path, ["one"], 1_000_000_000)
+    store = KeyStore(["static"], path=str(path), reload_interval=0)
+    path.write_text("{not json", encoding="utf-8")
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+    assert store.lookup("one") is not None
+    assert store.lookup("static") is not None
+    os.remove(path)
+    assert store.lookup("one") is not None
+
+
+def test_reload_checks_wait_for_the_interval(tmp_path):
+    path = tmp_path / "keys.json"
+    write_keys(path, ["one"], 1_000_000_000)
+    store = KeyStore(path=str(path), reload_interval=3600)
+    write_keys(path, ["two"], 2_000_000_000)
+    assert store.lookup("two") is None
+    assert store.reload()
+    assert store.lookup("two") is not None
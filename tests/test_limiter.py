@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from app.ddgs.limiter import AdaptiveLimiter, AdmissionController, CircuitBreaker, CircuitOpenError, QueueFullError
+
+
+def test_limit_grows_additively_on_success():
+    limiter = AdaptiveLimiter(initial=10, max_limit=11)
+    for _ in range(10):
+        limiter.on_success(0.1)
+    assert limiter.limit == pytest.approx(11, abs=0.05)
+    for _ in range(100):
+        limiter.on_success(0.1)
+    assert limiter.limit == 11
+
+
+def test_limit_halves_once_per_window_of_failures():
+    limiter = AdaptiveLimiter(initial=10, min_limit=2)
+    for _ in range(10):
+        limiter.on_failure()
+    assert limiter.limit == 5
+    for _ in range(4):
+        limiter.on_failure()
+    assert limiter.limit == 5
+    for _ in range(100):
+        limiter.on_failure()
+    assert limiter.limit == 2
+
+
+def test_limit_shrinks_when_latency_rises():
+    limiter = AdaptiveLimiter(initial=10, latency_tolerance=2.0)
+    for _ in range(20):
+        limiter.on_success(0.1)
+    grown = limiter.limit
+    for _ in range(20):
+        limiter.on_success(1.0)
+    assert limiter.limit < grown
+
+
+def test_acquire_sheds_when_queue_is_full():
+    async def run():
+        limiter = AdaptiveLimiter(initial=1, max_queue=1, queue_timeout=5)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await limiter.acquire()
+        limiter.release()
+        await waiter
+        assert limiter.inflight == 1
+
+    asyncio.run(run())
+
+
+def test_acquire_sheds_after_queue_timeout():
+    async def run():
+        limiter = AdaptiveLimiter(initial=1, queue_timeout=0.01)
+        await limiter.acquire()
+        with pytest.raises(QueueFullError):
+            await limiter.acquire()
+        # The timed out waiter left the queue, so a freed slot is taken right away
+        limiter.release()
+        await asyncio.wait_for(limiter.acquire(), 0.1)
+        assert limiter.inflight == 1
+
+    asyncio.run(run())
+
+
+def test_breaker_opens_on_failure_rate_and_probes_after_reset(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.ddgs.limiter.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_rate=0.5, window=10, min_requests=4, reset_timeout=30)
+    for _ in range(2):
+        breaker.on_success()
+    for _ in range(2):
+        breaker.on_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    now[0] += 31
+    breaker.allow()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.on_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.ddgs.limiter.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(min_requests=1, reset_timeout=30)
+    breaker.on_failure()
+    now[0] += 31
+    breaker.allow()
+    breaker.on_failure()
+    assert breaker.state == "open"
+
+
+def test_admission_counts_shed_searches():
+    async def run():
+        admission = AdmissionController(breaker_options={"min_requests": 1})
+        with pytest.raises(RuntimeError):
+            async with admission.admit("text:bing"):
+                raise RuntimeError("upstream failed")
+        with pytest.raises(CircuitOpenError):
+            async with admission.admit("text:bing"):
+                pass
+        return admission.stats()
+
+    stats = asyncio.run(run())
+    assert stats["shed"] == 1
+    assert stats["engines"]["text:bing"]["circuit"] == "open"
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+from app.ddgs import LocalIndex, LocalIndexError, TextSearchItem
+from app.ddgs.local_index import match_expression
+
+TEXTS = [
+    ("Python asyncio tutorial", "Learn asyncio event loops in Python"),
+    ("Python packaging guide", "Build and publish Python packages"),
+    ("Rust async book", "Futures and executors in Rust"),
+]
+
+
+def items(texts=TEXTS) -> list[TextSearchItem]:
+    return [TextSearchItem(title=title, href=f"https://example.com/{i}", body=body) for i, (title, body) in enumerate(texts)]
+
+
+def run(tmp_path, func, **kwargs):
+    """Run `func` against a fresh index, closing it afterwards"""
+
+    async def main():
+        index = LocalIndex(str(tmp_path / "index.sqlite3"), **kwargs)
+        try:
+            return await func(index)
+        finally:
+            await index.close()
+
+    return asyncio.run(main())
+
+
+async def harvest(index: LocalIndex, params: dict, results: list[TextSearchItem] | None = None):
+    """Index results and wait until they are written"""
+    index.harvest("text", params, items() if results is None else results)
+    await index.recount()
+
+
+def test_match_expression():
+    assert match_expression("Python async-io") == '"python" "async" "io"'
+    assert match_expression("python rust", any_term=True) == '"python" OR "rust"'
+    assert match_expression("python -java site:example.com") == '"python"'
+    assert match_expression("-java site:example.com") is None
+
+
+def test_fallback_matches_any_word(tmp_path):
+    async def check(index):
+        await harvest(index, {})
+        results = await index.fallback("text", "python executors", {})
+        # Results with every word rank first, there are none here so any word matches
+        assert {item.href for item in results} == {"https://example.com/0", "https://example.com/1", "https://example.com/2"}
+        assert await index.fallback("text", "golang", {}) == []
+        assert await index.fallback("images", "python", {}) == []
+        return index.served
+
+    assert run(tmp_path, check) == {"fast": 0, "fallback": 1}
+
+
+def test_fallback_ranks_title_matches_first(tmp_path):
+    async def check(index):
+        await harvest(index, {}, items([("Notes", "asyncio mentioned in passing"), ("Asyncio internals", "Event loop design")]))
+        return [item.title for item in await index.fallback("text", "asyncio", {})]
+
+    assert run(tmp_path, check) == ["Asyncio internals", "Notes"]
+
+
+def test_fallback_respects_region_and_safesearch(tmp_path):
+    async def check(index):
+        await harvest(index, {"region": "de-de", "safesearch": "off"})
+        assert await index.fallback("text", "python", {"region": "us-en", "safesearch": "off"}) == []
+        # Results found with safe search off are not served to stricter searches
+        assert await index.fallback("text", "python", {"region": "de-de", "safesearch": "moderate"}) == []
+        assert len(await index.fallback("text", "python", {"region": "de-de", "safesearch": "off"})) == 2
+        await harvest(index, {"region": "de-de", "safesearch": "on"})
+        assert len(await index.fallback("text", "python", {"region": "de-de", "safesearch": "moderate"})) == 2
+
+    run(tmp_path, check)
+
+
+def test_fallback_age(tmp_path, monkeypatch):
+    time_now = time.time()
+
+    async def check(index):
+        monkeypatch.setattr("app.ddgs.local_index.time.time", lambda: time_now - 120)
+        await harvest(index, {})
+        monkeypatch.setattr("app.ddgs.local_index.time.time", lambda: time_now)
+        return await index.fallback("text", "python", {})
+
+    assert run(tmp_path, check, fallback_ages={"text": 60}) == []
+    assert len(run(tmp_path, check, fallback_ages={"text": 600})) == 2
+
+
+def test_fallback_pages(tmp_path):
+    async def check(index):
+        await harvest(index, {})
+        first = await index.fallback("text", "python", {"max_results": 1})
+        second = await index.fallback("text", "python", {"max_results": 1, "page": 2})
+        return first, second
+
+    first, second = run(tmp_path, check)
+    assert len(first) == len(second) == 1
+    assert first[0].href != second[0].href
+
+
+def test_fallback_errors_serve_nothing(tmp_path, monkeypatch):
+    async def search(*args, **kwargs):
+        raise LocalIndexError("Local index error: disk I/O error")
+
+    async def check(index):
+        await harvest(index, {})
+        monkeypatch.setattr(index, "search", search)
+        return await index.fallback("text", "python", {}), index.errors
+
+    assert run(tmp_path, check) == ([], 1)
+
+
+def test_lookup_needs_a_full_fresh_set(tmp_path):
+    async def check(index):
+        await harvest(index, {})
+        assert await index.lookup("text", "python", {"max_results": 3}) is None
+        assert len(await index.lookup("text", "python", {"max_results": 2})) == 2
+        return index.served
+
+    assert run(tmp_path, check, fresh_ages={"text": 60}) == {"fast": 1, "fallback": 0}
+    assert run(tmp_path, lambda index: index.lookup("text", "python", {"max_results": 2})) is None
+
+
+def test_harvest_drops_when_writes_back_up(tmp_path):
+    async def check(index):
+        index.max_pending = 0
+        await harvest(index, {})
+        return index.dropped, index.harvested
+
+    assert run(tmp_path, check) == (1, 0)
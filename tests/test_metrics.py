@@ -0,0 +1,37 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.ddgs import metrics
+
+
+def test_submit_queued_counts_waiting_tasks():
+    executor = ThreadPoolExecutor(max_workers=1, initializer=metrics.track_thread_started)
+    started = metrics.started_threads
+    running_started, release = threading.Event(), threading.Event()
+
+    def block() -> bool:
+        running_started.set()
+        return release.wait()
+
+    try:
+        running = metrics.submit_queued(executor, block)
+        assert running_started.wait(timeout=5)
+        waiting = metrics.submit_queued(executor, lambda: "done")
+        cancelled = metrics.submit_queued(executor, lambda: "never")
+        assert metrics.queued_tasks == 2
+        assert cancelled.cancel()
+        assert metrics.queued_tasks == 1
+        release.set()
+        assert running.result(timeout=5)
+        assert waiting.result(timeout=5) == "done"
+        assert metrics.queued_tasks == 0
+        assert metrics.started_threads == started + 1
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_cumulative_metrics_are_counters():
+    for metric in (metrics.cache_events, metrics.admission_shed, metrics.pool_evictions, metrics.tenant_throttled, metrics.spans_exported):
+        assert metric.type == "counter"
+        assert metric.name.endswith("_total")
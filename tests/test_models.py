@@ -0,0 +1,36 @@
+import pytest
+from pydantic import TypeAdapter, ValidationError
+
+from app.routes.models import BatchItem, ImagesSearchRequest, TextSearchRequest
+
+
+def test_image_layout_is_a_search_parameter():
+    request = ImagesSearchRequest(query="sunset", layout="Wide", output_layout="table")
+    params = request.to_dict({})
+    assert params["layout"] == "Wide"
+    assert "output_layout" not in params
+    assert request.compact_format(4).layout == "table"
+
+
+def test_images_batch_item_accepts_image_layout():
+    item = TypeAdapter(BatchItem).validate_python({"category": "images", "query": "sunset", "layout": "Wide"})
+    assert item.to_dict({}) == {"query": "sunset", "layout": "Wide"}
+
+
+def test_output_layout_is_not_a_search_parameter():
+    request = TextSearchRequest(query="python", output_layout="table", max_chars=500)
+    assert request.to_dict({}) == {"query": "python"}
+    fmt = request.compact_format(4)
+    assert (fmt.layout, fmt.max_chars) == ("table", 500)
+
+
+@pytest.mark.parametrize("option", [{"paginate": True}, {"cursor": "abc"}, {"max_chars": 500}, {"max_tokens": 100}, {"output_layout": "table"}])
+def test_batch_item_rejects_page_and_compact_options(option):
+    with pytest.raises(ValidationError, match="not supported in batch sub-requests"):
+        TypeAdapter(BatchItem).validate_python({"category": "text", "query": "python", **option})
+
+
+def test_batch_item_accepts_fields():
+    item = TypeAdapter(BatchItem).validate_python({"category": "text", "query": "python", "fields": "title,href"})
+    assert item.fields == ["title", "href"]
+    assert item.to_dict({}) == {"query": "python"}
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from ddgs.exceptions import DDGSException
+
+from app.config import settings
+from app.ddgs import TextSearchItem
+from app.ddgs.ddgs import pagination_secret
+from app.ddgs.pagination import UPSTREAM_PAGE_SIZE, InvalidCursorError, Paginator, decode_cursor, encode_cursor
+
+SECRET = b"secret"
+
+
+class FakeDDGS:
+    """Upstream with `pages` engine pages of `UPSTREAM_PAGE_SIZE` results each"""
+
+    def __init__(self, pages: int):
+        self.pages = pages
+        self.calls: list[tuple[int, int]] = []
+
+    async def text(self, query: str, max_results: int, page: int, **kwargs) -> list[TextSearchItem]:
+        self.calls.append((max_results, page))
+        if page > self.pages:
+            raise DDGSException("No results found.")
+        start = (page - 1) * UPSTREAM_PAGE_SIZE
+        return [TextSearchItem(title=f"result {i}", href=f"https://example.com/{i}", body=f"body {i}") for i in range(start, start + UPSTREAM_PAGE_SIZE)]
+
+
+def walk(paginator: Paginator, size: int) -> list[list[str]]:
+    async def run() -> list[list[str]]:
+        pages, cursor = [], None
+        while True:
+            items, cursor = await paginator.page("text", "python", {"max_results": size}, cursor)
+            pages.append([item.href for item in items])
+            if cursor is None:
+                return pages
+
+    return asyncio.run(run())
+
+
+def test_pages_request_engine_pages():
+    ddgs = FakeDDGS(pages=3)
+    pages = walk(Paginator(ddgs, {"text": "href"}, SECRET, window=20), size=15)
+    assert [len(page) for page in pages] == [15, 15]
+    assert [href for page in pages for href in page] == [f"https://example.com/{i}" for i in range(30)]
+    assert {max_results for max_results, _ in ddgs.calls} == {UPSTREAM_PAGE_SIZE}
+    assert sorted(page for _, page in ddgs.calls) == [1, 2, 3, 4]
+
+
+def test_cursor_of_another_category_is_rejected():
+    paginator = Paginator(FakeDDGS(pages=2), {"text": "href", "news": "url"}, SECRET, window=10)
+    _, cursor = asyncio.run(paginator.page("text", "python", {"max_results": 5}))
+    with pytest.raises(InvalidCursorError):
+        asyncio.run(paginator.page("news", "python", {}, cursor))
+
+
+def test_secret_required_with_several_workers(monkeypatch):
+    monkeypatch.setattr(settings, "pagination_secret", "")
+    monkeypatch.setattr(settings, "web_concurrency", 2)
+    with pytest.raises(ValueError, match="PAGINATION_SECRET"):
+        pagination_secret()
+    monkeypatch.setattr(settings, "pagination_secret", "shared")
+    assert pagination_secret() == b"shared"
+
+
+def test_cursor_round_trips():
+    cursor = encode_cursor("text", "python", {"region": "de-de"}, 20, 10, SECRET)
+    assert decode_cursor(cursor, SECRET) == ("text", "python", {"region": "de-de"}, 20, 10)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        encode_cursor("text", "python", {}, 20, 10, b"other secret"),
+        encode_cursor("text", "python", {}, 20, 10, SECRET).replace(".", "x."),
+        "not a cursor",
+        "",
+    ],
+)
+def test_forged_or_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, SECRET)
+
+
+def test_tampered_payload_is_rejected():
+    payload, _ = encode_cursor("text", "python", {}, 20, 10, SECRET).split(".")
+    _, other_signature = encode_cursor("text", "python", {}, 40, 10, SECRET).split(".")
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(f"{payload}.{other_signature}", SECRET)
+
+
+def test_walking_pages_reuses_the_buffer():
+    ddgs = FakeDDGS(pages=2)
+    paginator = Paginator(ddgs, {"text": "href"}, SECRET, window=20)
+    pages = walk(paginator, size=5)
+    # Results end on a window boundary, so only the next window tells the last page apart
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 0]
+    assert len({href for page in pages for href in page}) == 20
+    # One window of two engine pages for the first four pages, then one finding the search exhausted
+    assert sorted(page for _, page in ddgs.calls) == [1, 2, 3, 4]
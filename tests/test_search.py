@@ -0,0 +1,85 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.ddgs import OverloadedError, TextSearchItem, get_ddgs
+from app.ddgs.deadline import DeadlineExceededError
+from app.main import app
+
+
+def fake_results(query: str, max_results: int | None = None, **kwargs) -> list[TextSearchItem]:
+    return [TextSearchItem(title=f"{query} {i}", href=f"https://example.com/{i}", body="body") for i in range(max_results or 3)]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "warmup_enabled", False)
+    monkeypatch.setattr(settings, "api_keys", [])
+    with TestClient(app) as client:
+        ddgs = get_ddgs()
+
+        async def text(query: str, **kwargs):
+            return fake_results(query, **kwargs)
+
+        async def stream(category: str, query: str, **kwargs):
+            for item in fake_results(query, **kwargs):
+                yield item
+
+        monkeypatch.setattr(ddgs, "text", text)
+        monkeypatch.setattr(ddgs, "stream", stream)
+        yield client
+
+
+def test_get_search(client):
+    response = client.get("/search", params={"query": "python", "max_results": 2})
+    assert response.status_code == 200
+    assert [item["title"] for item in response.json()] == ["python 0", "python 1"]
+
+
+def test_get_search_fields(client):
+    response = client.get("/search", params={"query": "python", "max_results": 2, "fields": "title,href"})
+    assert response.status_code == 200
+    assert response.json()[0] == {"title": "python 0", "href": "https://example.com/0"}
+
+
+def test_get_search_stream(client):
+    response = client.get("/search", params={"query": "python", "max_results": 2, "stream": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["title"] for line in response.text.splitlines()] == ["python 0", "python 1"]
+
+
+def test_get_search_invalid_stream(client):
+    response = client.get("/search", params={"query": "python", "stream": "xml"})
+    assert response.status_code == 422
+
+
+def test_get_search_output_layout_table(client):
+    response = client.get("/search", params={"query": "python", "max_results": 2, "fields": "title,href", "output_layout": "table"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.text.splitlines() == ["title\thref", "python 0\thttps://example.com/0", "python 1\thttps://example.com/1"]
+
+
+def test_no_server_timing_by_default(client):
+    response = client.get("/search", params={"query": "python", "max_results": 1})
+    assert response.status_code == 200
+    assert "server-timing" not in response.headers
+
+
+def test_batch_rejects_compact_options(client):
+    response = client.post("/search/batch", json={"requests": [{"category": "text", "query": "python", "max_chars": 100}]})
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize(("error", "status_code", "retry_after"), [(DeadlineExceededError(), 504, None), (OverloadedError("Engine overloaded", retry_after=1.5), 503, "2")])
+def test_overload_and_deadline_propagate(client, monkeypatch, error, status_code, retry_after):
+    async def images(**kwargs):
+        raise error
+
+    monkeypatch.setattr(get_ddgs(), "images", images)
+    response = client.post("/search/images", json={"query": "sunset"})
+    assert response.status_code == status_code
+    assert response.headers.get("retry-after") == retry_after
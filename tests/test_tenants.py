@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from app.ddgs.tenants import FairScheduler, Quota, RateLimitedError, TenantLimiter, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.ddgs.tenants.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_allows_burst_then_refills(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert bucket.take() == 0
+
+
+def test_quota_resets_with_its_window(clock):
+    quota = Quota(limit=2, period=60)
+    assert quota.take() == quota.take() == 0
+    clock[0] += 10
+    assert quota.take() == pytest.approx(50)
+    clock[0] += 50
+    assert quota.take() == 0
+
+
+def test_limiter_throttles_per_tenant(clock):
+    limiter = TenantLimiter(rate=1, burst=1)
+    limiter.check("a")
+    with pytest.raises(RateLimitedError):
+        limiter.check("a")
+    limiter.check("b")
+    assert limiter.stats()["throttled"] == {"a": 1}
+
+
+def test_keys_with_different_limits_count_separately(clock):
+    limiter = TenantLimiter(quota=1)
+    limiter.check("a", {"quota": 1})
+    limiter.check("a", {"quota": 2})
+    limiter.check("a", {"quota": 2})
+    with pytest.raises(RateLimitedError):
+        limiter.check("a", {"quota": 1})
+    with pytest.raises(RateLimitedError):
+        limiter.check("a", {"quota": 2})
+    assert limiter.stats()["quota_remaining"] == {"a": 0}
+
+
+def test_rejected_quota_gives_back_the_rate_token(clock):
+    limiter = TenantLimiter(rate=1, burst=1, quota=1)
+    limiter.check("a")
+    clock[0] += 1
+    with pytest.raises(RateLimitedError, match="Quota"):
+        limiter.check("a")
+    with pytest.raises(RateLimitedError, match="Quota"):
+        limiter.check("a")
+
+
+def serve_order(weights: dict[str, float], queued: list[str]) -> list[str]:
+    async def run() -> list[str]:
+        limiter = TenantLimiter()
+        for tenant, weight in weights.items():
+            limiter.check(tenant, {"weight": weight})
+        scheduler = FairScheduler(max_concurrency=1, weights=limiter)
+        order: list[str] = []
+
+        async def search(tenant: str):
+            async with scheduler.slot(tenant):
+                order.append(tenant)
+
+        await scheduler.acquire("holder")
+        tasks = [asyncio.create_task(search(tenant)) for tenant in queued]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    return asyncio.run(run())
+
+
+def test_scheduler_takes_turns_between_tenants():
+    assert serve_order({}, ["a", "a", "a", "a", "b", "b"]) == ["a", "b", "a", "b", "a", "a"]
+
+
+def test_scheduler_serves_by_weight():
+    assert serve_order({"a": 2}, ["a", "a", "a", "a", "b", "b"]) == ["a", "a", "b", "a", "a", "b"]
+
+
+def test_scheduler_rejects_a_full_tenant_queue():
+    async def run():
+        scheduler = FairScheduler(max_concurrency=1, max_queue=1)
+        await scheduler.acquire("a")
+        waiting = asyncio.create_task(scheduler.acquire("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimitedError):
+            await scheduler.acquire("a")
+        # Another tenant still gets a place in line
+        other = asyncio.create_task(scheduler.acquire("b"))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["tenants"] == {"a": 1, "b": 1}
+        for task in (waiting, other):
+            task.cancel()
+
+    asyncio.run(run())